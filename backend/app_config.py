@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,5 +8,66 @@ DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+asyncpg://postgres:postgres
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 X_LITELLM_API_KEY = os.getenv("X_LITELLM_API_KEY", "")
 X_LITELLM_API_URL = os.getenv("X_LITELLM_API_URL", "")
+# LiteLLM client (services/llm_client.py): pooled connections, calls in flight, seconds, retries
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "256"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Cache of /chat/advice and /chat/motivation answers: "memory", "sqlite" (shared by workers) or "none"
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(tempfile.gettempdir(), "zaman_llm_cache.sqlite3"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(6 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+# Speech-to-text: WAV preprocessing (mono, resampling, silence trimming) and parallel segments
+SPEECH_PREPROCESS = os.getenv("SPEECH_PREPROCESS", "true").lower() in ("1", "true", "yes")
+SPEECH_SAMPLE_RATE = int(os.getenv("SPEECH_SAMPLE_RATE", "16000"))
+SPEECH_SILENCE_DBFS = float(os.getenv("SPEECH_SILENCE_DBFS", "-40"))
+SPEECH_SEGMENT_SECONDS = float(os.getenv("SPEECH_SEGMENT_SECONDS", "120"))
+SPEECH_MAX_PARALLEL = int(os.getenv("SPEECH_MAX_PARALLEL", "4"))
+# Nearest-neighbour index used by /similarity/find-similar: "lsh" or "exact"
+SIMILARITY_INDEX = os.getenv("SIMILARITY_INDEX", "lsh")
+# Estimate feature normalization stats from a reservoir sample of this size (0 = exact full scan)
+FEATURE_STATS_SAMPLE_SIZE = int(os.getenv("FEATURE_STATS_SAMPLE_SIZE", "0"))
+# Memory-mapped feature matrix shared by the workers, rewritten at most every MAX_AGE seconds
+FEATURE_SNAPSHOT_DIR = os.getenv("FEATURE_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "zaman_feature_snapshots"))
+FEATURE_SNAPSHOT_MAX_AGE = float(os.getenv("FEATURE_SNAPSHOT_MAX_AGE", "60"))
+# Background refresh of the feature store every INTERVAL seconds (0 = never): all dirty and new users, plus
+# at most BATCH of the vectors older than a day, oldest first
+FEATURE_REFRESH_INTERVAL = float(os.getenv("FEATURE_REFRESH_INTERVAL", "60"))
+FEATURE_REFRESH_BATCH = int(os.getenv("FEATURE_REFRESH_BATCH", "1000"))
+# Vectors are stamped before their transaction commits, so incremental reads of the feature store re-read
+# the vectors computed up to this many seconds before the last watermark (longer than any refresh transaction)
+FEATURE_SYNC_OVERLAP = float(os.getenv("FEATURE_SYNC_OVERLAP", "300"))
+# bcrypt work factor for new hashes; stored hashes with another cost are rehashed on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
 ALGORITHM = "HS256"
+# get_current_user caches decoded tokens and users rows for this long; strict mode reads the DB every time
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+AUTH_STRICT = os.getenv("AUTH_STRICT", "false").lower() in ("1", "true", "yes")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# /metrics; with several workers each one writes its samples to METRICS_MULTIPROC_DIR and /metrics merges them
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# Per-request SQL statistics (services/sql_debug.py): "off", "warn" (log requests issuing more than
+# SQL_REPEAT_LIMIT statements of one shape, add an X-SQL-Stats header) or "raise" (fail them, for tests)
+SQL_DEBUG = os.getenv("SQL_DEBUG", "off").lower()
+SQL_REPEAT_LIMIT = int(os.getenv("SQL_REPEAT_LIMIT", "10"))
+# Log every statement (SQLAlchemy echo); synchronous and slow, for local debugging only
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+# Sampling profiler (services/profiler.py): requests with "X-Profile: <PROFILE_TOKEN>" and a
+# PROFILE_SAMPLE_RATE share of all requests are profiled into PROFILE_DIR ("speedscope", "pstats" or "both")
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "zaman_profiles"))
+PROFILE_FORMAT = os.getenv("PROFILE_FORMAT", "speedscope")
+# Ledger (services/ledger.py): every LEDGER_SNAPSHOT_INTERVAL seconds (0 = never) snapshot the balances of
+# accounts with at least LEDGER_SNAPSHOT_MIN_POSTINGS new postings older than LEDGER_SETTLE_SECONDS, and
+# reconcile the cached balance columns of the accounts posted to since the previous run
+LEDGER_SNAPSHOT_INTERVAL = float(os.getenv("LEDGER_SNAPSHOT_INTERVAL", "300"))
+LEDGER_SNAPSHOT_MIN_POSTINGS = int(os.getenv("LEDGER_SNAPSHOT_MIN_POSTINGS", "50"))
+LEDGER_SETTLE_SECONDS = float(os.getenv("LEDGER_SETTLE_SECONDS", "60"))
@@ -1,16 +1,23 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from jose import jwt
 import bcrypt
-from app_config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from app_config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS
 from fastapi.security import OAuth2PasswordBearer
 
 # The URL where clients obtain the token (matches your /auth/login endpoint)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def hash_password(password: str) -> str:
+# bcrypt releases the GIL, so a small dedicated thread pool hashes in parallel without
+# blocking the event loop; its size bounds the CPU spent on password hashing.
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
     """Hash a password using bcrypt."""
     # bcrypt requires bytes input and outputs bytes, so decode to str for storage
-    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds))
     return hashed.decode("utf-8")
 
 
@@ -19,6 +26,31 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
 
 
+def needs_rehash(hashed_password: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    """True when the hash was made with a different work factor than the configured one."""
+    try:
+        return int(hashed_password.split("$")[2]) != rounds
+    except (IndexError, ValueError):
+        return True
+
+
+async def hash_password_async(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    """hash_password on the hashing pool."""
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, hash_password, password, rounds)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the hashing pool."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_pool, verify_password, plain_password, hashed_password
+    )
+
+
+def user_token_claims(user) -> dict:
+    """Claims that let get_current_user authenticate without reading the users row."""
+    return {"sub": user.iin, "uid": user.id, "email": user.email}
+
+
 def create_access_token(data: dict) -> str:
     """Create a JWT access token."""
     to_encode = data.copy()
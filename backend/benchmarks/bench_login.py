@@ -0,0 +1,62 @@
+"""
+Login hashing throughput: bcrypt on the event loop (old /auth/login) vs the hashing pool.
+
+    cd backend && python -m benchmarks.bench_login --rounds 12 --logins 64
+
+For each mode, --logins concurrent password checks run on one event loop
+while a heartbeat task measures how long the loop was stalled.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_config import PASSWORD_HASH_WORKERS  # noqa: E402
+from auth import hash_password, verify_password, verify_password_async  # noqa: E402
+
+
+async def _heartbeat(stop: asyncio.Event, interval: float = 0.005) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def _run(check, hashed: str, logins: int):
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(stop))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(check("secret", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, await heartbeat
+
+
+async def _on_loop(password: str, hashed: str) -> bool:
+    return verify_password(password, hashed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--logins", type=int, default=64)
+    args = parser.parse_args()
+
+    hashed = hash_password("secret", args.rounds)
+    cores = os.cpu_count() or 1
+    print(f"bcrypt rounds={args.rounds} logins={args.logins} cores={cores} pool={PASSWORD_HASH_WORKERS}")
+    for name, check in (("event loop", _on_loop), ("hash pool", verify_password_async)):
+        elapsed, stall = asyncio.run(_run(check, hashed, args.logins))
+        rate = args.logins / elapsed
+        print(f"{name:>10}: {rate:7.1f} logins/s  {rate / cores:7.1f} logins/s/core  "
+              f"max loop stall {stall * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Local stand-in for the LiteLLM proxy, for load tests, profiling and offline runs.
+
+    cd backend && python -m benchmarks.fake_litellm --port 4000 --latency lognormal:300:0.5 --error-rate 0.02
+    X_LITELLM_API_URL=http://127.0.0.1:4000 X_LITELLM_API_KEY=fake uvicorn main:app
+
+Plain asyncio HTTP/1.1 (keep-alive, Content-Length and chunked bodies), no
+dependencies beyond the standard library.
+
+  POST /v1/chat/completions                   chat completion, streamed as server-sent events with "stream": true
+  POST /engines/{model}/chat/completions      the same, model taken from the path
+  POST /v1/audio/transcriptions               {"text": ...}
+  GET  /fake/stats                            requests, errors and streams served so far
+
+Answers to a JSON chat prompt (response_format json_object) follow the schema
+in its system prompt -- the "Return JSON only: {...}" block of the stage prompts
+in chat.py: every key of the schema is filled in, "intent" advances the stage
+with probability --advance-rate. Other chat prompts get a numbered list of three
+advices. A --script file replaces the answers of matching requests:
+
+    {"rules": [
+      {"contains": "машин", "content": {"response": "...", "intent": "next_stage_when_ready_or_none",
+                                         "goal_type": "car"}},
+      {"path": "/v1/audio/transcriptions", "content": {"text": "..."}},
+      {"contains": "ошибка", "status": 503, "latency": "fixed:50"}
+    ]}
+
+A rule matches when all of its "path", "contains" (substring of the last user
+message) and "system_contains" fields match; the first matching rule wins.
+Its "content" is the answer (an object is serialized as the message content
+for chat), "status" forces an error answer and "latency" overrides --latency.
+
+Latency specs (milliseconds): fixed:MS, uniform:LOW:HIGH, normal:MEAN:STD,
+lognormal:MEDIAN:SIGMA, exp:MEAN. The latency is spent before the first byte;
+streamed answers additionally wait --token-interval-ms between chunks.
+--error-rate answers 500, --rate-limit-rate answers 429 with Retry-After.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+ADVICE = "1. Составьте бюджет на месяц.\n2. Откладывайте 10% дохода.\n3. Сократите необязательные подписки."
+TRANSCRIPT = "Хочу накопить на машину"
+ENGINES_PATH = re.compile(r"^/engines/(?P<model>[^/]+)/chat/completions$")
+SCHEMA_BLOCK = re.compile(r"Return JSON only:\s*(\{.*\})", re.S)
+SCHEMA_FIELD = re.compile(r'"(\w+)"\s*:\s*("[^"]*"|\[[^\]]*\])')
+# Answer of the stage schema's "intent" when the stage should advance
+ADVANCE_INTENTS = {"next_stage_when_ready_or_none": "next_stage_when_ready_or_none",
+                   "confirmed_or_declined_or_none": "confirmed"}
+
+
+def parse_latency(spec: Union[str, float]) -> Callable[[random.Random], float]:
+    """Sampler of latencies in seconds from a spec such as "lognormal:300:0.5" (a bare number is fixed ms)"""
+    if isinstance(spec, (int, float)) or spec.replace(".", "", 1).isdigit():
+        spec = f"fixed:{spec}"
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    distributions = {
+        "fixed": (1, lambda rng, ms: ms),
+        "uniform": (2, lambda rng, low, high: rng.uniform(low, high)),
+        "normal": (2, lambda rng, mean, std: rng.gauss(mean, std)),
+        "lognormal": (2, lambda rng, median, sigma: median * math.exp(rng.gauss(0, sigma))),
+        "exp": (1, lambda rng, mean: rng.expovariate(1 / mean) if mean else 0.0),
+    }
+    if kind not in distributions or len(values) != distributions[kind][0]:
+        raise ValueError(f"invalid latency spec {spec!r}")
+    sample = distributions[kind][1]
+    return lambda rng: max(0.0, sample(rng, *values)) / 1000
+
+
+def schema_answer(system_prompt: str, advance: bool) -> Optional[Dict[str, Any]]:
+    """An answer with every key of the JSON schema in the system prompt, or None without a schema"""
+    block = SCHEMA_BLOCK.search(system_prompt)
+    if block is None:
+        return None
+    answer: Dict[str, Any] = {}
+    for key, hint in SCHEMA_FIELD.findall(block.group(1)):
+        hint = hint.strip('"')
+        if key == "response":
+            answer[key] = "Понял вас. Расскажите, пожалуйста, подробнее."
+        elif key == "intent":
+            answer[key] = ADVANCE_INTENTS.get(hint, "none") if advance else "none"
+        elif hint.startswith("["):
+            answer[key] = ["Депозит Zaman", "Исламская ипотека"]
+        elif "float" in hint:
+            answer[key] = 1500000.0 if "cost" in key else 100000.0
+        else:
+            answer[key] = "Автомобиль" if key == "goal_type" else "12 месяцев"
+    if "cta" in answer:
+        answer["cta"] = [{"label": "Открыть депозит", "url": "https://zamanbank.kz/deposit"}]
+    return answer
+
+
+class FakeLiteLLM:
+    def __init__(
+            self,
+            latency: Union[str, float] = 0.0,
+            error_rate: float = 0.0,
+            rate_limit_rate: float = 0.0,
+            advance_rate: float = 1.0,
+            token_interval_ms: float = 0.0,
+            chunk_chars: int = 8,
+            script: Optional[Dict[str, Any]] = None,
+            seed: Optional[int] = None,
+    ):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.advance_rate = advance_rate
+        self.token_interval = token_interval_ms / 1000
+        self.chunk_chars = chunk_chars
+        self.rules: List[Dict[str, Any]] = (script or {}).get("rules", [])
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "errors": 0, "streams": 0}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def requests(self) -> int:
+        return self.stats["requests"]
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self.url
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                await self.handle(writer, *request)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _match(self, path: str, messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        user = next((str(m.get("content", "")) for m in reversed(messages) if m.get("role") == "user"), "")
+        system = next((str(m.get("content", "")) for m in messages if m.get("role") == "system"), "")
+        for rule in self.rules:
+            if rule.get("path", path) != path:
+                continue
+            if rule.get("contains", "") not in user or rule.get("system_contains", "") not in system:
+                continue
+            return rule
+        return None
+
+    async def handle(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes) -> None:
+        if method == "GET" and path == "/fake/stats":
+            return await _send_json(writer, 200, self.stats)
+
+        engine = ENGINES_PATH.match(path)
+        chat = path == "/v1/chat/completions" or engine is not None
+        if method != "POST" or not (chat or path == "/v1/audio/transcriptions"):
+            return await _send_json(writer, 404, {"error": {"message": f"{method} {path} not found"}})
+
+        self.stats["requests"] += 1
+        request = json.loads(body or b"{}") if chat else {}
+        messages = request.get("messages") or []
+        rule = self._match(path, messages) or {}
+        await asyncio.sleep(parse_latency(rule["latency"])(self.rng) if "latency" in rule else self.latency(self.rng))
+
+        status = rule.get("status")
+        if status is None:
+            draw = self.rng.random()
+            if draw < self.rate_limit_rate:
+                status = 429
+            elif draw < self.rate_limit_rate + self.error_rate:
+                status = 500
+        if status and status != 200:
+            self.stats["errors"] += 1
+            headers = {"retry-after": "1"} if status == 429 else {}
+            return await _send_json(writer, status, {"error": {"message": "fake upstream error"}}, headers)
+
+        if not chat:
+            return await _send_json(writer, 200, rule.get("content") or {"text": TRANSCRIPT})
+
+        model = engine.group("model") if engine else request.get("model", "gpt-4o-mini")
+        content = rule.get("content")
+        if content is None:
+            if (request.get("response_format") or {}).get("type") == "json_object":
+                system = next((str(m.get("content", "")) for m in messages if m.get("role") == "system"), "")
+                content = schema_answer(system, self.rng.random() < self.advance_rate) or {"response": ADVICE}
+            else:
+                content = ADVICE
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False)
+
+        if request.get("stream"):
+            self.stats["streams"] += 1
+            return await self._stream(writer, model, content)
+        await _send_json(writer, 200, _completion(model, content))
+
+    async def _stream(self, writer: asyncio.StreamWriter, model: str, content: str) -> None:
+        """The answer as server-sent events of chat.completion.chunk objects, in chunked encoding"""
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ntransfer-encoding: chunked\r\n\r\n")
+        completion_id = f"chatcmpl-fake-{time.monotonic_ns()}"
+        pieces = [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)]
+        for i, piece in enumerate(pieces):
+            if i and self.token_interval:
+                await asyncio.sleep(self.token_interval)
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            _write_chunk(writer, f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            await writer.drain()
+        _write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def _completion(model: str, content: str) -> Dict[str, Any]:
+    # Rough token counts, so usage-based metrics have something to add up
+    prompt_tokens, completion_tokens = 0, max(1, len(content) // 4)
+    return {
+        "id": f"chatcmpl-fake-{time.monotonic_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def _write_chunk(writer: asyncio.StreamWriter, data: bytes) -> None:
+    writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+
+async def _send_json(
+        writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+) -> None:
+    data = json.dumps(payload, ensure_ascii=False).encode()
+    extra = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+    writer.write(
+        f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+        f"content-type: application/json\r\ncontent-length: {len(data)}\r\n{extra}\r\n".encode() + data
+    )
+    await writer.drain()
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bytes]]:
+    """(method, path, body) of the next request on the connection, None when it was closed"""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, target, _ = line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await reader.readline()
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b"".join(chunks)
+    else:
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, target.split("?", 1)[0], body
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4000)
+    parser.add_argument("--latency", default="fixed:0", help="latency spec in ms, e.g. lognormal:300:0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--advance-rate", type=float, default=1.0, help="share of answers that advance the stage")
+    parser.add_argument("--token-interval-ms", type=float, default=0.0)
+    parser.add_argument("--chunk-chars", type=int, default=8)
+    parser.add_argument("--script", help="JSON file with scripted answers")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+    fake = FakeLiteLLM(
+        latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        advance_rate=args.advance_rate, token_interval_ms=args.token_interval_ms, chunk_chars=args.chunk_chars,
+        script=script, seed=args.seed,
+    )
+    print(f"fake LiteLLM listening on {await fake.start(args.host, args.port)}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,291 @@
+"""
+End-to-end latency and throughput of the main routes, against a mocked LLM.
+
+    cd backend
+    python -m benchmarks.suite                                   # SQLite file, app in process
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.suite --concurrency 1,16,64
+    python -m benchmarks.suite --compare benchmarks/results/<earlier>.json
+
+By default the app runs in this process behind httpx's ASGI transport, so no
+server is needed and the client shares the event loop with the app. The
+database is DATABASE_URL, or a fresh SQLite file when it is not set; it is
+migrated to head and seeded with a synthetic population when it has no users.
+The LLM is a local fake LiteLLM server (benchmarks/fake_litellm.py) answering
+after --llm-latency (a distribution, e.g. lognormal:300:0.5). The LLM response cache is off unless --llm-cache is
+given, so /chat/advice measures the LLM round trip and not a cache hit.
+With --url the requests go to a running server instead. Start that server
+with X_LITELLM_API_URL pointing at `python -m benchmarks.fake_litellm`.
+
+Each scenario runs --requests requests at every concurrency level, after
+--warmup requests that are not counted. The results are printed and saved as
+JSON. --compare marks p95 latency or throughput that moved more than
+--threshold against an earlier run, and exits with status 1 if any did.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+
+from benchmarks.fake_litellm import FakeLiteLLM  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+BENCH_IIN = "990000000001"
+BENCH_PASSWORD = "bench-password"
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    # request number -> (path, extra httpx.request kwargs)
+    request: Callable[[int], tuple]
+    auth: bool = True
+
+
+def _scenarios(user_id: int, aim_id: int) -> List[Scenario]:
+    def transfer(i: int) -> tuple:
+        # Alternate deposits and withdrawals so the balances never run out
+        kind = "deposit" if i % 2 == 0 else "withdrawal"
+        return "/financial-transaction/", {"json": {"aim_id": aim_id, "amount": 1, "transaction_type": kind}}
+
+    return [
+        Scenario("auth_login", "POST", lambda i: (
+            "/auth/login", {"json": {"iin": BENCH_IIN, "password": BENCH_PASSWORD}}), auth=False),
+        Scenario("transactions_list", "GET", lambda i: ("/transactions/", {"params": {"limit": 50}})),
+        Scenario("financial_transaction_create", "POST", transfer),
+        Scenario("similarity_find_similar", "GET", lambda i: (
+            f"/similarity/find-similar/{user_id}", {"params": {"top_n": 5}}), auth=False),
+        Scenario("chat_advice", "GET", lambda i: ("/chat/advice", {})),
+        Scenario("api_chat", "POST", lambda i: (
+            "/api/chat", {"json": {"message": f"Хочу накопить на машину ({i})"}})),
+    ]
+
+
+async def _run_level(
+        client: httpx.AsyncClient, scenario: Scenario, headers: Dict[str, str], concurrency: int, requests: int,
+        first: int,
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(first, first + requests))
+
+    async def worker() -> None:
+        for i in counter:
+            path, kwargs = scenario.request(i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, path, headers=headers, **kwargs)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            if not status.startswith("2"):
+                errors[status] = errors.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(requests / elapsed, 1),
+        "mean_ms": round(float(ms.mean()), 2),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+    }
+
+
+async def _ensure_population(users: int) -> None:
+    from sqlalchemy import func, select
+
+    from database import async_session
+    from models import User
+    from scripts.synthetic_population import DatabaseSink, PopulationConfig, build
+
+    async with async_session() as db:
+        if (await db.execute(select(func.count(User.id)))).scalar():
+            return
+        config = PopulationConfig(users=users, seed=0, transactions_per_user=50)
+        await build(config, DatabaseSink(db, 10000), chunk_users=1000)
+
+
+async def _setup_user(client: httpx.AsyncClient) -> Dict[str, Any]:
+    """Log in (signing up first if needed) the benchmark user and give it an aim and a history"""
+    response = await client.post("/auth/login", json={"iin": BENCH_IIN, "password": BENCH_PASSWORD})
+    if response.status_code != 200:
+        response = await client.post("/auth/signup", json={
+            "iin": BENCH_IIN, "email": "bench@example.com", "password": BENCH_PASSWORD,
+        })
+    response.raise_for_status()
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    me = (await client.get("/users/me", headers=headers)).json()
+
+    aims = (await client.get("/financial-aims/", headers=headers)).json()
+    if aims:
+        aim_id = aims[0]["id"]
+    else:
+        aim = (await client.post("/financial-aims/", json={"title": "Bench", "target_amount": 10 ** 9},
+                                 headers=headers)).json()
+        aim_id = aim["id"]
+        await client.post("/financial-transaction/", headers=headers,
+                          json={"aim_id": aim_id, "amount": 100, "transaction_type": "deposit"})
+        (await client.post("/transactions/generate", json={"user_id": me["id"], "count": 500})).raise_for_status()
+    return {"headers": headers, "user_id": me["id"], "aim_id": aim_id}
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: Dict[str, Any], results: List[Dict[str, Any]], threshold: float) -> bool:
+    """Print the change against an earlier run; True if anything regressed beyond threshold"""
+    before = {(r["scenario"], r["concurrency"]): r for r in previous["results"]}
+    regressed = False
+    print(f"\nagainst {previous['meta'].get('revision')} ({previous['meta'].get('started_at')}):")
+    for result in results:
+        old = before.get((result["scenario"], result["concurrency"]))
+        if old is None:
+            continue
+        p95 = result["p95_ms"] / old["p95_ms"] - 1 if old["p95_ms"] else 0.0
+        rps = result["rps"] / old["rps"] - 1 if old["rps"] else 0.0
+        worse = p95 > threshold or rps < -threshold
+        regressed |= worse
+        print(f"  {result['scenario']:30} c={result['concurrency']:<4} p95 {p95:+7.1%}  rps {rps:+7.1%}"
+              f"{'  REGRESSION' if worse else ''}")
+    return regressed
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    fake = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        fake = FakeLiteLLM(latency=args.llm_latency, error_rate=args.llm_error_rate, seed=0)
+        await fake.start(port=args.llm_port)
+        from database import engine
+        import main
+
+        engine.echo = False
+        await _ensure_population(args.users)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=60)
+
+    meta = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "target": args.url or "in-process",
+        "database": None if args.url else os.environ.get("DATABASE_URL", "").split("@")[-1],
+        "llm_latency": args.llm_latency,
+        "llm_error_rate": args.llm_error_rate,
+        "llm_cache": args.llm_cache,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+    results = []
+    async with client:
+        bench = await _setup_user(client)
+        scenarios = [s for s in _scenarios(bench["user_id"], bench["aim_id"])
+                     if not args.scenarios or s.name in args.scenarios]
+        for scenario in scenarios:
+            headers = bench["headers"] if scenario.auth else {}
+            await _run_level(client, scenario, headers, 1, args.warmup, 0)
+            for concurrency in args.concurrency:
+                result = await _run_level(
+                    client, scenario, headers, concurrency, args.requests, args.warmup + len(results) * args.requests,
+                )
+                results.append(result)
+                print(f"{scenario.name:30} c={concurrency:<4} {result['rps']:8.1f} req/s  "
+                      f"p50 {result['p50_ms']:8.1f}  p95 {result['p95_ms']:8.1f}  p99 {result['p99_ms']:8.1f} ms"
+                      f"{'  errors ' + json.dumps(result['errors']) if result['errors'] else ''}")
+    if fake is not None:
+        await fake.close()
+        meta["llm_requests"] = fake.requests
+    return {"meta": meta, "results": results}
+
+
+def _configure(args: argparse.Namespace) -> None:
+    """
+    Point the in-process app at the fake LLM and a migrated database. Configuration
+    is read when app_config is first imported, so this runs before anything imports it.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        args.llm_port = sock.getsockname()[1]
+    os.environ["X_LITELLM_API_URL"] = f"http://127.0.0.1:{args.llm_port}"
+    os.environ.setdefault("X_LITELLM_API_KEY", "bench")
+    if not args.llm_cache:
+        os.environ["LLM_CACHE_BACKEND"] = "none"
+
+    # A fresh SQLite file unless DATABASE_URL is set
+    if "DATABASE_URL" not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(prefix="zaman_bench_"), "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+    from alembic import command
+    from alembic.config import Config
+
+    command.upgrade(Config(os.path.join(BACKEND_DIR, "alembic.ini")), "head")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--url", help="benchmark a running server instead of the app in process")
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), help="comma separated subset to run")
+    parser.add_argument("--users", type=int, default=2000, help="synthetic users seeded into an empty database")
+    parser.add_argument("--llm-latency", default="fixed:200", help="fake LLM latency spec in ms, see fake_litellm")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-cache", action="store_true")
+    parser.add_argument("--out", help=f"results file (default: {RESULTS_DIR}/<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if not args.url:
+        _configure(args)
+    report = asyncio.run(run(args))
+
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nresults saved to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(json.load(f), report["results"], args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
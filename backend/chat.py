@@ -1,6 +1,83 @@
+import json
+import re
+from typing import Any, Dict, List
+
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from models import ChatSession  # твоя модель с полями: id, user_id, session_id, stage, goal_type, goal_cost, monthly_saving, timeline, products
+from models import ChatSession, FinancialAim  # твоя модель с полями: id, user_id, session_id, stage, goal_type, goal_cost, monthly_saving, timeline, products
+from services import feature_store, llm_cache
+
+# Промпты по стадиям
+STAGE_PROMPTS = {
+    "discovery": """
+    You are a friendly financial planner.
+    Ask open-ended questions to understand what financial goals the user has
+    (e.g., buy a car, save for Hajj, start a business).
+    Keep the tone personal and conversational.
+    Return JSON only:
+    {
+      "response": "your message to the user",
+      "intent": "next_stage_when_ready_or_none",
+      "goal_type": "string or null"
+    }
+    """,
+    "clarification": """
+    You are an assistant helping calculate goal feasibility.
+    Ask for approximate cost, current savings, and preferred timeline.
+    Then summarize their target.
+    Return JSON only:
+    {
+      "response": "your message",
+      "intent": "next_stage_when_ready_or_none",
+      "goal_cost": "float or null",
+      "monthly_saving": "float or null",
+      "timeline": "string or null"
+    }
+    """,
+    "recommendation": """
+    You are an expert financial advisor from Zaman Bank.
+    Based on user info, recommend relevant bank products
+    (deposits, financing, halal programs, cards)
+    and explain why each helps reach the goal.
+    Be realistic and Shariah-compliant.
+    Return JSON only:
+    {
+      "response": "your recommendations text",
+      "intent": "next_stage_when_ready_or_none",
+      "products": ["list", "of", "products"]
+    }
+    """,
+    "confirmation": """
+    You are a helpful assistant confirming the user's choice.
+    The user has expressed interest in specific products.
+    Ask them to confirm if they want to create a financial goal with the selected product(s).
+    Be clear and concise.
+    Return JSON only:
+    {
+      "response": "your confirmation request message",
+      "intent": "confirmed_or_declined_or_none",
+      "selected_products": ["list", "of", "selected", "products"]
+    }
+    If user confirms (says yes, давай, хорошо, согласен, etc.), set intent to "confirmed".
+    If user declines, set intent to "declined".
+    """,
+    "action": """
+    Now invite the user to explore these offers via clickable links
+    (formatted JSON for frontend rendering). Keep it concise and motivating.
+    Return JSON only:
+    {
+      "response": "your final message",
+      "cta": [{"label": "string", "url": "string"}]
+    }
+    """
+}
+
+
+CHAT_TEMPERATURE = 0.4
+CHAT_RESPONSE_FORMAT = {"type": "json_object"}
+
+# Поля ответа модели, сохраняемые в ChatSession
+SESSION_FIELDS = ["goal_type", "goal_cost", "monthly_saving", "timeline", "products", "selected_products"]
 
 async def get_or_create_chat_session(db: AsyncSession, user_id: int, session_id: str):
     result = await db.execute(
@@ -27,3 +104,114 @@ async def get_or_create_chat_session(db: AsyncSession, user_id: int, session_id:
         await db.refresh(session)
 
     return session
+
+
+def build_chat_messages(stage: str, message: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": STAGE_PROMPTS[stage]},
+        {"role": "user", "content": message}
+    ]
+
+
+async def apply_assistant_result(
+        db: AsyncSession,
+        user_session: ChatSession,
+        user_id: int,
+        stage: str,
+        ai_result: Dict[str, Any]
+) -> str:
+    """Advance the session stage from the parsed model answer and return the text for the user"""
+    ai_response = ai_result.get("response", "")
+    intent = ai_result.get("intent")
+
+    # ⏩ Переход по стадиям
+    if stage == "discovery" and intent == "next_stage_when_ready_or_none":
+        user_session.stage = "clarification"
+    elif stage == "clarification" and intent == "next_stage_when_ready_or_none":
+        user_session.stage = "recommendation"
+    elif stage == "recommendation" and intent == "next_stage_when_ready_or_none":
+        user_session.stage = "confirmation"
+    elif stage == "confirmation":
+        if intent == "confirmed":
+            user_session.stage = "action"
+        elif intent == "declined":
+            # Вернуться к рекомендациям или завершить
+            user_session.stage = "recommendation"
+            ai_response += "\n\nДавайте рассмотрим другие варианты."
+    elif stage == "action":
+        user_session.stage = "complete"
+
+    # 💾 Сохранение контекста (цель, сумма, и т.д.)
+    for key in SESSION_FIELDS:
+        if key in ai_result and ai_result[key] is not None:
+            setattr(user_session, key, ai_result[key])
+
+    await db.commit()
+
+    # ✅ Создаём цель только после подтверждения на стадии action
+    if user_session.stage == "complete":
+        new_aim = FinancialAim(
+            user_id=user_id,
+            title=user_session.goal_type or "Моя финансовая цель",
+            target_amount=float(user_session.goal_cost or 0),
+            current_amount=0.0,
+        )
+        db.add(new_aim)
+        await feature_store.mark_user_dirty(db, user_id)
+        await db.commit()
+        await llm_cache.invalidate_user(user_id)
+        ai_response += f"\n\n✅ Цель '{new_aim.title}' создана. Сумма: {new_aim.target_amount:,.0f} ₸"
+
+    return ai_response
+
+
+class ResponseFieldStream:
+    """
+    Decodes the "response" string of a JSON answer while the answer is still
+    being streamed, so its text can be forwarded before the object is complete.
+    """
+
+    KEY = re.compile(r'"response"\s*:\s*"')
+    ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        """Append a chunk of the answer and return the newly decoded part of "response" """
+        self.buffer += chunk
+        if self.done:
+            return ""
+        if self.pos is None:
+            match = self.KEY.search(self.buffer)
+            if match is None:
+                return ""
+            self.pos = match.end()
+
+        buf, i, out = self.buffer, self.pos, []
+        while i < len(buf):
+            c = buf[i]
+            if c == '"':
+                self.done = True
+                break
+            if c != '\\':
+                out.append(c)
+                i += 1
+                continue
+            # Escapes are decoded only once complete
+            if i + 1 >= len(buf):
+                break
+            if buf[i + 1] != 'u':
+                out.append(self.ESCAPES.get(buf[i + 1], buf[i + 1]))
+                i += 2
+                continue
+            width = 12 if buf[i + 2:i + 4].lower() in ("d8", "d9", "da", "db") else 6
+            if i + width > len(buf):
+                break
+            out.append(json.loads('"' + buf[i:i + width] + '"'))
+            i += width
+
+        self.pos = i
+        return "".join(out)
@@ -0,0 +1,161 @@
+"""Initial schema
+
+The tables as the create_all startup hook used to create them.
+
+Revision ID: 0001_initial_schema
+Revises:
+Create Date: 2026-10-17 17:33:48.510538
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001_initial_schema'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+transaction_type = sa.Enum('DEPOSIT', 'WITHDRAWAL', 'TRANSFER', name='transactiontype')
+financial_transaction_type = sa.Enum('DEPOSIT', 'WITHDRAWAL', name='financialtransactiontype')
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('iin', sa.String(length=12), nullable=False),
+        sa.Column('email', sa.String(length=100), nullable=False),
+        sa.Column('hashed_password', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+        sa.UniqueConstraint('iin'),
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+
+    op.create_table(
+        'bankaccounts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('account_number', sa.String(length=34), nullable=False),
+        sa.Column('balance', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('account_number'),
+    )
+    op.create_index('ix_bankaccounts_id', 'bankaccounts', ['id'])
+
+    op.create_table(
+        'chat_sessions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('session_id', sa.String(length=64), nullable=False),
+        sa.Column('stage', sa.String(length=32), nullable=True),
+        sa.Column('goal_type', sa.String(length=255), nullable=True),
+        sa.Column('goal_cost', sa.Float(), nullable=True),
+        sa.Column('monthly_saving', sa.Float(), nullable=True),
+        sa.Column('timeline', sa.String(length=255), nullable=True),
+        sa.Column('products', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_chat_sessions_id', 'chat_sessions', ['id'])
+    op.create_index('ix_chat_sessions_session_id', 'chat_sessions', ['session_id'], unique=True)
+
+    op.create_table(
+        'financial_aims',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('target_amount', sa.Float(), nullable=False),
+        sa.Column('current_amount', sa.Float(), nullable=True),
+        sa.Column('deadline', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('is_completed', sa.Boolean(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_financial_aims_id', 'financial_aims', ['id'])
+
+    op.create_table(
+        'transactions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('description', sa.String(), nullable=False),
+        sa.Column('transaction_type', transaction_type, nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_transactions_id', 'transactions', ['id'])
+
+    op.create_table(
+        'financial_transactions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('transaction_type', financial_transaction_type, nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('aim_id', sa.Integer(), nullable=True),
+        sa.Column('bank_account_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['aim_id'], ['financial_aims.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['bank_account_id'], ['bankaccounts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_financial_transactions_id', 'financial_transactions', ['id'])
+
+    op.create_table(
+        'user_feature_vectors',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('total_balance', sa.Float(), nullable=False),
+        sa.Column('num_accounts', sa.Integer(), nullable=False),
+        sa.Column('avg_account_age_days', sa.Float(), nullable=False),
+        sa.Column('total_transactions', sa.Integer(), nullable=False),
+        sa.Column('total_deposit', sa.Float(), nullable=False),
+        sa.Column('total_withdrawal', sa.Float(), nullable=False),
+        sa.Column('avg_transaction_amount', sa.Float(), nullable=False),
+        sa.Column('transaction_frequency', sa.Float(), nullable=False),
+        sa.Column('num_aims', sa.Integer(), nullable=False),
+        sa.Column('total_target_amount', sa.Float(), nullable=False),
+        sa.Column('total_current_amount', sa.Float(), nullable=False),
+        sa.Column('completion_rate', sa.Float(), nullable=False),
+        sa.Column('avg_aim_progress', sa.Float(), nullable=False),
+        sa.Column('num_completed_aims', sa.Integer(), nullable=False),
+        sa.Column('savings_rate', sa.Float(), nullable=False),
+        sa.Column('net_flow', sa.Float(), nullable=False),
+        sa.Column('is_dirty', sa.Boolean(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    op.create_index('ix_user_feature_vectors_is_dirty', 'user_feature_vectors', ['is_dirty'])
+
+    op.create_table(
+        'feature_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Float(), nullable=False),
+        sa.Column('mean', sa.JSON(), nullable=False),
+        sa.Column('m2', sa.JSON(), nullable=False),
+        sa.Column('population', sa.Integer(), nullable=False),
+        sa.Column('sample_size', sa.Integer(), nullable=True),
+        sa.Column('sampled_population', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('feature_stats')
+    op.drop_table('user_feature_vectors')
+    op.drop_table('financial_transactions')
+    op.drop_table('transactions')
+    op.drop_table('financial_aims')
+    op.drop_table('chat_sessions')
+    op.drop_table('bankaccounts')
+    op.drop_table('users')
+    financial_transaction_type.drop(op.get_bind(), checkfirst=True)
+    transaction_type.drop(op.get_bind(), checkfirst=True)
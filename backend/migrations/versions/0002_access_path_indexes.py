@@ -0,0 +1,44 @@
+"""Indexes for the per-user access paths
+
+transactions          (user_id, created_at, id)  GET /transactions/ (filters + keyset order)
+transactions          (user_id, description)     GET /transactions/categories
+financial_transactions (aim_id, created_at)       GET /financial-transaction/{aim_id}, /financial-transaction/
+financial_transactions (bank_account_id, created_at)  similarity 3-month finances, feature store
+financial_aims        (user_id)                  aims listing, motivation, feature store
+bankaccounts          (user_id)                  /users/me, transfers, feature store
+
+On PostgreSQL the indexes are built CONCURRENTLY so existing tables stay writable.
+
+Revision ID: 0002_access_path_indexes
+Revises: 0001_initial_schema
+Create Date: 2026-10-17 17:34:25.594243
+"""
+from alembic import op
+
+
+revision = '0002_access_path_indexes'
+down_revision = '0001_initial_schema'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_transactions_user_id_created_at_id', 'transactions', ['user_id', 'created_at', 'id']),
+    ('ix_transactions_user_id_description', 'transactions', ['user_id', 'description']),
+    ('ix_financial_transactions_aim_id_created_at', 'financial_transactions', ['aim_id', 'created_at']),
+    ('ix_financial_transactions_bank_account_id_created_at', 'financial_transactions', ['bank_account_id', 'created_at']),
+    ('ix_financial_aims_user_id', 'financial_aims', ['user_id']),
+    ('ix_bankaccounts_user_id', 'bankaccounts', ['user_id']),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,77 @@
+"""Monthly per-user transaction rollups
+
+(user_id, source, month, transaction_type, category) -> count, total, kept up
+to date by the write paths. The upgrade counts the existing rows with two
+INSERT ... SELECT ... GROUP BY statements, as scripts/backfill_rollups.py would.
+
+Revision ID: 0003_transaction_rollups
+Revises: 0002_access_path_indexes
+Create Date: 2026-10-17 18:02:11.204815
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003_transaction_rollups'
+down_revision = '0002_access_path_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'transaction_rollups',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('source', sa.String(length=16), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('transaction_type', sa.String(length=16), nullable=False),
+        sa.Column('category', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'source', 'month', 'transaction_type', 'category'),
+    )
+
+    rollups = sa.table(
+        'transaction_rollups',
+        *(sa.column(name) for name in ('user_id', 'source', 'month', 'transaction_type', 'category', 'count', 'total')),
+    )
+    transactions = sa.table(
+        'transactions', sa.column('user_id'), sa.column('created_at'), sa.column('transaction_type'),
+        sa.column('description'), sa.column('amount'),
+    )
+    transfers = sa.table(
+        'financial_transactions', sa.column('bank_account_id'), sa.column('created_at'),
+        sa.column('transaction_type'), sa.column('amount'),
+    )
+    bankaccounts = sa.table('bankaccounts', sa.column('id'), sa.column('user_id'))
+
+    for source, owner, table, category, joined in (
+            ('transaction', transactions.c.user_id, transactions, transactions.c.description, transactions),
+            ('aim_transfer', bankaccounts.c.user_id, transfers, None,
+             transfers.join(bankaccounts, bankaccounts.c.id == transfers.c.bank_account_id)),
+    ):
+        month = _month(table.c.created_at)
+        # Enum columns hold the member names; rollups use the values (their lower case)
+        transaction_type = sa.func.lower(sa.cast(table.c.transaction_type, sa.String))
+        groups = [owner, month, transaction_type] + ([category] if category is not None else [])
+        op.execute(rollups.insert().from_select(
+            ['user_id', 'source', 'month', 'transaction_type', 'category', 'count', 'total'],
+            sa.select(owner, sa.literal_column(f"'{source}'"), month, transaction_type,
+                      category if category is not None else sa.literal_column("''"),
+                      sa.func.count(), sa.func.sum(table.c.amount))
+            .select_from(joined)
+            .where(owner.is_not(None), table.c.created_at.is_not(None))
+            .group_by(*groups),
+        ))
+
+
+def _month(column):
+    """First day of the month of a timestamp column, as a date"""
+    if op.get_bind().dialect.name == 'sqlite':
+        return sa.func.date(column, 'start of month')
+    return sa.cast(sa.func.date_trunc('month', column), sa.Date)
+
+
+def downgrade() -> None:
+    op.drop_table('transaction_rollups')
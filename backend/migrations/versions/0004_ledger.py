@@ -0,0 +1,55 @@
+"""Append-only ledger of balances and balance snapshots
+
+ledger_postings    signed balance changes of bank accounts and aims
+balance_snapshots  (account_type, account_id, as_of) -> balance
+
+Existing balances and transfers are posted by scripts/backfill_ledger.py,
+which is run once after this upgrade.
+
+Revision ID: 0004_ledger
+Revises: 0003_transaction_rollups
+Create Date: 2026-10-17 20:41:37.118204
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004_ledger'
+down_revision = '0003_transaction_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'ledger_postings',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('account_type', sa.String(length=16), nullable=False),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('kind', sa.String(length=16), nullable=False),
+        sa.Column('financial_transaction_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_ledger_postings_account_created_at', 'ledger_postings', ['account_type', 'account_id', 'created_at']
+    )
+    op.create_index('ix_ledger_postings_created_at', 'ledger_postings', ['created_at'])
+    op.create_table(
+        'balance_snapshots',
+        sa.Column('account_type', sa.String(length=16), nullable=False),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('as_of', sa.DateTime(), nullable=False),
+        sa.Column('balance', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('account_type', 'account_id', 'as_of'),
+    )
+    op.create_index('ix_balance_snapshots_as_of', 'balance_snapshots', ['as_of'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_balance_snapshots_as_of', table_name='balance_snapshots')
+    op.drop_table('balance_snapshots')
+    op.drop_index('ix_ledger_postings_created_at', table_name='ledger_postings')
+    op.drop_index('ix_ledger_postings_account_created_at', table_name='ledger_postings')
+    op.drop_table('ledger_postings')
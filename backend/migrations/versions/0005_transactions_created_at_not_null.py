@@ -0,0 +1,34 @@
+"""transactions.created_at NOT NULL
+
+GET /transactions/ pages by the keyset (created_at, id): a NULL created_at
+cannot be encoded in a cursor and drops out of the row comparison. Existing
+NULLs are set to updated_at (or now) first.
+
+Revision ID: 0005_transactions_created_at_not_null
+Revises: 0004_ledger
+Create Date: 2026-10-17 21:26:03.571942
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005_transactions_created_at_not_null'
+down_revision = '0004_ledger'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    transactions = sa.table('transactions', sa.column('created_at', sa.DateTime()), sa.column('updated_at', sa.DateTime()))
+    op.execute(
+        transactions.update()
+        .where(transactions.c.created_at.is_(None))
+        .values(created_at=sa.func.coalesce(transactions.c.updated_at, sa.func.now()))
+    )
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=True)
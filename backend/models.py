@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, Float, ForeignKey, Enum, DateTime, JSON
+from sqlalchemy import Boolean, Column, Integer, String, Float, ForeignKey, Enum, Date, DateTime, JSON, Index
 from database import Base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -26,6 +26,7 @@ class FinancialAim(Base):
     title = Column(String, nullable=False)
     description = Column(String)
     target_amount = Column(Float, nullable=False)
+    # Cache of the aim's ledger balance (services/ledger.py)
     current_amount = Column(Float, default=0.0)
     deadline = Column(DateTime(timezone=True), nullable=True)
     is_completed = Column(Boolean, nullable=False, default=False)
@@ -34,6 +35,10 @@ class FinancialAim(Base):
     user = relationship("User", back_populates="financial_aims")
     transactions = relationship("FinancialTransaction", back_populates="aim")
 
+    __table_args__ = (
+        Index("ix_financial_aims_user_id", "user_id"),
+    )
+
 
 class BankAccount(Base):
     __tablename__ = "bankaccounts"
@@ -43,6 +48,7 @@ class BankAccount(Base):
 
     account_number = Column(String(34), unique=True, nullable=False)
 
+    # Cache of the account's ledger balance (services/ledger.py)
     balance = Column(Float, nullable=False, default=0.0)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -51,6 +57,10 @@ class BankAccount(Base):
     user = relationship("User", back_populates="bank_account")
     financial_transactions = relationship("FinancialTransaction", back_populates="bank_account")
 
+    __table_args__ = (
+        Index("ix_bankaccounts_user_id", "user_id"),
+    )
+
 
 class TransactionType(enum.Enum):
     DEPOSIT = "deposit"
@@ -64,12 +74,18 @@ class Transaction(Base):
     amount = Column(Float, nullable=False)
     description = Column(String, nullable=False)
     transaction_type = Column(Enum(TransactionType), nullable=False)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), nullable=False)
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     user = relationship("User", back_populates="transactions")
 
+    __table_args__ = (
+        # Per-user listing in keyset order (created_at, id) and category counts
+        Index("ix_transactions_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_transactions_user_id_description", "user_id", "description"),
+    )
+
 
 # AIM Money
 class FinancialTransactionType(enum.Enum):
@@ -93,6 +109,11 @@ class FinancialTransaction(Base):
     aim = relationship("FinancialAim", back_populates="transactions")
     bank_account = relationship("BankAccount", back_populates="financial_transactions")
 
+    __table_args__ = (
+        Index("ix_financial_transactions_aim_id_created_at", "aim_id", "created_at"),
+        Index("ix_financial_transactions_bank_account_id_created_at", "bank_account_id", "created_at"),
+    )
+
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
@@ -113,6 +134,103 @@ class ChatSession(Base):
     # Список предложенных продуктов (в JSON)
     products = Column(JSON, nullable=True)
 
+
+# Precomputed similarity features (one row per user, see services/feature_store.py)
+class UserFeatureVector(Base):
+    __tablename__ = "user_feature_vectors"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+
+    total_balance = Column(Float, nullable=False, default=0.0)
+    num_accounts = Column(Integer, nullable=False, default=0)
+    avg_account_age_days = Column(Float, nullable=False, default=0.0)
+    total_transactions = Column(Integer, nullable=False, default=0)
+    total_deposit = Column(Float, nullable=False, default=0.0)
+    total_withdrawal = Column(Float, nullable=False, default=0.0)
+    avg_transaction_amount = Column(Float, nullable=False, default=0.0)
+    transaction_frequency = Column(Float, nullable=False, default=0.0)
+    num_aims = Column(Integer, nullable=False, default=0)
+    total_target_amount = Column(Float, nullable=False, default=0.0)
+    total_current_amount = Column(Float, nullable=False, default=0.0)
+    completion_rate = Column(Float, nullable=False, default=0.0)
+    avg_aim_progress = Column(Float, nullable=False, default=0.0)
+    num_completed_aims = Column(Integer, nullable=False, default=0)
+    savings_rate = Column(Float, nullable=False, default=0.0)
+    net_flow = Column(Float, nullable=False, default=0.0)
+
+    # Set by write paths, cleared when the row is recomputed
+    is_dirty = Column(Boolean, nullable=False, default=False, index=True)
+    computed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Running per-feature mean / sum of squared deviations over user_feature_vectors (single row)
+class FeatureStats(Base):
+    __tablename__ = "feature_stats"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    count = Column(Float, nullable=False, default=0.0)
+    mean = Column(JSON, nullable=False)
+    m2 = Column(JSON, nullable=False)
+    # Number of vectors the stats currently describe
+    population = Column(Integer, nullable=False, default=0)
+    # Set when the stats were estimated from a reservoir sample instead of a full scan
+    sample_size = Column(Integer, nullable=True)
+    sampled_population = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Monthly count / sum of transactions per user, type and category (see services/rollups.py)
+class TransactionRollup(Base):
+    __tablename__ = "transaction_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # "transaction" (transactions table) or "aim_transfer" (financial_transactions)
+    source = Column(String(16), primary_key=True)
+    # First day of the month
+    month = Column(Date, primary_key=True)
+    transaction_type = Column(String(16), primary_key=True)
+    # Free-text transaction description (rows grow with distinct descriptions per user and month); empty for aim transfers
+    category = Column(String, primary_key=True, default="")
+
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+
+
+# Append-only balance changes of bank accounts and aims; a balance is the sum of its postings (see services/ledger.py)
+class LedgerPosting(Base):
+    __tablename__ = "ledger_postings"
+
+    id = Column(Integer, primary_key=True)
+    # "bank_account" (bankaccounts.id) or "aim" (financial_aims.id); no foreign key, postings outlive their accounts
+    account_type = Column(String(16), nullable=False)
+    account_id = Column(Integer, nullable=False)
+    # Signed change of the balance
+    amount = Column(Float, nullable=False)
+    # "opening" or "transfer"
+    kind = Column(String(16), nullable=False)
+    financial_transaction_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        Index("ix_ledger_postings_account_created_at", "account_type", "account_id", "created_at"),
+        Index("ix_ledger_postings_created_at", "created_at"),
+    )
+
+
+# Balance of an account over all its postings created before as_of
+class BalanceSnapshot(Base):
+    __tablename__ = "balance_snapshots"
+
+    account_type = Column(String(16), primary_key=True)
+    account_id = Column(Integer, primary_key=True)
+    as_of = Column(DateTime, primary_key=True)
+    balance = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_balance_snapshots_as_of", "as_of"),
+    )
+
 from pydantic import BaseModel
 from datetime import datetime
 from typing import List, Optional
@@ -3,8 +3,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from database import get_db
 from models import User, BankAccount
+from routes.user_routes import invalidate_cached_user
+from services import ledger
 from schemas.user import UserCreate, UserLogin, Token
-from auth import hash_password, verify_password, create_access_token
+from auth import hash_password_async, verify_password_async, needs_rehash, create_access_token, user_token_claims
 import uuid
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
@@ -21,7 +23,7 @@ async def signup(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     new_user = User(
         iin=user_data.iin,
         email=user_data.email,
-        hashed_password=hash_password(user_data.password),
+        hashed_password=await hash_password_async(user_data.password),
     )
     db.add(new_user)
     await db.flush()  # flush to get new_user.id before commit
@@ -33,13 +35,17 @@ async def signup(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
         balance=1000.0,
     )
     db.add(new_account)
+    await db.flush()
+    await ledger.record_opening(db, ledger.ACCOUNT_BANK, new_account.id, new_account.balance)
 
     # Commit both user and bank account
     await db.commit()
     await db.refresh(new_user)
+    # A row cached under this id would belong to a deleted user that had it before
+    invalidate_cached_user(new_user.id)
 
     # Generate access token
-    token = create_access_token({"sub": new_user.iin})
+    token = create_access_token(user_token_claims(new_user))
     return {"access_token": token, "token_type": "bearer", "id": new_user.id}
 
 @router.post("/login", response_model=Token)
@@ -47,8 +53,13 @@ async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(User).where(User.iin == user_data.iin))
     user = result.scalar_one_or_none()
 
-    if not user or not verify_password(user_data.password, user.hashed_password):
+    if not user or not await verify_password_async(user_data.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
-    token = create_access_token({"sub": user.iin})
+    # Upgrade hashes made with an outdated work factor while the plain password is at hand
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = await hash_password_async(user_data.password)
+        await db.commit()
+
+    token = create_access_token(user_token_claims(user))
     return {"access_token": token, "token_type": "bearer", "id": user.id}
@@ -1,22 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import func, select
 from typing import List, Dict, Any
 
 from database import get_db
 from models import Transaction
 from routes.user_routes import get_current_user
+from services import llm_cache, rollups
 from services.chat_service import send_chat_message_to_chatgpt, ChatMessage
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
+PROMPT_TRANSACTIONS = 50
+
 
 def _format_transactions_for_prompt(transactions: List[Transaction]) -> str:
     if not transactions:
         return "У пользователя пока нет транзакций. Дайте 3 универсальных совета по улучшению личных финансов."
 
     lines = []
-    for t in transactions[:50]:  # keep prompt short if too many
+    for t in transactions[:PROMPT_TRANSACTIONS]:  # keep prompt short if too many
         # created_at can be None or not ISO-serializable directly; format defensively
         created = None
         try:
@@ -63,29 +66,45 @@ async def get_finance_advice(
     current_user=Depends(get_current_user)
 ) -> Dict[str, Any]:
     try:
-        # Fetch current user's transactions
+        # Cached answer is valid while the user's transactions are unchanged
+        tx_state = await db.execute(
+            select(func.count(Transaction.id), func.max(Transaction.id), func.max(Transaction.updated_at))
+            .filter(Transaction.user_id == current_user.id)
+        )
+        digest = llm_cache.fingerprint(*tx_state.one())
+        cached = await llm_cache.lookup("advice", current_user.id, digest)
+        if cached is not None:
+            return cached
+
+        # Only the latest transactions go into the prompt; the total comes from the rollups
         result = await db.execute(
-            select(Transaction).filter(Transaction.user_id == current_user.id)
+            select(Transaction)
+            .filter(Transaction.user_id == current_user.id)
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc())
+            .limit(PROMPT_TRANSACTIONS)
         )
         transactions = result.scalars().all()
+        transactions_count = sum(count for _, _, count, _ in await rollups.monthly_summary(db, current_user.id))
 
         # Build prompt
         prompt = _format_transactions_for_prompt(transactions)
 
         # Send to AI
-        ai_result = send_chat_message_to_chatgpt(ChatMessage(message=prompt))
+        ai_result = await send_chat_message_to_chatgpt(ChatMessage(message=prompt))
         ai_text = ai_result.get("response", "")
         session_id = ai_result.get("session_id")
 
         # Try to extract exactly 3 advice items
         advices = _extract_top3_advice(ai_text)
 
-        return {
+        response = {
             "advices": advices,
             "raw_response": ai_text,
             "session_id": session_id,
-            "transactions_count": len(transactions)
+            "transactions_count": transactions_count
         }
+        await llm_cache.store("advice", current_user.id, digest, response)
+        return response
     except HTTPException:
         raise
     except Exception as e:
@@ -147,15 +166,23 @@ async def get_finance_motivation(
                 "Не начинай с фраз вроде 'На основе ваших данных'."
             )
 
-        ai_result = send_chat_message_to_chatgpt(ChatMessage(message=prompt))
+        # The prompt holds every input of the answer (aims, progress, completion)
+        digest = llm_cache.fingerprint(prompt, len(aims))
+        cached = await llm_cache.lookup("motivation", current_user.id, digest)
+        if cached is not None:
+            return cached
+
+        ai_result = await send_chat_message_to_chatgpt(ChatMessage(message=prompt))
         ai_text = ai_result.get("response", "")
         session_id = ai_result.get("session_id")
 
-        return {
+        response = {
             "motivation": ai_text.strip(),
             "session_id": session_id,
             "aims_count": len(aims),
         }
+        await llm_cache.store("motivation", current_user.id, digest, response)
+        return response
 
     except HTTPException:
         raise
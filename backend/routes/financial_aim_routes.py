@@ -1,12 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Session
-from sqlalchemy import extract
+from sqlalchemy import select
 from typing import List
 from database import get_db
 from models import FinancialAim, FinancialAimWithTx, FinancialAimSchema
 from schemas.financial_aims import FinancialAimCreate, FinancialAimResponse, FinancialAimUpdate
 from routes.user_routes import get_current_user
+from services import feature_store, ledger, llm_cache
 
 router = APIRouter(prefix="/financial-aims", tags=["Financial Aims"])
 
@@ -24,7 +24,11 @@ async def create_financial_aim(
 
     new_aim = FinancialAim(**aim.dict(), user_id=current_user.id)
     db.add(new_aim)
+    await db.flush()
+    await ledger.record_opening(db, ledger.ACCOUNT_AIM, new_aim.id, new_aim.current_amount)
+    await feature_store.mark_user_dirty(db, current_user.id)
     await db.commit()
+    await llm_cache.invalidate_user(current_user.id)
     await db.refresh(new_aim)
 
     return new_aim
@@ -38,9 +42,6 @@ async def get_financial_aims(
 ):
     print(current_user.id)
 
-    # Use SQLAlchemy 2.0 style with select()
-    from sqlalchemy import select
-
     stmt = select(FinancialAim).filter(FinancialAim.user_id == current_user.id)
     result = await db.execute(stmt)
     aims = result.scalars().all()
@@ -55,8 +56,6 @@ async def get_financial_aim(
         db: AsyncSession = Depends(get_db),
         current_user=Depends(get_current_user)
 ):
-    from sqlalchemy import select
-
     stmt = select(FinancialAim).where(
         FinancialAim.id == aim_id,
         FinancialAim.user_id == current_user.id
@@ -72,16 +71,18 @@ async def get_financial_aim(
 
 # 🟠 Update aim
 @router.put("/{aim_id}", response_model=FinancialAimResponse)
-def update_financial_aim(
+async def update_financial_aim(
         aim_id: int,
         updated_aim: FinancialAimUpdate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_db),
         current_user=Depends(get_current_user)
 ):
-    aim = db.query(FinancialAim).filter(
+    stmt = select(FinancialAim).where(
         FinancialAim.id == aim_id,
         FinancialAim.user_id == current_user.id
-    ).first()
+    )
+    result = await db.execute(stmt)
+    aim = result.scalar_one_or_none()
 
     if not aim:
         raise HTTPException(status_code=404, detail="Financial aim not found")
@@ -89,28 +90,34 @@ def update_financial_aim(
     for field, value in updated_aim.dict(exclude_unset=True).items():
         setattr(aim, field, value)
 
-    db.commit()
-    db.refresh(aim)
+    await feature_store.mark_user_dirty(db, current_user.id)
+    await db.commit()
+    await llm_cache.invalidate_user(current_user.id)
+    await db.refresh(aim)
     return aim
 
 
 # 🔴 Delete aim
 @router.delete("/{aim_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_financial_aim(
+async def delete_financial_aim(
         aim_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_db),
         current_user=Depends(get_current_user)
 ):
-    aim = db.query(FinancialAim).filter(
+    stmt = select(FinancialAim).where(
         FinancialAim.id == aim_id,
         FinancialAim.user_id == current_user.id
-    ).first()
+    )
+    result = await db.execute(stmt)
+    aim = result.scalar_one_or_none()
 
     if not aim:
         raise HTTPException(status_code=404, detail="Financial aim not found")
 
-    db.delete(aim)
-    db.commit()
+    await db.delete(aim)
+    await feature_store.mark_user_dirty(db, current_user.id)
+    await db.commit()
+    await llm_cache.invalidate_user(current_user.id)
     return
 
 
@@ -1,8 +1,8 @@
 # ...existing code...
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
+from sqlalchemy import insert, select
+from typing import Dict, List, Tuple
 from datetime import datetime
 from pydantic import BaseModel
 from typing import Optional
@@ -10,9 +10,13 @@ from typing import Optional
 from database import get_db
 from models import FinancialTransaction, FinancialTransactionType, FinancialAim, BankAccount
 from routes.user_routes import get_current_user
+from services import feature_store, ledger, llm_cache, rollups
 
 router = APIRouter(prefix="/financial-transaction", tags=["Financial Transactions"])
 
+# Transfers accepted by one /batch request
+MAX_BATCH_TRANSFERS = 10000
+
 # Pydantic models
 class TransactionBase(BaseModel):
     amount: float
@@ -35,73 +39,221 @@ class FinancialTransactionResponse(TransactionBase):
     class Config:
         orm_mode = True
 
-@router.post("/", response_model=FinancialTransactionResponse)
-async def create_financial_transaction(
-    transaction: FinancialTransactionCreate,
-    db: AsyncSession = Depends(get_db),
-    current_user = Depends(get_current_user)
-):
-    # Load user's bank account
-    result = await db.execute(
-        select(BankAccount).where(BankAccount.user_id == current_user.id)
-    )
-    bank_account = result.scalar_one_or_none()
-    if not bank_account:
-        raise HTTPException(status_code=404, detail="Bank account not found")
+class FinancialTransactionBatchCreate(BaseModel):
+    transactions: List[FinancialTransactionCreate]
+
+class AimBalance(BaseModel):
+    id: int
+    current_amount: float
+    is_completed: bool
 
-    # Load financial aim (belongs to current user)
+    class Config:
+        orm_mode = True
+
+class FinancialTransactionBatchResponse(BaseModel):
+    transactions: List[FinancialTransactionResponse]
+    bank_account_balance: float
+    aims: List[AimBalance]
+
+
+async def load_accounts(
+        db: AsyncSession, user_id: int, aim_ids: List[int]
+) -> Tuple[Optional[BankAccount], Dict[int, FinancialAim]]:
+    """The user's bank account and their aims among aim_ids, by id. Nothing is locked."""
+    bank_account = (await db.execute(
+        select(BankAccount).where(BankAccount.user_id == user_id)
+    )).scalar_one_or_none()
     result = await db.execute(
-        select(FinancialAim).where(
-            FinancialAim.id == transaction.aim_id,
-            FinancialAim.user_id == current_user.id
-        )
+        select(FinancialAim).where(FinancialAim.id.in_(aim_ids), FinancialAim.user_id == user_id)
     )
-    aim = result.scalar_one_or_none()
-    if not aim:
-        raise HTTPException(status_code=404, detail="Financial aim not found")
+    return bank_account, {aim.id: aim for aim in result.scalars().all()}
+
 
-    # Basic validation
-    if transaction.amount <= 0:
+def apply_transfer(balances: Dict[Tuple[str, int], float], bank_account: BankAccount, aim: FinancialAim,
+                   amount: float, transaction_type: FinancialTransactionType) -> None:
+    """
+    Move amount between the ledger balances of the account and the aim (keyed by
+    (ledger account type, id)), or raise the HTTPException explaining why not
+    """
+    if amount <= 0:
         raise HTTPException(status_code=400, detail="Amount must be greater than zero")
+    bank_key, aim_key = (ledger.ACCOUNT_BANK, bank_account.id), (ledger.ACCOUNT_AIM, aim.id)
 
-    # Apply transaction: deposit = move from bank -> aim, withdrawal = move from aim -> bank
-    if transaction.transaction_type == FinancialTransactionType.DEPOSIT:
-        if bank_account.balance < transaction.amount:
+    # deposit = move from bank -> aim, withdrawal = move from aim -> bank
+    if transaction_type == FinancialTransactionType.DEPOSIT:
+        if balances[bank_key] < amount:
             raise HTTPException(status_code=400, detail="Insufficient funds in bank account")
-        bank_account.balance -= transaction.amount
-        aim.current_amount += transaction.amount
+        balances[bank_key] -= amount
+        balances[aim_key] += amount
 
-    elif transaction.transaction_type == FinancialTransactionType.WITHDRAWAL:
-        if aim.current_amount < transaction.amount:
+    elif transaction_type == FinancialTransactionType.WITHDRAWAL:
+        if balances[aim_key] < amount:
             raise HTTPException(status_code=400, detail="Insufficient funds in aim account")
-        bank_account.balance += transaction.amount
-        aim.current_amount -= transaction.amount
+        balances[bank_key] += amount
+        balances[aim_key] -= amount
 
     else:
         raise HTTPException(status_code=400, detail="Unsupported financial transaction type")
 
-    if aim.current_amount >= aim.target_amount:
+    if balances[aim_key] >= aim.target_amount and not aim.is_completed:
         aim.is_completed = True
 
-    # Create DB record
-    db_transaction = FinancialTransaction(
-        amount=transaction.amount,
-        transaction_type=transaction.transaction_type,
-        aim_id=transaction.aim_id,
-        bank_account_id=bank_account.id
-    )
 
-    db.add(db_transaction)
-    db.add(aim)
+async def record_transfers(db: AsyncSession, user_id: int, transactions: List[FinancialTransactionCreate],
+                           numbered: bool) -> dict:
+    """
+    Check the transfers in order against the ledger balances and record them (caller
+    commits). Errors of a numbered transfer carry its index. Returns the created rows,
+    the bank account balance and the aims with their balances afterwards.
+    """
+    aim_ids = sorted({t.aim_id for t in transactions})
+    bank_account, aims = await load_accounts(db, user_id, aim_ids)
+    if not bank_account:
+        raise HTTPException(status_code=404, detail="Bank account not found")
+    missing = [aim_id for aim_id in aim_ids if aim_id not in aims]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Financial aims not found: {missing}" if numbered
+                            else "Financial aim not found")
+    balances = {(ledger.ACCOUNT_BANK, bank_account.id): await ledger.balance(db, ledger.ACCOUNT_BANK, bank_account.id)}
+    for aim_id, total in (await ledger.balances(db, ledger.ACCOUNT_AIM, aim_ids)).items():
+        balances[(ledger.ACCOUNT_AIM, aim_id)] = total
+
+    for index, transaction in enumerate(transactions):
+        try:
+            apply_transfer(balances, bank_account, aims[transaction.aim_id], transaction.amount,
+                           transaction.transaction_type)
+        except HTTPException as e:
+            if not numbered:
+                raise
+            raise HTTPException(status_code=e.status_code, detail=f"Transaction {index}: {e.detail}")
+
+    created = []
+    if transactions:
+        # One multi-row INSERT; created_at comes back for the rollups, the ledger and the response
+        result = await db.execute(
+            insert(FinancialTransaction).returning(
+                FinancialTransaction.id, FinancialTransaction.amount, FinancialTransaction.transaction_type,
+                FinancialTransaction.created_at, FinancialTransaction.updated_at,
+                FinancialTransaction.bank_account_id, FinancialTransaction.aim_id,
+                sort_by_parameter_order=True,
+            ),
+            [
+                {"amount": t.amount, "transaction_type": t.transaction_type, "aim_id": t.aim_id,
+                 "bank_account_id": bank_account.id}
+                for t in transactions
+            ],
+        )
+        created = result.all()
+        await rollups.record_aim_transfers(db, user_id, created)
+        await ledger.record_transfers(db, bank_account.id, created)
+        await feature_store.mark_user_dirty(db, user_id)
+
+    return {
+        "transactions": created,
+        "bank_account_id": bank_account.id,
+        "bank_account_balance": balances[(ledger.ACCOUNT_BANK, bank_account.id)],
+        "aims": [
+            {"id": aim_id, "current_amount": balances[(ledger.ACCOUNT_AIM, aim_id)],
+             "is_completed": aims[aim_id].is_completed}
+            for aim_id in aim_ids
+        ],
+    }
+
+
+async def transfer(db: AsyncSession, user_id: int, transactions: List[FinancialTransactionCreate],
+                   numbered: bool) -> dict:
+    """
+    Record the transfers in a serializable transaction, then refresh the cached
+    balance columns of the accounts involved outside of it
+    """
+    recorded = await ledger.run_serializable(db, lambda: record_transfers(db, user_id, transactions, numbered))
+    await llm_cache.invalidate_user(user_id)
+    if recorded["transactions"]:
+        await ledger.refresh_after_transfer(db, recorded["bank_account_id"], [aim["id"] for aim in recorded["aims"]])
+    return recorded
+
+
+@router.post("/", response_model=FinancialTransactionResponse)
+async def create_financial_transaction(
+    transaction: FinancialTransactionCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    recorded = await transfer(db, current_user.id, [transaction], numbered=False)
+    return recorded["transactions"][0]
+
+@router.post("/batch", response_model=FinancialTransactionBatchResponse)
+async def create_financial_transactions_batch(
+    batch: FinancialTransactionBatchCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Apply many aim deposits and withdrawals in order, atomically: either all of them
+    are recorded or, if one is invalid (its index is in the error), none is.
+    """
+    if len(batch.transactions) > MAX_BATCH_TRANSFERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_TRANSFERS} transactions per batch")
+
+    return await transfer(db, current_user.id, batch.transactions, numbered=True)
 
-    # commit and refresh
-    await db.commit()
-    await db.refresh(db_transaction)
-    # optionally refresh updated objects if needed
-    await db.refresh(aim)
-    await db.refresh(bank_account)
+@router.get("/balance")
+async def get_balances(
+    as_of: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Balances of the user's bank account and aims at as_of (now if omitted), from the ledger"""
+    as_of = ledger.naive_utc(as_of)
+    bank_account_ids = (await db.execute(
+        select(BankAccount.id).where(BankAccount.user_id == current_user.id)
+    )).scalars().all()
+    if not bank_account_ids:
+        raise HTTPException(status_code=404, detail="Bank account not found")
+    aim_ids = (await db.execute(
+        select(FinancialAim.id).where(FinancialAim.user_id == current_user.id).order_by(FinancialAim.id)
+    )).scalars().all()
+
+    bank_balances = await ledger.balances(db, ledger.ACCOUNT_BANK, bank_account_ids, as_of)
+    aim_balances = await ledger.balances(db, ledger.ACCOUNT_AIM, aim_ids, as_of)
+    return {
+        "as_of": as_of,
+        "bank_account_balance": sum(bank_balances.values()),
+        "aims": [{"id": aim_id, "current_amount": aim_balances[aim_id]} for aim_id in aim_ids],
+    }
+
+@router.get("/balance/history")
+async def get_balance_history(
+    start: datetime,
+    end: Optional[datetime] = None,
+    points: int = Query(30, ge=2, le=1000),
+    aim_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Balance of the bank account (or of aim_id) at `points` evenly spaced times from start to end (now)"""
+    if aim_id is None:
+        account_type = ledger.ACCOUNT_BANK
+        query = select(BankAccount.id).where(BankAccount.user_id == current_user.id)
+    else:
+        account_type = ledger.ACCOUNT_AIM
+        query = select(FinancialAim.id).where(FinancialAim.id == aim_id, FinancialAim.user_id == current_user.id)
+    account_id = (await db.execute(query)).scalars().first()
+    if account_id is None:
+        raise HTTPException(status_code=404, detail="Bank account not found" if aim_id is None else "Financial aim not found")
 
-    return db_transaction
+    start = ledger.naive_utc(start)
+    end = ledger.naive_utc(end) or await ledger.database_now(db)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    step = (end - start) / (points - 1)
+    times = [start + step * i for i in range(points - 1)] + [end]
+    balances = await ledger.history(db, account_type, account_id, times)
+    return {
+        "account_type": account_type,
+        "account_id": account_id,
+        "points": [{"at": at, "balance": balance} for at, balance in zip(times, balances)],
+    }
 
 @router.get("/{aim_id}", response_model=List[FinancialTransactionResponse])
 async def get_aim_transactions(
@@ -1,23 +1,31 @@
 # routes/transaction.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.params import Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from database import get_db
+from database import async_session, get_db
 from models import Transaction, TransactionType
-from schemas.transaction import TransactionCreate, TransactionResponse, TranscationGenerationRequest
+from schemas.transaction import (
+    BulkTransactionGenerationRequest, TransactionCreate, TransactionResponse, TranscationGenerationRequest
+)
 from models import User
-from app_config import X_LITELLM_API_KEY, X_LITELLM_API_URL
+from services import bulk_data, llm_cache, rollups
 from routes.user_routes import get_current_user
-from sqlalchemy import select, func, desc
+from sqlalchemy import select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
-import requests
 from datetime import date, datetime, timedelta
+import base64
+import json
 import random
 
 router = APIRouter(prefix="/transactions", tags=["Transactions"])
 
+MAX_PAGE_SIZE = 1000
+# Rows fetched per round trip when streaming
+STREAM_CHUNK_ROWS = 1000
+
 TRANSACTION_CATEGORIES = [
     "Groceries", "Shopping", "Bills", "Entertainment",
     "Transport", "Healthcare", "Education", "Utilities",
@@ -34,38 +42,21 @@ async def generate_fake_transaction(data: TranscationGenerationRequest, db: Asyn
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    headers = {
-        "x-litellm-api-key": f"{X_LITELLM_API_KEY}",
-        "accept": "application/json",
-        "Authorization": f"Bearer {X_LITELLM_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    # reqData = {
-    #     "model": "gpt-4o-mini",
-    #     "messages": [
+    # response = await llm_client.chat_completion(
+    #     [
     #         {"role": "system", "content": ""},
     #         {"role": "user",
     #          "content": f"Generate me {data.count} fake bank transactions descriptions divided by space, without anything only the descriptiions devided by whitespaces not like numbered list, without anything."}
     #     ],
-    #     "temperature": 0.7
-    # }
-    #
-    # response = requests.post(
-    #     f"{BASE_URL}/engines/gpt-4o-mini/chat/completions",
-    #     headers=headers,
-    #     json=reqData
+    #     temperature=0.7,
     # )
-    #
-    # if response.status_code == 200:
-    #     result = response.json()
-    #     response = result["choices"][0]["message"]["content"]
 
     # descriptions = response.split(" ")
     # if len(descriptions) < data.count:
     # description = descriptions + descriptions
     # Create fake transactions
     fake_transaction = None
+    fake_transactions = []
     for i in range(data.count):
         # Generate random amount
         amount = round(random.uniform(10, 1000), 2)
@@ -89,16 +80,7 @@ async def generate_fake_transaction(data: TranscationGenerationRequest, db: Asyn
 
         fake_transaction = Transaction(
             amount=amount,
-            description=random.choice(["Purchase",
-                                       "Payment",
-                                       "Fee",
-                                       "Service",
-                                       "Store",
-                                       "Supplies",
-                                       "Subscription",
-                                       "Online",
-                                       "Bill",
-                                       "Charge"]),
+            description=random.choice(bulk_data.TRANSACTION_DESCRIPTIONS),
             transaction_type=transaction_type,
             user_id=user.id,
             created_at=random_created_at,
@@ -106,9 +88,13 @@ async def generate_fake_transaction(data: TranscationGenerationRequest, db: Asyn
         )
 
         db.add(fake_transaction)
+        fake_transactions.append(fake_transaction)
+
+    await rollups.record_transactions(db, fake_transactions)
 
     # Commit once after all transactions are added
     await db.commit()
+    await llm_cache.invalidate_user(user.id)
 
     # Refresh the last transaction to return it
     if fake_transaction:
@@ -117,17 +103,51 @@ async def generate_fake_transaction(data: TranscationGenerationRequest, db: Asyn
     return fake_transaction
 
 
-# 🟡 Get All Transactions of the Current User
-@router.get("/", response_model=List[TransactionResponse])
-async def get_user_transactions(
-        db: AsyncSession = Depends(get_db),
-        current_user=Depends(get_current_user),
-        date_from: Optional[date] = Query(None, description="Start date (YYYY-MM-DD)"),
-        date_to: Optional[date] = Query(None, description="End date (YYYY-MM-DD)"),
-        description: Optional[str] = Query(None, description="Filter by category description"),
-        txType: Optional[str] = Query(None, description="Filter by transaction type"),
-):
-    query = select(Transaction).filter(Transaction.user_id == current_user.id)
+@router.post("/generate/bulk")
+async def generate_bulk_transactions(data: BulkTransactionGenerationRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Insert `count` random transactions for load tests, batch by batch without the ORM.
+    Returns the rows written, the elapsed seconds and rows per second.
+    """
+    if data.count <= 0 or data.batch_size <= 0:
+        raise HTTPException(status_code=400, detail="count and batch_size must be positive")
+
+    if data.user_ids is None:
+        user_ids = (await db.execute(select(User.id))).scalars().all()
+    else:
+        user_ids = (await db.execute(select(User.id).where(User.id.in_(data.user_ids)))).scalars().all()
+        if len(user_ids) != len(set(data.user_ids)):
+            raise HTTPException(status_code=404, detail="User not found")
+    if not user_ids:
+        raise HTTPException(status_code=404, detail="No users to generate transactions for")
+
+    return await bulk_data.generate_transactions(
+        db, user_ids, data.count, seed=data.seed, batch_size=data.batch_size
+    )
+
+
+def _encode_cursor(created_at: datetime, transaction_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at.isoformat(), transaction_id]).encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(transaction_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Columns of TransactionResponse, selected directly so streaming skips ORM objects
+_RESPONSE_COLUMNS = (
+    Transaction.id, Transaction.amount, Transaction.description, Transaction.transaction_type,
+    Transaction.created_at, Transaction.updated_at, Transaction.user_id,
+)
+
+
+def _transactions_query(user_id, date_from, date_to, description, txType, cursor, *columns):
+    """Filtered transactions of the user, newest first (keyset order: created_at, id)"""
+    query = select(*columns).filter(Transaction.user_id == user_id)
 
     if date_from:
         # Convert date to datetime at midnight
@@ -145,8 +165,66 @@ async def get_user_transactions(
         if txType == 'withdrawal':
             query = query.filter(Transaction.transaction_type == TransactionType.WITHDRAWAL)
 
+    if cursor:
+        # Continue strictly after the last row of the previous page
+        query = query.filter(tuple_(Transaction.created_at, Transaction.id) < tuple_(*_decode_cursor(cursor)))
+
+    return query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+
+
+def _row_to_json(row) -> str:
+    return json.dumps({
+        "id": row.id,
+        "amount": row.amount,
+        "description": row.description,
+        "transaction_type": row.transaction_type.value,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+        "user_id": row.user_id,
+    }, ensure_ascii=False)
+
+
+# 🟡 Get All Transactions of the Current User
+@router.get("/", response_model=List[TransactionResponse])
+async def get_user_transactions(
+        response: Response,
+        db: AsyncSession = Depends(get_db),
+        current_user=Depends(get_current_user),
+        date_from: Optional[date] = Query(None, description="Start date (YYYY-MM-DD)"),
+        date_to: Optional[date] = Query(None, description="End date (YYYY-MM-DD)"),
+        description: Optional[str] = Query(None, description="Filter by category description"),
+        txType: Optional[str] = Query(None, description="Filter by transaction type"),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; the next page cursor is returned in X-Next-Cursor"),
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+        stream: bool = Query(False, description="Stream all matching rows as NDJSON"),
+):
+    filters = (current_user.id, date_from, date_to, description, txType, cursor)
+
+    if stream:
+        query = _transactions_query(*filters, *_RESPONSE_COLUMNS)
+        if limit:
+            query = query.limit(limit)
+
+        async def rows():
+            # Server-side cursor on a session of our own: the response outlives the request's session
+            async with async_session() as stream_db:
+                result = await stream_db.stream(query.execution_options(yield_per=STREAM_CHUNK_ROWS))
+                async for chunk in result.partitions():
+                    yield "".join(_row_to_json(row) + "\n" for row in chunk)
+
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    query = _transactions_query(*filters, Transaction)
+    if limit:
+        query = query.limit(limit + 1)
+
     result = await db.execute(query)
     transactions = result.scalars().all()
+
+    if limit and len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        response.headers["X-Next-Cursor"] = _encode_cursor(last.created_at, last.id)
     return transactions
 
 
@@ -155,20 +233,8 @@ async def get_user_tx_categories(
         db: AsyncSession = Depends(get_db),
         current_user=Depends(get_current_user),
 ):
-    query = (
-        select(Transaction.description, func.count(Transaction.id).label("count"))
-        .filter(Transaction.user_id == current_user.id)
-        .group_by(Transaction.description)
-        .order_by(desc("count"))
-        .limit(10)
-    )
-
-    result = await db.execute(query)
-    rows = result.all()
-
-    # extract only category names sorted by frequency
-    categories = [row[0] for row in rows]
-    return categories
+    # category names sorted by frequency, from the monthly rollups
+    return await rollups.top_categories(db, current_user.id, limit=10)
 
 
 # 🟣 Get Transaction by ID for the Current User
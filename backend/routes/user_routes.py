@@ -1,3 +1,7 @@
+import time
+from dataclasses import dataclass
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -5,20 +9,54 @@ from sqlalchemy.orm import selectinload
 from jose import JWTError, jwt
 from database import get_db
 from models import User
-from app_config import SECRET_KEY, ALGORITHM
+from app_config import SECRET_KEY, ALGORITHM, AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL, AUTH_STRICT
 from auth import oauth2_scheme
+from services.llm_cache import MemoryBackend
 from models import TransactionType  # Update import path based on your structure
 
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
 
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """What routes need of the caller; built from token claims or the users row"""
+    id: int
+    iin: str
+    email: str
+
+
+# Decoded tokens ("token:<jwt>") and users rows ("user:<id>"), dropped by invalidate_cached_user
+_auth_cache = MemoryBackend(max_entries=AUTH_CACHE_MAX_ENTRIES)
+
+
+def invalidate_cached_user(user_id: int) -> None:
+    """
+    Forget cached tokens and row of the user; call when a users row is created
+    (its id may be a deleted user's), changed or deleted.
+    """
+    _auth_cache.invalidate_user(user_id)
+
+
+async def _load_user(db: AsyncSession, payload: dict) -> Optional[AuthenticatedUser]:
+    uid = payload.get("uid")
+    query = select(User.id, User.iin, User.email)
+    query = query.where(User.id == uid) if uid is not None else query.where(User.iin == payload["sub"])
+    row = (await db.execute(query)).one_or_none()
+    if row is None or row.iin != payload["sub"]:
+        return None
+    return AuthenticatedUser(id=row.id, iin=row.iin, email=row.email)
+
+
 async def get_current_user(
         token: str = Depends(oauth2_scheme),
         db: AsyncSession = Depends(get_db)
 ):
     """
     Extracts current user from JWT token in Authorization header.
+
+    Tokens carry the user id, so unless AUTH_STRICT is set the users row is only
+    read once per AUTH_CACHE_TTL per user; decoded tokens are cached as well.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -26,17 +64,33 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        sub: str = payload.get("sub")
-        if sub is None:
+    now = time.time()
+    payload = None if AUTH_STRICT else _auth_cache.get(f"token:{token}")
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            sub: str = payload.get("sub")
+            if sub is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
 
-    result = await db.execute(select(User).where(User.iin == sub))
-    user = result.scalar_one_or_none()
-    if user is None:
+    if AUTH_STRICT:
+        user = await _load_user(db, payload)
+    else:
+        uid = payload.get("uid")
+        user = _auth_cache.get(f"user:{uid}") if uid is not None else None
+        if user is None:
+            user = await _load_user(db, payload)
+            if user is not None:
+                _auth_cache.set(f"user:{user.id}", user.id, user, AUTH_CACHE_TTL)
+        if user is not None:
+            # jose checked exp on decode; keep the decoded token no longer than it is valid
+            ttl = min(AUTH_CACHE_TTL, payload.get("exp", now) - now)
+            if ttl > 0:
+                _auth_cache.set(f"token:{token}", user.id, payload, ttl)
+
+    if user is None or user.iin != payload["sub"]:
         raise HTTPException(status_code=404, detail="User not found")
 
     return user
@@ -44,7 +98,7 @@ async def get_current_user(
 
 @router.get("/me")
 async def read_users_me(
-        current_user: User = Depends(get_current_user),
+        current_user: AuthenticatedUser = Depends(get_current_user),
         db: AsyncSession = Depends(get_db)
 ):
     # Refresh the user with eager loading
@@ -72,7 +126,8 @@ import random
 from datetime import datetime, timedelta
 from models import User, BankAccount, Transaction, FinancialAim, TransactionType
 from schemas.user import UserCreate
-from auth import hash_password
+from auth import hash_password_async
+from services import ledger, rollups
 
 @router.post("/generate-test-data", response_model=List[dict])
 async def generate_test_data(
@@ -82,6 +137,12 @@ async def generate_test_data(
     """Generate test users with bank accounts, aims and transactions for development."""
 
     created_users = []
+    transactions = []
+    bank_accounts = []
+    all_aims = []
+
+    # All test users share one password, so hash it once
+    test_password_hash = await hash_password_async("testpass123")
 
     # Use only enum values that exist in DB enum type (avoid DB enum mismatch)
     regular_transactions = [
@@ -95,7 +156,7 @@ async def generate_test_data(
         user = User(
             iin=f"{random.randint(100000000000, 999999999999)}",
             email=f"test{i}_{random.randint(1000,9999)}@example.com",
-            hashed_password=hash_password("testpass123")
+            hashed_password=test_password_hash
         )
         db.add(user)
         await db.flush()  # populate user.id
@@ -108,6 +169,7 @@ async def generate_test_data(
         )
         db.add(bank_account)
         await db.flush()  # populate bank_account.id
+        bank_accounts.append(bank_account)
 
         # Create financial aims
         aims = []
@@ -124,6 +186,7 @@ async def generate_test_data(
             db.add(aim)
             aims.append(aim)
         await db.flush()
+        all_aims.extend(aims)
 
         # Generate random transactions
         for _ in range(40):
@@ -150,6 +213,7 @@ async def generate_test_data(
                     aim.current_amount = max(0, (aim.current_amount or 0) - amount)
 
             db.add(txn)
+            transactions.append(txn)
 
         created_users.append({
             "id": user.id,
@@ -158,5 +222,13 @@ async def generate_test_data(
             "bank_account_number": bank_account.account_number
         })
 
+    await rollups.record_transactions(db, transactions)
+    # Final balances, as the aims were funded in place
+    for bank_account in bank_accounts:
+        await ledger.record_opening(db, ledger.ACCOUNT_BANK, bank_account.id, bank_account.balance)
+    for aim in all_aims:
+        await ledger.record_opening(db, ledger.ACCOUNT_AIM, aim.id, aim.current_amount)
     await db.commit()
+    for user in created_users:
+        invalidate_cached_user(user["id"])
     return created_users
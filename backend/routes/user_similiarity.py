@@ -1,222 +1,73 @@
-from dataclasses import dataclass
+import json
 from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
+from typing import AsyncIterator, List, Dict, Literal, Optional, Tuple, Union
 
 import numpy as np
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 from auth import oauth2_scheme
 from app_config import SECRET_KEY, ALGORITHM
 from database import get_db
-from models import User, BankAccount, FinancialTransaction, FinancialAim, FinancialTransactionType
+from models import FinancialAim
+from services import feature_snapshot, feature_stats, feature_store, rollups, similarity_index
+from services.similarity_index import top_k
+from services.user_similiarity import FEATURE_NAMES, UserFinancialProfile, profile_to_vector
 from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
-from sqlalchemy import func, case
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 
-@dataclass
-class UserFinancialProfile:
-    user_id: int
-    # Account metrics
-    total_balance: float
-    num_accounts: int
-    avg_account_age_days: float
-
-    # Transaction metrics
-    total_transactions: int
-    total_deposit: float
-    total_withdrawal: float
-    avg_transaction_amount: float
-    transaction_frequency: float  # transactions per day
-
-    # Financial aims metrics
-    num_aims: int
-    total_target_amount: float
-    total_current_amount: float
-    completion_rate: float
-    avg_aim_progress: float
-    num_completed_aims: int
-
-    # Behavioral patterns
-    savings_rate: float  # current_amount / target_amount
-    net_flow: float  # deposits - withdrawals
-
-
 class UserSimilarityService:
     """Service to calculate user similarity based on financial behavior"""
 
     def __init__(self, db: AsyncSession):
         self.db = db
 
+    async def get_user_profiles(self, user_ids: Optional[List[int]] = None) -> List[UserFinancialProfile]:
+        """Financial profiles of many users (all if None), served from the feature store"""
+        return await feature_store.get_profiles(self.db, user_ids)
+
     async def get_user_profile(self, user_id: int) -> UserFinancialProfile:
-        """Extract comprehensive financial profile for a user"""
-
-        # Get account metrics
-        account_query = select(
-            func.count(BankAccount.id).label('num_accounts'),
-            func.sum(BankAccount.balance).label('total_balance'),
-            func.avg(
-                func.extract('epoch', func.now() - BankAccount.created_at) / 86400
-            ).label('avg_account_age')
-        ).where(BankAccount.user_id == user_id)
-
-        account_result = await self.db.execute(account_query)
-        account_data = account_result.first()
-
-        transaction_query = select(
-            func.count(FinancialTransaction.id).label('total_transactions'),
-            func.sum(
-                case(
-                    (FinancialTransaction.transaction_type == FinancialTransactionType.DEPOSIT,
-                     FinancialTransaction.amount),
-                    else_=0
-                )
-            ).label('total_deposit'),
-            func.sum(
-                case(
-                    (FinancialTransaction.transaction_type == FinancialTransactionType.WITHDRAWAL,
-                     FinancialTransaction.amount),
-                    else_=0
-                )
-            ).label('total_withdrawal'),
-            func.avg(FinancialTransaction.amount).label('avg_transaction'),
-            func.min(FinancialTransaction.created_at).label('first_transaction')
-        ).join(BankAccount).where(BankAccount.user_id == user_id)
-
-        transaction_result = await self.db.execute(transaction_query)
-        transaction_data = transaction_result.first()
-
-        avg_progress = func.avg(
-            case(
-                (FinancialAim.target_amount != 0, FinancialAim.current_amount / FinancialAim.target_amount * 100),
-                else_=0
-            )
-        ).label('avg_progress')
-
-        aims_query = select(
-            func.count(FinancialAim.id).label('num_aims'),
-            func.sum(FinancialAim.target_amount).label('total_target'),
-            func.sum(FinancialAim.current_amount).label('total_current'),
-            func.sum(
-                case((FinancialAim.is_completed == True, 1), else_=0)
-            ).label('num_completed'),
-            avg_progress
-        ).where(FinancialAim.user_id == user_id)
-
-        aims_result = await self.db.execute(aims_query)
-        aims_data = aims_result.first()
-
-        # # Get username
-        # user_query = select(User.iin).where(User.id == user_id)
-        # user_result = await self.db.execute(user_query)
-        # iin = user_result.scalar_one_or_none()
-
-        # Calculate derived metrics
-        num_accounts = account_data.num_accounts or 0
-        total_balance = float(account_data.total_balance or 0)
-        avg_account_age = float(account_data.avg_account_age or 0)
-
-        total_transactions = transaction_data.total_transactions or 0
-        total_deposit = float(transaction_data.total_deposit or 0)
-        total_withdrawal = float(transaction_data.total_withdrawal or 0)
-        avg_transaction = float(transaction_data.avg_transaction or 0)
-
-        # Calculate transaction frequency
-        first_transaction = transaction_data.first_transaction
-        if first_transaction and total_transactions > 0:
-            days_active = (datetime.now() - first_transaction).days or 1
-            transaction_frequency = total_transactions / days_active
-        else:
-            transaction_frequency = 0
-
-        num_aims = aims_data.num_aims or 0
-        total_target = float(aims_data.total_target or 0)
-        total_current = float(aims_data.total_current or 0)
-        num_completed = aims_data.num_completed or 0
-        avg_progress = float(aims_data.avg_progress or 0)
-
-        completion_rate = (num_completed / num_aims * 100) if num_aims > 0 else 0
-        savings_rate = (total_current / total_target * 100) if total_target > 0 else 0
-        net_flow = total_deposit - total_withdrawal
-
-        return UserFinancialProfile(
-            user_id=user_id,
-            # username=username or f"User {user_id}",
-            total_balance=total_balance,
-            num_accounts=num_accounts,
-            avg_account_age_days=avg_account_age,
-            total_transactions=total_transactions,
-            total_deposit=total_deposit,
-            total_withdrawal=total_withdrawal,
-            avg_transaction_amount=avg_transaction,
-            transaction_frequency=transaction_frequency,
-            num_aims=num_aims,
-            total_target_amount=total_target,
-            total_current_amount=total_current,
-            completion_rate=completion_rate,
-            avg_aim_progress=avg_progress,
-            num_completed_aims=num_completed,
-            savings_rate=savings_rate,
-            net_flow=net_flow
-        )
+        """Financial profile of a single user"""
+        profiles = await self.get_user_profiles([user_id])
+        if not profiles:
+            raise HTTPException(status_code=404, detail="User not found")
+        return profiles[0]
 
     def profile_to_vector(self, profile: UserFinancialProfile) -> np.ndarray:
         """Convert user profile to feature vector for similarity calculation"""
-        return np.array([
-            profile.total_balance,
-            profile.num_accounts,
-            profile.avg_account_age_days,
-            profile.total_transactions,
-            profile.total_deposit,
-            profile.total_withdrawal,
-            profile.avg_transaction_amount,
-            profile.transaction_frequency,
-            profile.num_aims,
-            profile.total_target_amount,
-            profile.total_current_amount,
-            profile.completion_rate,
-            profile.avg_aim_progress,
-            profile.num_completed_aims,
-            profile.savings_rate,
-            profile.net_flow
-        ])
+        return profile_to_vector(profile)
 
     async def get_three_month_finances(self, user_id: int) -> Dict[str, float]:
         """Get income and outcome for last 3 months"""
-        three_months_ago = datetime.now() - timedelta(days=90)
-
-        query = select(
-            func.sum(case(
-                (FinancialTransaction.transaction_type == FinancialTransactionType.DEPOSIT,
-                 FinancialTransaction.amount),
-                else_=0
-            )).label('income'),
-            func.sum(case(
-                (FinancialTransaction.transaction_type == FinancialTransactionType.WITHDRAWAL,
-                 FinancialTransaction.amount),
-                else_=0
-            )).label('outcome')
-        ).join(BankAccount).where(
-            BankAccount.user_id == user_id,
-            FinancialTransaction.created_at >= three_months_ago
-        )
+        return (await self.get_three_month_finances_many([user_id]))[user_id]
 
-        result = await self.db.execute(query)
-        data = result.first()
+    async def get_three_month_finances_many(self, user_ids: List[int]) -> Dict[int, Dict[str, float]]:
+        """Income and outcome for last 3 months of several users, by user id"""
+        three_months_ago = datetime.now() - timedelta(days=90)
+        totals = await rollups.aim_transfer_totals_many(self.db, user_ids, three_months_ago)
 
         return {
-            'three_month_income': float(data.income or 0),
-            'three_month_outcome': float(data.outcome or 0)
+            user_id: {
+                'three_month_income': income,
+                'three_month_outcome': outcome
+            }
+            for user_id, (income, outcome) in totals.items()
         }
 
     async def get_aims_summary(self, user_id: int) -> Dict[str, List]:
         """Get detailed summary of completed and in-progress aims"""
-        query = select(FinancialAim).where(FinancialAim.user_id == user_id)
+        return (await self.get_aims_summaries([user_id]))[user_id]
+
+    async def get_aims_summaries(self, user_ids: List[int]) -> Dict[int, Dict[str, List]]:
+        """Aims summaries of several users in one query, by user id"""
+        query = select(FinancialAim).where(FinancialAim.user_id.in_(user_ids)).order_by(FinancialAim.id)
         result = await self.db.execute(query)
         aims = result.scalars().all()
 
-        completed_aims = []
-        in_progress_aims = []
+        summaries = {user_id: {'completed_aims': [], 'in_progress_aims': []} for user_id in user_ids}
 
         for aim in aims:
             progress_percent = (aim.current_amount / aim.target_amount * 100) if aim.target_amount > 0 else 0
@@ -229,69 +80,110 @@ class UserSimilarityService:
             }
 
             if aim.is_completed:
-                completed_aims.append(aim_info)
+                summaries[aim.user_id]['completed_aims'].append(aim_info)
             else:
-                in_progress_aims.append(aim_info)
+                summaries[aim.user_id]['in_progress_aims'].append(aim_info)
 
-        return {
-            'completed_aims': completed_aims,
-            'in_progress_aims': in_progress_aims
-        }
+        return summaries
 
     async def find_similar_users(
             self,
             user_id: int,
-            top_n: int = 5
+            top_n: int = 5,
+            exact: bool = False
     ) -> List[Tuple[UserFinancialProfile, float]]:
         """Find the most similar users to a given user"""
+        # The rest of the population is kept fresh in the background
+        await feature_store.refresh_stale_features(self.db, [user_id])
+        if exact:
+            return await self._find_similar_users_exact(user_id, top_n)
+
+        state = await similarity_index.get_index_state(self.db)
+        target_vector = state.index.get_vector(user_id)
+        if target_vector is None:
+            return []
 
-        # Get all user IDs
-        users_query = select(User.id)
-        users_result = await self.db.execute(users_query)
-        all_user_ids = [row[0] for row in users_result.fetchall()]
-
-        # Get profiles for all users
-        profiles = []
-        vectors = []
+        ids, scores = state.index.query(target_vector, top_n, exclude=[user_id])
+        profiles = {p.user_id: p for p in await feature_store.load_profiles(self.db, ids.tolist())}
 
-        target_profile = None
-        target_vector = None
+        return [
+            (profiles[uid], float(score))
+            for uid, score in zip(ids.tolist(), scores)
+            if uid in profiles
+        ]
 
-        for uid in all_user_ids:
-            profile = await self.get_user_profile(uid)
-            vector = self.profile_to_vector(profile)
+    async def _find_similar_users_exact(
+            self,
+            user_id: int,
+            top_n: int
+    ) -> List[Tuple[UserFinancialProfile, float]]:
+        """Brute force comparison against every other user"""
 
-            if uid == user_id:
-                target_profile = profile
-                target_vector = vector
-            else:
-                profiles.append(profile)
-                vectors.append(vector)
+        # Shared snapshot brought up to date, normalized against the current stats snapshot
+        snapshot = await feature_snapshot.get_snapshot(self.db)
+        current = await feature_snapshot.load_current(self.db, snapshot)
+        stats = await feature_stats.get_snapshot(self.db)
 
-        if target_profile is None or len(profiles) == 0:
+        target = current.row(user_id)
+        if target is None or len(current) < 2:
             return []
 
-        # Normalize features
-        scaler = StandardScaler()
-        all_vectors = np.vstack([target_vector] + vectors)
-        normalized = scaler.fit_transform(all_vectors)
-
-        target_normalized = normalized[0].reshape(1, -1)
-        others_normalized = normalized[1:]
+        ids, normalized = current.normalized(stats.mean, stats.std)
 
-        # Calculate cosine similarity
-        similarities = cosine_similarity(target_normalized, others_normalized)[0]
+        # Calculate cosine similarity (rows are unit length)
+        similarities = normalized @ similarity_index.normalize_rows(target, stats.mean, stats.std)[0]
+        similarities[ids == user_id] = -np.inf
 
-        # Sort by similarity and get top N
-        similar_indices = np.argsort(similarities)[::-1][:top_n]
+        # Select the top N without sorting the whole population
+        similar_indices = top_k(similarities, min(top_n, len(ids) - 1))
 
         results = [
-            (profiles[idx], float(similarities[idx]))
+            (current.profile(int(ids[idx])), float(similarities[idx]))
             for idx in similar_indices
         ]
 
         return results
 
+    async def find_similar_users_batch(
+            self,
+            user_ids: Optional[List[int]],
+            top_n: int = 5
+    ) -> AsyncIterator[Dict[str, any]]:
+        """
+        Top-N neighbours for many users (all if None), normalized once for the whole batch.
+        Reads the feature store up front and returns an iterator that only does the math,
+        so results can be streamed after the DB session is released.
+        """
+        snapshot = await feature_snapshot.get_snapshot(self.db)
+        current = await feature_snapshot.load_current(self.db, snapshot)
+        stats = await feature_stats.get_snapshot(self.db)
+        ids, vectors = current.normalized(stats.mean, stats.std)
+        vectors = vectors.astype(np.float32)
+
+        if user_ids is None:
+            query_rows = np.arange(len(ids))
+        else:
+            query_rows = np.flatnonzero(np.isin(ids, np.asarray(user_ids, dtype=np.int64)))
+
+        async def results():
+            blocks = similarity_index.batch_top_k(vectors, query_rows, top_n)
+            while True:
+                # Matrix products release the GIL, keep them off the event loop
+                block = await run_in_threadpool(next, blocks, None)
+                if block is None:
+                    break
+                rows, neighbours, scores = block
+                for row, row_neighbours, row_scores in zip(rows, neighbours, scores):
+                    yield {
+                        "user_id": int(ids[row]),
+                        "similar_users": [
+                            {"user_id": int(ids[n]), "similarity_score": float(score)}
+                            for n, score in zip(row_neighbours, row_scores)
+                        ]
+                    }
+
+        return results()
+
     async def get_similarity_explanation(
             self,
             user1_id: int,
@@ -299,46 +191,18 @@ class UserSimilarityService:
     ) -> Dict[str, any]:
         """Get detailed explanation of why two users are similar using the same approach as find_similar_users"""
 
-        # Get all user IDs to maintain the same scaling context
-        users_query = select(User.id)
-        users_result = await self.db.execute(users_query)
-        all_user_ids = [row[0] for row in users_result.fetchall()]
-
-        # Get profiles and vectors for all users
-        profiles = []
-        vectors = []
-
-        user1_profile = None
-        user2_profile = None
-        user1_vector = None
-        user2_vector = None
-
-        # Collect all profiles to maintain consistent scaling
-        for uid in all_user_ids:
-            profile = await self.get_user_profile(uid)
-            vector = self.profile_to_vector(profile)
-
-            if uid == user1_id:
-                user1_profile = profile
-                user1_vector = vector
-            elif uid == user2_id:
-                user2_profile = profile
-                user2_vector = vector
-
-            profiles.append(profile)
-            vectors.append(vector)
+        # Only the two users are read; the stats snapshot provides the population scaling
+        profiles = {p.user_id: p for p in await self.get_user_profiles([user1_id, user2_id])}
+        user1_profile = profiles.get(user1_id)
+        user2_profile = profiles.get(user2_id)
 
         if not (user1_profile and user2_profile):
             raise HTTPException(status_code=404, detail="One or both users not found")
 
-        # Normalize using all users' data for consistent scaling
-        scaler = StandardScaler()
-        all_vectors = np.vstack(vectors)
-        normalized = scaler.fit_transform(all_vectors)
-
-        # Find indices of our users in the normalized array
-        user1_idx = all_user_ids.index(user1_id)
-        user2_idx = all_user_ids.index(user2_id)
+        snapshot = await feature_stats.get_snapshot(self.db)
+        vectors = [self.profile_to_vector(user1_profile), self.profile_to_vector(user2_profile)]
+        normalized = (np.vstack(vectors) - snapshot.mean) / snapshot.std
+        user1_idx, user2_idx = 0, 1
 
         # Calculate similarity using normalized vectors
         similarity = cosine_similarity(
@@ -347,17 +211,8 @@ class UserSimilarityService:
         )[0][0]
 
         # Calculate feature-wise comparisons
-        feature_names = [
-            'total_balance', 'num_accounts', 'avg_account_age_days',
-            'total_transactions', 'total_deposit', 'total_withdrawal',
-            'avg_transaction_amount', 'transaction_frequency',
-            'num_aims', 'total_target_amount', 'total_current_amount',
-            'completion_rate', 'avg_aim_progress', 'num_completed_aims',
-            'savings_rate', 'net_flow'
-        ]
-
         differences = {}
-        for i, feature in enumerate(feature_names):
+        for i, feature in enumerate(FEATURE_NAMES):
             norm_diff = abs(normalized[user1_idx][i] - normalized[user2_idx][i])
             raw_diff = abs(vectors[user1_idx][i] - vectors[user2_idx][i])
             avg = (vectors[user1_idx][i] + vectors[user2_idx][i]) / 2
@@ -372,15 +227,15 @@ class UserSimilarityService:
             }
 
         # Get additional information (same as find-similar)
-        finances1 = await self.get_three_month_finances(user1_id)
-        finances2 = await self.get_three_month_finances(user2_id)
-        aims_summary1 = await self.get_aims_summary(user1_id)
-        aims_summary2 = await self.get_aims_summary(user2_id)
+        finances = await self.get_three_month_finances_many([user1_id, user2_id])
+        aims_summaries = await self.get_aims_summaries([user1_id, user2_id])
+        finances1, finances2 = finances[user1_id], finances[user2_id]
+        aims_summary1, aims_summary2 = aims_summaries[user1_id], aims_summaries[user2_id]
 
         return {
             'similarity_score': float(similarity),
             'user1': {
-                **user1_profile.__dict__,
+                **user1_profile.to_dict(),
                 'three_month_summary': {
                     'income': finances1['three_month_income'],
                     'outcome': finances1['three_month_outcome'],
@@ -389,7 +244,7 @@ class UserSimilarityService:
                 'aims_summary': aims_summary1
             },
             'user2': {
-                **user2_profile.__dict__,
+                **user2_profile.to_dict(),
                 'three_month_summary': {
                     'income': finances2['three_month_income'],
                     'outcome': finances2['three_month_outcome'],
@@ -406,30 +261,56 @@ class UserSimilarityService:
 
 
 # FastAPI route example
-from fastapi import APIRouter, Depends, HTTPException
-
 router = APIRouter(prefix="/similarity", tags=["similarity"])
 
 
+class BatchSimilarityRequest(BaseModel):
+    user_ids: Union[List[int], Literal["all"]] = "all"
+    top_n: int = 5
+
+
+@router.post("/find-similar/batch")
+async def find_similar_users_batch(
+        request: BatchSimilarityRequest,
+        db: AsyncSession = Depends(get_db)
+):
+    """Top-N neighbours for many users at once, streamed as NDJSON (one user per line)"""
+    service = UserSimilarityService(db)
+    user_ids = None if request.user_ids == "all" else request.user_ids
+
+    results = await service.find_similar_users_batch(user_ids, request.top_n)
+
+    async def lines():
+        async for result in results:
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 # Update the route handler to include new information
 @router.get("/find-similar/{user_id}")
 async def find_similar_users(
         user_id: int,
         top_n: int = 5,
+        exact: bool = False,
         db: AsyncSession = Depends(get_db)
 ):
-    """Find users similar to the specified user"""
+    """Find users similar to the specified user (approximate unless exact=true)"""
     service = UserSimilarityService(db)
 
     try:
-        similar_users = await service.find_similar_users(user_id, top_n)
+        similar_users = await service.find_similar_users(user_id, top_n, exact)
+
+        # Additional information of all similar users, two queries each rather than per user
+        similar_ids = [profile.user_id for profile, _ in similar_users]
+        all_finances = await service.get_three_month_finances_many(similar_ids)
+        all_aims_summaries = await service.get_aims_summaries(similar_ids)
 
         # Enhance profile summaries with additional information
         enhanced_results = []
         for profile, score in similar_users:
-            # Get additional information
-            finances = await service.get_three_month_finances(profile.user_id)
-            aims_summary = await service.get_aims_summary(profile.user_id)
+            finances = all_finances[profile.user_id]
+            aims_summary = all_aims_summaries[profile.user_id]
 
             enhanced_results.append({
                 "user_id": profile.user_id,
@@ -460,6 +341,8 @@ async def find_similar_users(
             "user_id": user_id,
             "similar_users": enhanced_results
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -476,6 +359,8 @@ async def compare_users(
     try:
         comparison = await service.get_similarity_explanation(user1_id, user2_id)
         return comparison
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -490,6 +375,8 @@ async def get_user_financial_profile(
 
     try:
         profile = await service.get_user_profile(user_id)
-        return profile.__dict__
+        return profile.to_dict()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
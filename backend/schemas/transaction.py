@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from enum import Enum
 
@@ -39,6 +39,14 @@ class TranscationGenerationRequest(BaseModel):
     count: int
 
 
+class BulkTransactionGenerationRequest(BaseModel):
+    # All users when omitted
+    user_ids: Optional[List[int]] = None
+    count: int
+    seed: Optional[int] = None
+    batch_size: int = 10000
+
+
 class FinancialTransactionUpdate(BaseModel):
     amount: Optional[float]
     transaction_type: Optional[TransactionType]
@@ -0,0 +1,48 @@
+"""
+Recreate the balance ledger from financial_transactions and the balance columns.
+
+    cd backend
+    python scripts/backfill_ledger.py          # backfill and snapshot
+    python scripts/backfill_ledger.py --check  # only compare ledger and balance columns
+
+Run once, with the application stopped, after `alembic upgrade` created the
+tables. From then on the ledger is the source of truth and the balance columns
+are a cache of it: a backfill would rebuild the ledger from a possibly stale
+cache, so use --check to look for drift. Runs in one transaction.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import async_session, engine  # noqa: E402
+from services import ledger  # noqa: E402
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only report accounts whose ledger balance differs")
+    args = parser.parse_args()
+
+    engine.echo = False
+    started = time.perf_counter()
+    async with async_session() as db:
+        if not args.check:
+            postings = await ledger.backfill(db)
+            snapshots = await ledger.take_snapshots(db, min_postings=1, settle=0)
+            await db.commit()
+            print(f"{postings} postings, {snapshots} snapshots in {time.perf_counter() - started:.1f}s")
+        mismatches = await ledger.verify(db)
+    for account_type, account_id, column, posted in mismatches[:20]:
+        print(f"{account_type} {account_id}: balance {column}, ledger {posted}")
+    print(f"{len(mismatches)} accounts differ from the ledger")
+    await engine.dispose()
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,33 @@
+"""
+Recompute the monthly transaction rollups from the raw tables.
+
+    cd backend
+    python scripts/backfill_rollups.py
+
+Migration 0003 fills the table when it creates it; run this whenever rows
+were written outside the application. Runs in one transaction, so readers see
+either the old or the new rollups.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import async_session, engine  # noqa: E402
+from services import rollups  # noqa: E402
+
+
+async def main() -> None:
+    engine.echo = False
+    started = time.perf_counter()
+    async with async_session() as db:
+        count = await rollups.rebuild(db)
+        await db.commit()
+    print(f"{count} rollup rows in {time.perf_counter() - started:.1f}s")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""
+Print the query plan of each hot route query, to check which indexes they use.
+
+    cd backend
+    python scripts/explain_queries.py [--user-id N]
+
+PostgreSQL runs EXPLAIN (ANALYZE, BUFFERS) -- the queries are read-only; SQLite
+prints EXPLAIN QUERY PLAN. Without --user-id the user with the most
+transactions is used.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import case, desc, func, select, text  # noqa: E402
+
+from database import engine  # noqa: E402
+from models import (  # noqa: E402
+    BankAccount, FinancialAim, FinancialTransaction, FinancialTransactionType, Transaction, TransactionRollup, User,
+)
+from routes.transaction import _encode_cursor, _transactions_query  # noqa: E402
+from services import rollups  # noqa: E402
+
+
+async def _pick_user(conn) -> int:
+    row = (await conn.execute(
+        select(Transaction.user_id).group_by(Transaction.user_id).order_by(desc(func.count())).limit(1)
+    )).first()
+    if row is None:
+        row = (await conn.execute(select(User.id).limit(1))).first()
+    if row is None:
+        sys.exit("No users in the database")
+    return row[0]
+
+
+async def _route_queries(conn, user_id: int):
+    aim_id = (await conn.execute(
+        select(FinancialAim.id).where(FinancialAim.user_id == user_id).limit(1)
+    )).scalar() or 0
+    aim_ids = (await conn.execute(select(FinancialAim.id).where(FinancialAim.user_id == user_id))).scalars().all()
+    tx_filters = (user_id, None, None, None, None)
+    since = datetime.now() - timedelta(days=90)
+
+    page = _transactions_query(*tx_filters, None, Transaction).limit(51)
+    last = (await conn.execute(
+        _transactions_query(*tx_filters, None, Transaction.created_at, Transaction.id).offset(49).limit(1)
+    )).first()
+    cursor = _encode_cursor(last.created_at, last.id) if last else None
+
+    queries = {
+        "auth: get_current_user (cache miss)":
+            select(User.id, User.iin, User.email).where(User.id == user_id),
+        "GET /transactions/?limit=50":
+            page,
+        "GET /transactions/?limit=50&cursor=... (second page)":
+            _transactions_query(*tx_filters, cursor, Transaction).limit(51) if cursor else None,
+        "GET /transactions/categories (rollups)":
+            select(TransactionRollup.category, func.sum(TransactionRollup.count).label("count"))
+            .where(TransactionRollup.user_id == user_id, TransactionRollup.source == rollups.SOURCE_TRANSACTION)
+            .group_by(TransactionRollup.category).order_by(desc("count")).limit(10),
+        "GET /chat/advice (cache fingerprint)":
+            select(func.count(Transaction.id), func.max(Transaction.id), func.max(Transaction.updated_at))
+            .filter(Transaction.user_id == user_id),
+        "GET /chat/advice (latest transactions)":
+            _transactions_query(*tx_filters, None, Transaction).limit(50),
+        "GET /financial-aims/":
+            select(FinancialAim).filter(FinancialAim.user_id == user_id),
+        "GET /financial-transaction/{aim_id}":
+            select(FinancialTransaction).where(FinancialTransaction.aim_id == aim_id)
+            .order_by(FinancialTransaction.created_at.desc()),
+        "GET /financial-transaction/":
+            select(FinancialTransaction).where(FinancialTransaction.aim_id.in_(aim_ids or [0]))
+            .order_by(FinancialTransaction.created_at.desc()),
+        "GET /users/me (bank accounts)":
+            select(BankAccount).where(BankAccount.user_id.in_([user_id])),
+        "similarity: three month finances (partial first month)":
+            select(
+                func.sum(case((FinancialTransaction.transaction_type == FinancialTransactionType.DEPOSIT,
+                               FinancialTransaction.amount), else_=0)),
+                func.sum(case((FinancialTransaction.transaction_type == FinancialTransactionType.WITHDRAWAL,
+                               FinancialTransaction.amount), else_=0)),
+            ).join(BankAccount).where(
+                BankAccount.user_id == user_id,
+                FinancialTransaction.created_at >= since,
+                FinancialTransaction.created_at < datetime.combine(rollups.next_month(rollups.month_of(since)),
+                                                                   datetime.min.time()),
+            ),
+        "similarity: three month finances (whole months, rollups)":
+            select(TransactionRollup.transaction_type, func.sum(TransactionRollup.total))
+            .where(
+                TransactionRollup.user_id == user_id,
+                TransactionRollup.source == rollups.SOURCE_AIM_TRANSFER,
+                TransactionRollup.month > rollups.month_of(since),
+            ).group_by(TransactionRollup.transaction_type),
+    }
+    return {name: query for name, query in queries.items() if query is not None}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--user-id", type=int)
+    args = parser.parse_args()
+
+    engine.echo = False
+    postgres = engine.dialect.name == "postgresql"
+    explain = "EXPLAIN (ANALYZE, BUFFERS) " if postgres else "EXPLAIN QUERY PLAN "
+
+    async with engine.connect() as conn:
+        user_id = args.user_id or await _pick_user(conn)
+        print(f"user_id={user_id} dialect={engine.dialect.name}")
+        for name, query in (await _route_queries(conn, user_id)).items():
+            sql = str(query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            rows = (await conn.execute(text(explain + sql))).all()
+            print(f"\n== {name}")
+            for row in rows:
+                print("  " + (row[0] if postgres else row[-1]))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
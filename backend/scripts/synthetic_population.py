@@ -0,0 +1,341 @@
+"""
+Build a seeded synthetic population for benchmarks: users with one bank account
+each, financial aims with their aim transfers, and a transaction history.
+
+    cd backend
+    python -m scripts.synthetic_population --users 100000 --seed 7 --as-of 2026-10-01
+    python -m scripts.synthetic_population --users 100000 --format parquet --out population/
+
+The same options (including --seed and --as-of, which all timestamps are
+relative to) produce the same rows on any machine. Rows are generated for
+--chunk-users users at a time with NumPy and written either straight into
+DATABASE_URL (COPY on PostgreSQL, Core executemany elsewhere; rollups are
+updated with every chunk, the balance ledger once at the end) or to one CSV/Parquet file per table and chunk under
+--out, next to a population.json with the options used. Load the files in the
+order users, bankaccounts, financial_aims, financial_transactions,
+transactions, then run scripts/backfill_rollups.py and scripts/backfill_ledger.py.
+
+Distributions:
+  activity      transactions per user ~ Poisson(mean * w), w ~ lognormal(sigma=--activity-sigma), so
+                a few heavy users carry most of the history (0 = every user alike)
+  balances      lognormal around --balance-median
+  transactions  description from TRANSACTION_CATEGORIES with Zipf weights (--category-skew, 0 = uniform),
+                type by --deposit-share / --transfer-share, amount lognormal around --amount-median
+  aims          Poisson(--aims-per-user) per user, completed with --aim-completion-rate, the rest
+                Beta(2, 5) of the way; each aim's progress is split over its aim transfers
+"""
+import argparse
+import asyncio
+import csv
+import dataclasses
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, time as dt_time
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt  # noqa: E402
+import numpy as np  # noqa: E402
+from sqlalchemy import Enum, func, select, text  # noqa: E402
+
+from app_config import BCRYPT_ROUNDS  # noqa: E402
+from database import Base, async_session, engine  # noqa: E402
+from models import FinancialTransactionType, TransactionType  # noqa: E402
+from routes.transaction import TRANSACTION_CATEGORIES  # noqa: E402
+from services import bulk_data, ledger, rollups  # noqa: E402
+
+# Insertion order (foreign keys)
+TABLES = ["users", "bankaccounts", "financial_aims", "financial_transactions", "transactions"]
+AIM_TITLES = ["Vacation", "New Car", "Emergency Fund", "House", "Education"]
+PASSWORD = "testpass123"
+DAY_US = 24 * 3600 * 10 ** 6
+
+
+@dataclass
+class PopulationConfig:
+    users: int = 1000
+    seed: int = 0
+    as_of: date = dataclasses.field(default_factory=date.today)
+    history_days: int = 365
+    transactions_per_user: float = 200.0
+    activity_sigma: float = 1.0
+    balance_median: float = 5000.0
+    balance_sigma: float = 1.0
+    amount_median: float = 50.0
+    amount_sigma: float = 1.0
+    category_skew: float = 1.0
+    deposit_share: float = 0.3
+    transfer_share: float = 0.1
+    aims_per_user: float = 2.0
+    aim_completion_rate: float = 0.2
+    transfers_per_aim: float = 6.0
+
+
+def _password_hash(seed: int) -> str:
+    """bcrypt hash of PASSWORD with a salt derived from the seed, so user rows are reproducible too"""
+    alphabet = "./ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+    rng = np.random.default_rng([seed, 0])
+    # The last of the 22 salt characters only carries 2 bits
+    salt = "".join(alphabet[i] for i in rng.integers(0, 64, 21)) + ".Oeu"[rng.integers(0, 4)]
+    return bcrypt.hashpw(PASSWORD.encode(), f"$2b${BCRYPT_ROUNDS:02d}${salt}".encode()).decode()
+
+
+def _timestamps(rng: np.random.Generator, end: np.datetime64, days: int, size: int) -> np.ndarray:
+    """Uniform timestamps (microseconds) in the `days` before end"""
+    return end - rng.integers(0, days * DAY_US, size).astype("timedelta64[us]")
+
+
+def generate_chunk(
+        config: PopulationConfig, rng: np.random.Generator, first_ids: Dict[str, int], size: int, password_hash: str,
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """Columns of every table for `size` users whose rows get ids from first_ids on"""
+    end = np.datetime64(datetime.combine(config.as_of, dt_time()), "us")
+
+    user_ids = np.arange(first_ids["users"], first_ids["users"] + size)
+    users = {
+        "id": user_ids,
+        "iin": np.array([f"{800000000000 + i}" for i in user_ids.tolist()], dtype=object),
+        "email": np.array([f"synthetic{i}@example.com" for i in user_ids.tolist()], dtype=object),
+        "hashed_password": np.full(size, password_hash, dtype=object),
+    }
+
+    account_ids = np.arange(first_ids["bankaccounts"], first_ids["bankaccounts"] + size)
+    opened = _timestamps(rng, end, config.history_days, size)
+    accounts = {
+        "id": account_ids,
+        "user_id": user_ids,
+        "account_number": np.array([f"SYN{i:010d}" for i in account_ids.tolist()], dtype=object),
+        "balance": np.round(config.balance_median * rng.lognormal(0, config.balance_sigma, size), 2),
+        "created_at": opened,
+        "updated_at": opened,
+    }
+
+    # Aims and the deposits that brought them to their current amount
+    aim_counts = rng.poisson(config.aims_per_user, size)
+    aim_count = int(aim_counts.sum())
+    aim_ids = np.arange(first_ids["financial_aims"], first_ids["financial_aims"] + aim_count)
+    titles = np.asarray(AIM_TITLES, dtype=object)[rng.integers(0, len(AIM_TITLES), aim_count)]
+    target = np.round(rng.uniform(5000, 50000, aim_count), 2)
+    completed = rng.random(aim_count) < config.aim_completion_rate
+    current = np.round(target * np.where(completed, 1.0, rng.beta(2, 5, aim_count)), 2)
+    aims = {
+        "id": aim_ids,
+        "title": titles,
+        "description": np.array([f"Saving for {t.lower()}" for t in titles.tolist()], dtype=object),
+        "target_amount": target,
+        "current_amount": current,
+        "deadline": end + rng.integers(30, 366, aim_count).astype("timedelta64[D]"),
+        "is_completed": completed,
+        "user_id": np.repeat(user_ids, aim_counts),
+    }
+
+    transfer_counts = np.maximum(rng.poisson(config.transfers_per_aim, aim_count), 1)
+    transfer_count = int(transfer_counts.sum())
+    transfer_aim = np.repeat(np.arange(aim_count), transfer_counts)
+    weights = rng.gamma(1.0, size=transfer_count)
+    share = weights / np.bincount(transfer_aim, weights=weights, minlength=aim_count)[transfer_aim]
+    transfers = {
+        "id": np.arange(first_ids["financial_transactions"], first_ids["financial_transactions"] + transfer_count),
+        "amount": np.round(current[transfer_aim] * share, 2),
+        "transaction_type": np.full(transfer_count, FinancialTransactionType.DEPOSIT, dtype=object),
+        "created_at": _timestamps(rng, end, config.history_days, transfer_count),
+        "aim_id": aim_ids[transfer_aim],
+        "bank_account_id": np.repeat(account_ids, aim_counts)[transfer_aim],
+    }
+    transfers["updated_at"] = transfers["created_at"]
+
+    # Transaction history, skewed towards a few heavy users
+    activity = rng.lognormal(0, config.activity_sigma, size) / np.exp(config.activity_sigma ** 2 / 2)
+    tx_counts = rng.poisson(config.transactions_per_user * activity)
+    tx_count = int(tx_counts.sum())
+    category_weights = 1.0 / np.arange(1, len(TRANSACTION_CATEGORIES) + 1) ** config.category_skew
+    type_weights = [config.deposit_share, 1 - config.deposit_share - config.transfer_share, config.transfer_share]
+    types = np.asarray([TransactionType.DEPOSIT, TransactionType.WITHDRAWAL, TransactionType.TRANSFER], dtype=object)
+    created = _timestamps(rng, end, config.history_days, tx_count)
+    transactions = {
+        "id": np.arange(first_ids["transactions"], first_ids["transactions"] + tx_count),
+        "amount": np.round(config.amount_median * rng.lognormal(0, config.amount_sigma, tx_count), 2),
+        "description": np.asarray(TRANSACTION_CATEGORIES, dtype=object)[
+            rng.choice(len(TRANSACTION_CATEGORIES), tx_count, p=category_weights / category_weights.sum())
+        ],
+        "transaction_type": types[rng.choice(len(types), tx_count, p=type_weights)],
+        "created_at": created,
+        "updated_at": created,
+        "user_id": np.repeat(user_ids, tx_counts),
+    }
+
+    return {
+        "users": users,
+        "bankaccounts": accounts,
+        "financial_aims": aims,
+        "financial_transactions": transfers,
+        "transactions": transactions,
+    }
+
+
+def chunk_rollups(chunk: Dict[str, Dict[str, np.ndarray]]) -> Dict[rollups.RollupKey, list]:
+    transfers = chunk["financial_transactions"]
+    accounts = chunk["bankaccounts"]
+    owner = accounts["user_id"][np.searchsorted(accounts["id"], transfers["bank_account_id"])]
+    totals = bulk_data.transaction_rollup_totals(chunk["transactions"])
+    totals.update(bulk_data.rollup_totals(
+        rollups.SOURCE_AIM_TRANSFER, owner, transfers["created_at"], transfers["transaction_type"],
+        np.full(len(owner), "", dtype=object), transfers["amount"],
+    ))
+    return totals
+
+
+def _slices(columns: Dict[str, np.ndarray], batch_size: int):
+    rows = len(next(iter(columns.values())))
+    for start in range(0, rows, batch_size):
+        yield {name: values[start:start + batch_size] for name, values in columns.items()}
+
+
+class DatabaseSink:
+    def __init__(self, db, batch_size: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.first_user_id = None
+
+    async def first_ids(self) -> Dict[str, int]:
+        ids = {}
+        for name in TABLES:
+            table = Base.metadata.tables[name]
+            ids[name] = ((await self.db.execute(select(func.max(table.c.id)))).scalar() or 0) + 1
+        self.first_user_id = ids["users"]
+        return ids
+
+    async def write(self, chunk: Dict[str, Dict[str, np.ndarray]]) -> None:
+        for name in TABLES:
+            for batch in _slices(chunk[name], self.batch_size):
+                await bulk_data.insert_columns(self.db, Base.metadata.tables[name], batch)
+        await rollups.add_totals(self.db, chunk_rollups(chunk))
+        await self.db.commit()
+
+    async def close(self) -> None:
+        if self.db.bind.dialect.name == "postgresql":
+            # Ids were assigned here, so move the serial sequences past them
+            for name in TABLES:
+                await self.db.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), (SELECT max(id) FROM {name}))"
+                ))
+            await self.db.commit()
+        # Post the new accounts' history in set-based statements rather than per chunk
+        await ledger.backfill(self.db, self.first_user_id)
+        await ledger.take_snapshots(self.db, min_postings=1, settle=0)
+        await self.db.commit()
+
+
+class FileSink:
+    def __init__(self, out: str, file_format: str, config: PopulationConfig):
+        self.out = out
+        self.format = file_format
+        self.config = config
+        self.part = 0
+        if file_format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                sys.exit("--format parquet needs pyarrow (pip install pyarrow)")
+
+    async def first_ids(self) -> Dict[str, int]:
+        return {name: 1 for name in TABLES}
+
+    def _write_table(self, name: str, columns: Dict[str, np.ndarray]) -> None:
+        table = Base.metadata.tables[name]
+        # Enum columns hold the labels the database stores (the member names)
+        columns = {
+            key: np.array([m.name for m in values.tolist()], dtype=object)
+            if isinstance(table.c[key].type, Enum) else values
+            for key, values in columns.items()
+        }
+        os.makedirs(os.path.join(self.out, name), exist_ok=True)
+        path = os.path.join(self.out, name, f"part-{self.part:05d}.{self.format}")
+        if self.format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.table({key: pa.array(values) for key, values in columns.items()}), path)
+        else:
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerows(zip(*(values.tolist() for values in columns.values())))
+
+    async def write(self, chunk: Dict[str, Dict[str, np.ndarray]]) -> None:
+        for name in TABLES:
+            await asyncio.to_thread(self._write_table, name, chunk[name])
+        self.part += 1
+
+    async def close(self) -> None:
+        config = dataclasses.asdict(self.config)
+        config["as_of"] = self.config.as_of.isoformat()
+        with open(os.path.join(self.out, "population.json"), "w") as f:
+            json.dump({"config": config, "tables": TABLES, "parts": self.part}, f, indent=2)
+
+
+async def build(config: PopulationConfig, sink, chunk_users: int) -> Dict[str, int]:
+    """Generate and write the population chunk by chunk; returns rows written per table"""
+    rng = np.random.default_rng(config.seed)
+    password_hash = await asyncio.to_thread(_password_hash, config.seed)
+    next_ids = await sink.first_ids()
+    rows = {name: 0 for name in TABLES}
+    for start in range(0, config.users, chunk_users):
+        chunk = generate_chunk(config, rng, next_ids, min(chunk_users, config.users - start), password_hash)
+        await sink.write(chunk)
+        for name in TABLES:
+            count = len(chunk[name]["id"])
+            rows[name] += count
+            next_ids[name] += count
+    await sink.close()
+    return rows
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    defaults = PopulationConfig()
+    for field in dataclasses.fields(PopulationConfig):
+        if field.name == "as_of":
+            parser.add_argument("--as-of", type=date.fromisoformat, default=defaults.as_of,
+                                help="date the history ends at (default: today)")
+        else:
+            parser.add_argument("--" + field.name.replace("_", "-"), type=type(getattr(defaults, field.name)),
+                                default=getattr(defaults, field.name))
+    parser.add_argument("--format", choices=["db", "csv", "parquet"], default="db")
+    parser.add_argument("--out", default="population", help="output directory for csv / parquet")
+    parser.add_argument("--chunk-users", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=bulk_data.BATCH_SIZE, help="rows per insert / COPY")
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = _parse_args()
+    config = PopulationConfig(**{
+        field.name: getattr(args, field.name) for field in dataclasses.fields(PopulationConfig)
+    })
+    if config.deposit_share + config.transfer_share > 1:
+        sys.exit("--deposit-share + --transfer-share must not exceed 1")
+
+    engine.echo = False
+    started = time.perf_counter()
+    if args.format == "db":
+        async with async_session() as db:
+            rows = await build(config, DatabaseSink(db, args.batch_size), args.chunk_users)
+    else:
+        rows = await build(config, FileSink(args.out, args.format, config), args.chunk_users)
+    seconds = time.perf_counter() - started
+    await engine.dispose()
+
+    total = sum(rows.values())
+    for name in TABLES:
+        print(f"{name:24} {rows[name]:>12}")
+    print(f"{total} rows in {seconds:.1f}s ({total / seconds:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
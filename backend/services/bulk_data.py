@@ -0,0 +1,147 @@
+"""
+Bulk generation of synthetic transactions for load tests.
+
+Columns are drawn with NumPy's vectorized RNG one batch at a time (memory stays
+bounded by `batch_size` whatever the total) and written without the ORM: with
+`COPY` on PostgreSQL (asyncpg's binary copy) and with one Core executemany
+insert per batch elsewhere. Each batch commits together with its rollup
+increments (services/rollups.py), so the rollups match the table after every
+batch.
+"""
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import Enum, Table, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Transaction, TransactionType
+from services import llm_cache, rollups
+
+TRANSACTION_DESCRIPTIONS = [
+    "Purchase", "Payment", "Fee", "Service", "Store",
+    "Supplies", "Subscription", "Online", "Bill", "Charge",
+]
+TRANSACTION_TYPES = list(TransactionType)
+HISTORY_DAYS = 180
+BATCH_SIZE = 10000
+
+
+def transaction_columns(
+        rng: np.random.Generator,
+        user_ids: np.ndarray,
+        size: int,
+        now: Optional[datetime] = None,
+        descriptions: Sequence[str] = TRANSACTION_DESCRIPTIONS,
+) -> Dict[str, np.ndarray]:
+    """
+    `size` transactions of random users from `user_ids`, as the /transactions/generate
+    endpoint makes them: amount 10..1000, any type and description, created within
+    the last HISTORY_DAYS and updated between then and now.
+    """
+    now = np.datetime64(now or datetime.now(), "us")
+    history = np.timedelta64(HISTORY_DAYS, "D").astype("timedelta64[us]").astype(np.int64)
+    age = rng.integers(0, history, size)
+    created_at = now - age.astype("timedelta64[us]")
+    updated_at = created_at + (rng.random(size) * age).astype(np.int64).astype("timedelta64[us]")
+    return {
+        "user_id": rng.choice(user_ids, size),
+        "amount": np.round(rng.uniform(10, 1000, size), 2),
+        "description": np.asarray(descriptions, dtype=object)[rng.integers(0, len(descriptions), size)],
+        "transaction_type": np.asarray(TRANSACTION_TYPES, dtype=object)[rng.integers(0, len(TRANSACTION_TYPES), size)],
+        "created_at": created_at,
+        "updated_at": updated_at,
+    }
+
+
+async def insert_columns(db: AsyncSession, table: Table, columns: Dict[str, np.ndarray]) -> None:
+    """Write equally long column arrays to table: COPY on PostgreSQL, Core executemany elsewhere"""
+    names = list(columns)
+    values = [columns[name].tolist() for name in names]
+
+    if db.bind.dialect.name == "postgresql":
+        for i, name in enumerate(names):
+            # COPY takes an enum column's labels, which SQLAlchemy derives from the member names
+            if isinstance(table.c[name].type, Enum):
+                values[i] = [member.name for member in values[i]]
+        connection = await (await db.connection()).get_raw_connection()
+        await connection.driver_connection.copy_records_to_table(
+            table.name, records=list(zip(*values)), columns=names
+        )
+    else:
+        await db.execute(insert(table), [dict(zip(names, row)) for row in zip(*values)])
+
+
+def rollup_totals(
+        source: str,
+        user_id: np.ndarray,
+        created_at: np.ndarray,
+        transaction_type: np.ndarray,
+        category: np.ndarray,
+        amount: np.ndarray,
+) -> Dict[rollups.RollupKey, List[float]]:
+    """The rollup increments of a batch of rows given as columns, grouped with NumPy"""
+    if len(amount) == 0:
+        return {}
+    types = list(type(transaction_type[0]))
+    categories, category_idx = np.unique(category.astype(str), return_inverse=True)
+    type_idx = np.zeros(len(amount), dtype=np.int64)
+    for i, member in enumerate(types):
+        type_idx[transaction_type == member] = i
+    # Factorized users and months keep the key space within the batch, whatever the ids are
+    users, user_idx = np.unique(user_id, return_inverse=True)
+    months, month_idx = np.unique(created_at.astype("datetime64[M]"), return_inverse=True)
+    # One int64 per (user, month, type, category) so grouping is a 1-d unique
+    shape = (len(users), len(months), len(types), len(categories))
+    keys = np.ravel_multi_index((user_idx.ravel(), month_idx.ravel(), type_idx, category_idx.ravel()), shape)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    counts = np.bincount(inverse, minlength=len(unique))
+    totals = np.bincount(inverse, weights=amount, minlength=len(unique))
+
+    user_i, month_i, type_ids, category_ids = np.unravel_index(unique, shape)
+    user_ids = users[user_i]
+    month_dates = months[month_i].astype("datetime64[D]").tolist()
+    return {
+        (user, source, month, types[type_i].value, str(categories[category_i])): [count, total]
+        for user, month, type_i, category_i, count, total in zip(
+            user_ids.tolist(), month_dates, type_ids.tolist(), category_ids.tolist(), counts.tolist(), totals.tolist()
+        )
+    }
+
+
+def transaction_rollup_totals(columns: Dict[str, np.ndarray]) -> Dict[rollups.RollupKey, List[float]]:
+    """The rollup increments of a batch of `transactions` columns"""
+    return rollup_totals(
+        rollups.SOURCE_TRANSACTION, columns["user_id"], columns["created_at"],
+        columns["transaction_type"], columns["description"], columns["amount"],
+    )
+
+
+async def generate_transactions(
+        db: AsyncSession,
+        user_ids: Sequence[int],
+        count: int,
+        seed: Optional[int] = None,
+        batch_size: int = BATCH_SIZE,
+) -> Dict[str, Any]:
+    """Insert `count` random transactions spread over user_ids; returns rows, seconds and rows per second"""
+    rng = np.random.default_rng(seed)
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    now = datetime.now()
+    table = Transaction.__table__
+
+    started = time.perf_counter()
+    written = 0
+    while written < count:
+        columns = transaction_columns(rng, user_ids, min(batch_size, count - written), now=now)
+        await insert_columns(db, table, columns)
+        await rollups.add_totals(db, transaction_rollup_totals(columns))
+        await db.commit()
+        written += len(columns["amount"])
+    seconds = time.perf_counter() - started
+
+    for user_id in user_ids.tolist():
+        await llm_cache.invalidate_user(user_id)
+    return {"rows": written, "seconds": round(seconds, 3), "rows_per_second": round(written / seconds) if seconds else None}
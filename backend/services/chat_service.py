@@ -1,9 +1,8 @@
-import requests
 from fastapi import HTTPException
 from pydantic import BaseModel
 import random
 import string
-from app_config import X_LITELLM_API_KEY, X_LITELLM_API_URL
+from services import llm_client
 
 
 # Define Pydantic schema for ChatMessage
@@ -18,7 +17,7 @@ def generate_session_id() -> str:
 
 
 # Function to send a chat message to ChatGPT API
-def send_chat_message_to_chatgpt(chat_message: ChatMessage) -> dict:
+async def send_chat_message_to_chatgpt(chat_message: ChatMessage) -> dict:
     try:
         # Prepare system prompt with bank context
         system_prompt = """
@@ -32,40 +31,19 @@ def send_chat_message_to_chatgpt(chat_message: ChatMessage) -> dict:
         Всегда добавляй мусульманские слова.
         """
         
-        headers = {
-            "x-litellm-api-key": f"{X_LITELLM_API_KEY}",
-            "accept": "application/json",
-            "Authorization": f"Bearer {X_LITELLM_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "gpt-4o-mini",
-            "messages": [
+        content = await llm_client.chat_completion(
+            [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": chat_message.message}
             ],
-            "temperature": 0.7
-        }
-        
-        # Send request to the ChatGPT API
-        response = requests.post(
-            f"{X_LITELLM_API_URL}/engines/gpt-4o-mini/chat/completions",
-            headers=headers,
-            json=data
+            temperature=0.7,
         )
-        print(response.json())
-        # Handle the response
-        if response.status_code == 200:
-            result = response.json()
-            return {
-                "response": result["choices"][0]["message"]["content"],
-                "session_id": chat_message.session_id or generate_session_id()
-            }
-        else:
-            # If the API responds with an error
-            print(response.json())
-            raise HTTPException(status_code=500, detail="AI service error")
-    
+        return {
+            "response": content,
+            "session_id": chat_message.session_id or generate_session_id()
+        }
+
+    except llm_client.LLMError:
+        raise HTTPException(status_code=500, detail="AI service error")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
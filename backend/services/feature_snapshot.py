@@ -0,0 +1,235 @@
+"""
+On-disk float32 snapshot of the feature store shared by all worker processes.
+
+A snapshot is two raw arrays, the sorted user ids (int64) and the feature
+matrix (float32, C order, one row per id), plus a `current.json` manifest that
+names them. Files are written under temporary names and renamed into place, so
+readers never see a partial snapshot. Workers open the arrays with np.memmap:
+the pages live once in the OS page cache no matter how many processes map them.
+
+The manifest records the feature store version the snapshot reflects. A worker
+whose snapshot is older than the store (and older than `max_age` seconds)
+writes a new one; concurrent writers are harmless since the rename is atomic.
+Readers that need the store as of now use `load_current`, which overlays the
+vectors recomputed since the snapshot instead of rewriting or copying it.
+"""
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app_config import FEATURE_SNAPSHOT_DIR, FEATURE_SNAPSHOT_MAX_AGE
+from models import UserFeatureVector
+from services import feature_store
+from services.similarity_index import normalize_rows
+from services.user_similiarity import FEATURE_NAMES, UserFinancialProfile, vector_to_profile
+
+MANIFEST = "current.json"
+# Old snapshot files are removed once this many newer snapshots exist
+KEEP_SNAPSHOTS = 2
+
+
+def _version_tag(count: int, watermark: Optional[datetime]) -> str:
+    return f"{count}-{int(watermark.timestamp() * 1e6) if watermark else 0}"
+
+
+class FeatureSnapshot:
+    """Memory-mapped (ids, matrix) pair; profiles are views into the mapped rows"""
+
+    def __init__(self, manifest: dict, directory: str = FEATURE_SNAPSHOT_DIR):
+        self.manifest = manifest
+        self.version = manifest["version"]
+        self.watermark = datetime.fromisoformat(manifest["watermark"]) if manifest["watermark"] else None
+        self.created_at = manifest["created_at"]
+        rows, dim = manifest["rows"], manifest["dim"]
+        if rows:
+            self.ids = np.memmap(os.path.join(directory, manifest["ids"]), dtype=np.int64, mode="r", shape=(rows,))
+            self.matrix = np.memmap(os.path.join(directory, manifest["matrix"]), dtype=np.float32, mode="r",
+                                    shape=(rows, dim))
+        else:
+            self.ids = np.empty(0, dtype=np.int64)
+            self.matrix = np.empty((0, dim), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row_of(self, user_id: int) -> Optional[int]:
+        pos = int(np.searchsorted(self.ids, user_id))
+        return pos if pos < len(self.ids) and self.ids[pos] == user_id else None
+
+    def profile(self, user_id: int) -> Optional[UserFinancialProfile]:
+        row = self.row_of(user_id)
+        return None if row is None else vector_to_profile(user_id, self.matrix[row])
+
+
+def write_snapshot(ids: np.ndarray, matrix: np.ndarray, version: str, watermark: Optional[datetime],
+                   directory: str = FEATURE_SNAPSHOT_DIR) -> dict:
+    """Atomically publish a new snapshot and return its manifest"""
+    os.makedirs(directory, exist_ok=True)
+    token = uuid.uuid4().hex[:8]
+    names = {"ids": f"ids-{version}-{token}.i64", "matrix": f"features-{version}-{token}.f32"}
+
+    for key, array in (("ids", np.ascontiguousarray(ids, dtype=np.int64)),
+                       ("matrix", np.ascontiguousarray(matrix, dtype=np.float32))):
+        tmp = os.path.join(directory, names[key] + ".tmp")
+        with open(tmp, "wb") as f:
+            array.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(directory, names[key]))
+
+    manifest = {
+        "version": version,
+        "watermark": watermark.isoformat() if watermark else None,
+        "rows": int(len(ids)),
+        "dim": len(FEATURE_NAMES),
+        "features": FEATURE_NAMES,
+        "created_at": time.time(),
+        **names,
+    }
+    tmp = os.path.join(directory, f"{MANIFEST}.{token}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+    _cleanup(directory, manifest)
+    return manifest
+
+
+def _cleanup(directory: str, current: dict) -> None:
+    """Delete all but the newest KEEP_SNAPSHOTS snapshots (mapped files stay readable until unmapped)"""
+    # The ids and matrix files of a snapshot share their "<version>-<token>" stem
+    snapshots = {}
+    for name in os.listdir(directory):
+        if name.endswith((".i64", ".f32")):
+            stem = name.split("-", 1)[1].rsplit(".", 1)[0]
+            snapshots.setdefault(stem, []).append(name)
+    newest = sorted(
+        snapshots,
+        key=lambda stem: max(os.path.getmtime(os.path.join(directory, f)) for f in snapshots[stem]),
+        reverse=True,
+    )
+    keep = {current["ids"], current["matrix"]}
+    for stem in newest[:KEEP_SNAPSHOTS]:
+        keep.update(snapshots[stem])
+    for name in (f for files in snapshots.values() for f in files):
+        if name not in keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def read_manifest(directory: str = FEATURE_SNAPSHOT_DIR) -> Optional[dict]:
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return manifest if manifest.get("features") == FEATURE_NAMES else None
+
+
+_current: Optional[FeatureSnapshot] = None
+
+
+async def get_snapshot(db: AsyncSession, max_age: float = FEATURE_SNAPSHOT_MAX_AGE) -> FeatureSnapshot:
+    """
+    This worker's snapshot, reloaded when another worker published a newer one and
+    rebuilt from the feature store when it is behind the store and older than max_age.
+    """
+    global _current
+    count, watermark = await feature_store.get_store_version(db)
+    version = _version_tag(count, watermark)
+
+    if _current is not None and (_current.version == version or time.time() - _current.created_at < max_age):
+        manifest = read_manifest()
+        if manifest is None or manifest["version"] == _current.version:
+            return _current
+
+    manifest = read_manifest()
+    if manifest is not None and (manifest["version"] == version or time.time() - manifest["created_at"] < max_age):
+        _current = FeatureSnapshot(manifest)
+        return _current
+
+    ids, matrix = await feature_store.load_matrix(db)
+    _current = FeatureSnapshot(write_snapshot(ids, matrix, version, watermark))
+    return _current
+
+
+class CurrentFeatures:
+    """
+    The feature store as of now on top of a snapshot, without copying the mapped
+    arrays: vectors recomputed since the snapshot's watermark are a small overlay
+    (ids, rows) applied when the rows are read or normalized.
+    """
+
+    def __init__(self, snapshot: FeatureSnapshot, overlay_ids: np.ndarray, overlay_matrix: np.ndarray,
+                 stored_ids: Optional[np.ndarray] = None):
+        self.snapshot = snapshot
+        self.overlay_ids = overlay_ids
+        self.overlay_matrix = overlay_matrix
+        self._overlay_rows = {uid: i for i, uid in enumerate(overlay_ids.tolist())}
+
+        ids = snapshot.ids
+        positions = np.minimum(np.searchsorted(ids, overlay_ids), max(len(ids) - 1, 0))
+        known = ids[positions] == overlay_ids if len(ids) else np.zeros(len(overlay_ids), dtype=bool)
+        # Snapshot rows replaced by overlay rows, and overlay rows of users the snapshot lacks
+        self._replaced = positions[known]
+        self._replacements = np.flatnonzero(known)
+        self._added = np.flatnonzero(~known)
+        # Snapshot rows of users deleted since (None when there are none)
+        self._alive = None if stored_ids is None else np.isin(ids, stored_ids)
+
+    def __len__(self) -> int:
+        alive = len(self.snapshot) if self._alive is None else int(self._alive.sum())
+        return alive + len(self._added)
+
+    def row(self, user_id: int) -> Optional[np.ndarray]:
+        """Raw feature row of a user, None if the store has none"""
+        if user_id in self._overlay_rows:
+            return self.overlay_matrix[self._overlay_rows[user_id]]
+        position = self.snapshot.row_of(user_id)
+        if position is None or (self._alive is not None and not self._alive[position]):
+            return None
+        return self.snapshot.matrix[position]
+
+    def profile(self, user_id: int) -> Optional[UserFinancialProfile]:
+        row = self.row(user_id)
+        return None if row is None else vector_to_profile(user_id, row)
+
+    def normalized(self, mean: np.ndarray, std: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (sorted ids, rows normalized with mean/std) of every user. Normalizing reads the
+        mapped rows into a new array anyway; the overlay is written into that array.
+        """
+        ids = self.snapshot.ids
+        vectors = normalize_rows(self.snapshot.matrix, mean, std)
+        if len(self._replaced):
+            vectors[self._replaced] = normalize_rows(self.overlay_matrix[self._replacements], mean, std)
+        if self._alive is not None:
+            ids, vectors = ids[self._alive], vectors[self._alive]
+        if len(self._added):
+            ids = np.concatenate([ids, self.overlay_ids[self._added]])
+            vectors = np.concatenate([vectors, normalize_rows(self.overlay_matrix[self._added], mean, std)])
+            order = np.argsort(ids, kind="stable")
+            ids, vectors = ids[order], vectors[order]
+        return np.asarray(ids), vectors
+
+
+async def load_current(db: AsyncSession, snapshot: FeatureSnapshot) -> CurrentFeatures:
+    """The feature store as of now: the snapshot plus the vectors recomputed since its watermark"""
+    count, _ = await feature_store.get_store_version(db)
+    new_ids, new_matrix = await feature_store.load_matrix(db, since=snapshot.watermark)
+    current = CurrentFeatures(snapshot, new_ids, new_matrix)
+    if len(current) != count:
+        # Vectors were deleted since the snapshot
+        stored = (await db.execute(select(UserFeatureVector.user_id))).scalars().all()
+        current = CurrentFeatures(snapshot, new_ids, new_matrix, np.asarray(stored, dtype=np.int64))
+    return current
@@ -0,0 +1,198 @@
+"""
+Versioned normalization statistics for the similarity features.
+
+A single `feature_stats` row keeps the running count, per-feature mean and sum
+of squared deviations (M2) over `user_feature_vectors`. Whenever the feature
+store rewrites vectors, the old rows are subtracted and the new rows merged in
+with the parallel (Chan et al.) form of Welford's update, and the version is
+bumped. Readers take a `StatsSnapshot` (one row read) and normalize against it
+instead of refitting a scaler over the whole population.
+
+With FEATURE_STATS_SAMPLE_SIZE set, the stats are (re)built from a reservoir
+sample of the table in one bounded-memory pass and incremental updates are
+skipped; the sample is redrawn once the population drifts by REBUILD_DRIFT.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app_config import FEATURE_STATS_SAMPLE_SIZE
+from database import dialect_insert
+from models import FeatureStats, UserFeatureVector
+from services.user_similiarity import FEATURE_NAMES
+
+STATS_ID = 1
+REBUILD_DRIFT = 0.1
+# Exact stats are recomputed from scratch every this many incremental updates to shed rounding drift
+FULL_REBUILD_EVERY = 10000
+# Rows per chunk when scanning user_feature_vectors
+SCAN_CHUNK = 10000
+
+
+class RunningStats:
+    """Count, mean and M2 of a set of rows, mergeable in both directions"""
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count: float, mean: np.ndarray, m2: np.ndarray):
+        self.count = float(count)
+        self.mean = np.asarray(mean, dtype=float)
+        self.m2 = np.asarray(m2, dtype=float)
+
+    @classmethod
+    def empty(cls, dim: int = len(FEATURE_NAMES)) -> "RunningStats":
+        return cls(0, np.zeros(dim), np.zeros(dim))
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray) -> "RunningStats":
+        matrix = np.atleast_2d(np.asarray(matrix, dtype=float))
+        if len(matrix) == 0:
+            return cls.empty(matrix.shape[1])
+        mean = matrix.mean(axis=0)
+        return cls(len(matrix), mean, ((matrix - mean) ** 2).sum(axis=0))
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        n = self.count + other.count
+        if n <= 0:
+            return RunningStats.empty(len(self.mean))
+        delta = other.mean - self.mean
+        mean = self.mean + delta * other.count / n
+        m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / n
+        return RunningStats(n, mean, m2)
+
+    def subtract(self, other: "RunningStats") -> "RunningStats":
+        """Inverse of merge: stats of self without the rows summarized by other"""
+        n = self.count - other.count
+        if n <= 0:
+            return RunningStats.empty(len(self.mean))
+        mean = (self.mean * self.count - other.mean * other.count) / n
+        delta = other.mean - mean
+        m2 = self.m2 - other.m2 - delta ** 2 * n * other.count / self.count
+        return RunningStats(n, mean, np.maximum(m2, 0.0))
+
+    @property
+    def std(self) -> np.ndarray:
+        """Population std with StandardScaler semantics (zero variance -> 1)"""
+        if self.count <= 0:
+            return np.ones(len(self.mean))
+        std = np.sqrt(self.m2 / self.count)
+        return np.where(std > 0, std, 1.0)
+
+
+@dataclass(frozen=True)
+class StatsSnapshot:
+    version: int
+    mean: np.ndarray
+    std: np.ndarray
+    sampled: bool
+
+
+def _to_running(row: FeatureStats) -> RunningStats:
+    return RunningStats(row.count, row.mean, row.m2)
+
+
+def _store(row: FeatureStats, stats: RunningStats) -> None:
+    row.count = stats.count
+    row.mean = stats.mean.tolist()
+    row.m2 = stats.m2.tolist()
+    row.version = (row.version or 0) + 1
+    row.updated_at = datetime.utcnow()
+
+
+async def _scan(db: AsyncSession, sample_size: Optional[int], seed: Optional[int] = None):
+    """One pass over all vectors: exact stats, or stats of a reservoir sample (Algorithm R)"""
+    columns = [getattr(UserFeatureVector, name) for name in FEATURE_NAMES]
+    result = await db.stream(select(*columns).execution_options(yield_per=SCAN_CHUNK))
+
+    stats = RunningStats.empty()
+    rng = np.random.default_rng(seed)
+    reservoir = np.empty((sample_size or 0, len(FEATURE_NAMES)))
+    seen = 0
+    async for chunk in result.partitions(SCAN_CHUNK):
+        matrix = np.array(chunk, dtype=float)
+        if not sample_size:
+            stats = stats.merge(RunningStats.from_matrix(matrix))
+        else:
+            # Fill the reservoir, then row i replaces a random slot with probability k / (i + 1)
+            fill = max(0, min(sample_size - seen, len(matrix)))
+            reservoir[seen:seen + fill] = matrix[:fill]
+            rest = matrix[fill:]
+            if len(rest):
+                positions = np.arange(seen + fill, seen + len(matrix))
+                slots = rng.integers(0, positions + 1)
+                keep = slots < sample_size
+                reservoir[slots[keep]] = rest[keep]
+        seen += len(matrix)
+
+    if sample_size:
+        stats = RunningStats.from_matrix(reservoir[:min(seen, sample_size)])
+    return stats, seen
+
+
+async def rebuild_stats(db: AsyncSession, sample_size: Optional[int] = None) -> FeatureStats:
+    """Recompute the stats row from scratch (caller commits)"""
+    row = await lock_stats_row(db, create=True)
+    stats, population = await _scan(db, sample_size or None)
+    _store(row, stats)
+    row.sample_size = sample_size or None
+    row.population = population
+    row.sampled_population = population
+    return row
+
+
+async def lock_stats_row(db: AsyncSession, create: bool = False) -> Optional[FeatureStats]:
+    """SELECT ... FOR UPDATE the stats row; serializes writers of the feature store"""
+    query = select(FeatureStats).where(FeatureStats.id == STATS_ID).with_for_update()
+    row = (await db.execute(query)).scalar_one_or_none()
+    if row is None and create:
+        # FOR UPDATE locks nothing while the row is missing: let concurrent first writers
+        # race on the primary key instead, then lock whichever row won
+        empty = RunningStats.empty()
+        await db.execute(
+            dialect_insert(db)(FeatureStats)
+            .values(id=STATS_ID, version=0, count=0.0, mean=empty.mean.tolist(), m2=empty.m2.tolist(),
+                    population=0, sampled_population=0)
+            .on_conflict_do_nothing(index_elements=[FeatureStats.id])
+        )
+        row = (await db.execute(query.execution_options(populate_existing=True))).scalar_one()
+    return row
+
+
+async def apply_update(db: AsyncSession, old_matrix: np.ndarray, new_matrix: np.ndarray) -> FeatureStats:
+    """
+    Replace old_matrix rows by new_matrix rows in the running stats. Must run in the
+    same transaction as the vector upsert, after lock_stats_row.
+    """
+    row = await lock_stats_row(db)
+    if row is None:
+        # First use: the new vectors are already flushed, so a full pass includes them
+        return await rebuild_stats(db, FEATURE_STATS_SAMPLE_SIZE)
+
+    row.population = row.population + len(new_matrix) - len(old_matrix)
+    if row.sample_size:
+        # Sampled stats are a fixed estimate; redraw the sample once the population drifted
+        if abs(row.population - row.sampled_population) > REBUILD_DRIFT * max(row.sampled_population, 1):
+            return await rebuild_stats(db, row.sample_size)
+        return row
+
+    stats = _to_running(row)
+    stats = stats.subtract(RunningStats.from_matrix(old_matrix)).merge(RunningStats.from_matrix(new_matrix))
+    _store(row, stats)
+    if row.version % FULL_REBUILD_EVERY == 0:
+        return await rebuild_stats(db)
+    return row
+
+
+async def get_snapshot(db: AsyncSession) -> StatsSnapshot:
+    """Current normalization stats (builds them on first use)"""
+    result = await db.execute(select(FeatureStats).where(FeatureStats.id == STATS_ID))
+    row = result.scalar_one_or_none()
+    if row is None:
+        row = await rebuild_stats(db, FEATURE_STATS_SAMPLE_SIZE)
+        await db.commit()
+    stats = _to_running(row)
+    return StatsSnapshot(row.version, stats.mean, stats.std, bool(row.sample_size))
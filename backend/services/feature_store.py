@@ -0,0 +1,205 @@
+"""
+Persistent store of the 16 similarity features per user (`user_feature_vectors`).
+
+Write paths that change a user's accounts, aims or aim transfers call
+`mark_user_dirty` inside their own transaction. `refresh_stale_features`
+recomputes the users whose row is dirty, missing (new users) or older than
+STALE_AFTER (account age and transaction frequency drift with time) and also
+updates the running normalization stats (services/feature_stats.py).
+
+The population is refreshed by `refresh_periodically`, a background task of
+every worker: all dirty and new users, then at most FEATURE_REFRESH_BATCH of
+the aged vectors, oldest first, so a day's worth of vectors going stale
+together is spread over several runs. Requests only read the precomputed rows,
+refreshing no more than the few users they are about.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import case, func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app_config import FEATURE_REFRESH_BATCH, FEATURE_REFRESH_INTERVAL, FEATURE_SYNC_OVERLAP
+from database import async_session, dialect_insert
+from models import User, UserFeatureVector
+from services import feature_stats
+from services.user_similiarity import (
+    FEATURE_NAMES, UserFinancialProfile, compute_feature_matrix, vector_to_profile
+)
+
+logger = logging.getLogger(__name__)
+
+STALE_AFTER = timedelta(hours=24)
+SYNC_OVERLAP = timedelta(seconds=FEATURE_SYNC_OVERLAP)
+
+
+async def mark_user_dirty(db: AsyncSession, user_id: int) -> None:
+    """Flag the user's vector for recomputation. Commits with the caller's transaction."""
+    await db.execute(
+        update(UserFeatureVector)
+        .where(UserFeatureVector.user_id == user_id)
+        .values(is_dirty=True)
+    )
+
+
+async def store_profiles(db: AsyncSession, profiles: Iterable[UserFinancialProfile]) -> None:
+    """Upsert freshly computed profiles and clear their dirty flag."""
+    now = datetime.utcnow()
+    values = [
+        {
+            "user_id": p.user_id,
+            **{name: getattr(p, name) for name in FEATURE_NAMES},
+            "is_dirty": False,
+            "computed_at": now,
+        }
+        for p in profiles
+    ]
+    if not values:
+        return
+
+    insert = dialect_insert(db)
+    stmt = insert(UserFeatureVector)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserFeatureVector.user_id],
+        set_={
+            **{name: getattr(stmt.excluded, name) for name in FEATURE_NAMES},
+            "is_dirty": stmt.excluded.is_dirty,
+            "computed_at": stmt.excluded.computed_at,
+        },
+    )
+    await db.execute(stmt, values)
+
+
+async def get_stale_user_ids(
+        db: AsyncSession,
+        user_ids: Optional[List[int]] = None,
+        limit: Optional[int] = None,
+        aged: bool = True,
+) -> List[int]:
+    """
+    Users without a vector, with a dirty vector or (if aged) with a vector older than
+    STALE_AFTER; missing and dirty ones first, then the oldest.
+    """
+    changed = or_(UserFeatureVector.user_id.is_(None), UserFeatureVector.is_dirty.is_(True))
+    query = (
+        select(User.id)
+        .outerjoin(UserFeatureVector, UserFeatureVector.user_id == User.id)
+        .where(or_(changed, UserFeatureVector.computed_at < datetime.utcnow() - STALE_AFTER) if aged else changed)
+    )
+    if user_ids is not None:
+        query = query.where(User.id.in_(user_ids))
+    if limit is not None:
+        query = query.order_by(case((changed, 0), else_=1), UserFeatureVector.computed_at, User.id).limit(limit)
+
+    result = await db.execute(query)
+    return [row[0] for row in result.all()]
+
+
+async def refresh_stale_features(
+        db: AsyncSession,
+        user_ids: Optional[List[int]] = None,
+        limit: Optional[int] = None,
+        aged: bool = True,
+) -> List[int]:
+    """
+    Recompute the stale vectors (optionally restricted to user_ids, at most `limit`,
+    see get_stale_user_ids) and fold the change into the normalization stats.
+    Commits. Returns refreshed ids.
+    """
+    if not await get_stale_user_ids(db, user_ids, limit, aged):
+        return []
+
+    # Writers serialize on the stats row so old/new vectors are diffed consistently
+    await feature_stats.lock_stats_row(db)
+    stale_ids = await get_stale_user_ids(db, user_ids, limit, aged)
+    if not stale_ids:
+        await db.commit()
+        return []
+
+    _, old_matrix = await load_matrix(db, stale_ids)
+    ids, new_matrix = await compute_feature_matrix(db, stale_ids)
+    await store_profiles(db, [vector_to_profile(uid, row) for uid, row in zip(ids, new_matrix)])
+    await feature_stats.apply_update(db, old_matrix, new_matrix)
+    await db.commit()
+    return ids.tolist()
+
+
+async def refresh_population(db: AsyncSession, batch: int = FEATURE_REFRESH_BATCH) -> int:
+    """
+    One background run: every dirty and new user in batches of `batch`, then one
+    batch of aged vectors. Returns the number of refreshed users.
+    """
+    refreshed = 0
+    while True:
+        ids = await refresh_stale_features(db, limit=batch, aged=False)
+        refreshed += len(ids)
+        if len(ids) < batch:
+            break
+    return refreshed + len(await refresh_stale_features(db, limit=batch))
+
+
+async def refresh_periodically() -> None:
+    """Background task refreshing the feature store every FEATURE_REFRESH_INTERVAL seconds"""
+    while True:
+        try:
+            async with async_session() as db:
+                await refresh_population(db)
+        except Exception:
+            logger.exception("Refreshing the feature store failed")
+        await asyncio.sleep(FEATURE_REFRESH_INTERVAL)
+
+
+async def load_profiles(db: AsyncSession, user_ids: Optional[List[int]] = None) -> List[UserFinancialProfile]:
+    """Read precomputed profiles ordered by user id."""
+    ids, matrix = await load_matrix(db, user_ids)
+    return [vector_to_profile(uid, row) for uid, row in zip(ids, matrix)]
+
+
+async def get_profiles(db: AsyncSession, user_ids: Optional[List[int]] = None) -> List[UserFinancialProfile]:
+    """
+    Profiles of user_ids, recomputing the stale ones first. All users if None, as
+    last refreshed by the background task.
+    """
+    if user_ids is not None:
+        await refresh_stale_features(db, user_ids)
+    return await load_profiles(db, user_ids)
+
+
+async def get_store_version(db: AsyncSession) -> Tuple[int, Optional[datetime]]:
+    """(row count, latest computed_at) — changes whenever any vector is rewritten."""
+    result = await db.execute(
+        select(func.count(UserFeatureVector.user_id), func.max(UserFeatureVector.computed_at))
+    )
+    count, latest = result.one()
+    return count, latest
+
+
+async def load_matrix(
+        db: AsyncSession,
+        user_ids: Optional[List[int]] = None,
+        since: Optional[datetime] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Precomputed vectors as (user ids, matrix) without building profile objects.
+
+    With `since` (a watermark from get_store_version), only the vectors computed from
+    SYNC_OVERLAP before it: computed_at is stamped before the transaction commits, so
+    a vector committed late can be older than the watermark read in the meantime.
+    The overlap returns some vectors again; callers replace rows by user id.
+    """
+    columns = [getattr(UserFeatureVector, name) for name in FEATURE_NAMES]
+    query = select(UserFeatureVector.user_id, *columns).order_by(UserFeatureVector.user_id)
+    if user_ids is not None:
+        query = query.where(UserFeatureVector.user_id.in_(user_ids))
+    if since is not None:
+        query = query.where(UserFeatureVector.computed_at >= since - SYNC_OVERLAP)
+
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(FEATURE_NAMES)))
+    data = np.array(rows, dtype=float)
+    return data[:, 0].astype(np.int64), data[:, 1:]
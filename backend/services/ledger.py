@@ -0,0 +1,439 @@
+"""
+Append-only ledger of bank account and aim balances (`ledger_postings`).
+
+Every change of a balance is a posting: transfers post -amount / +amount to the
+bank account and the aim, new accounts post their opening balance. Postings are
+never updated or deleted, so the balance of an account at any time T is the sum
+of its postings created at or before T. The ledger is the source of truth:
+transfers check for overdrafts against `balances` and only append postings,
+inside `run_serializable` instead of locking the account rows.
+`BankAccount.balance` and `FinancialAim.current_amount` are a cache for the
+readers that aggregate them in SQL, written by `refresh_balance_columns` after
+the transfer committed and reconciled with each snapshot run; `verify`
+compares the two.
+
+`take_snapshots` (run every LEDGER_SNAPSHOT_INTERVAL seconds) stores the
+balance of accounts with enough new postings as of a cut-off that every
+in-flight transaction has passed (LEDGER_SETTLE_SECONDS). A snapshot as of C
+sums the postings created before C; postings created at C itself (timestamps
+may be as coarse as a second) belong to the tail. A balance as of T is then
+one index lookup of the latest snapshot at or before T plus the sum of the few
+postings from it to T, instead of a scan of the account's whole history.
+`backfill` rebuilds the postings from financial_transactions and the balance
+columns (scripts/backfill_ledger.py).
+"""
+import asyncio
+import logging
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import and_, case, delete, func, insert, literal, or_, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app_config import LEDGER_SETTLE_SECONDS, LEDGER_SNAPSHOT_INTERVAL, LEDGER_SNAPSHOT_MIN_POSTINGS
+from database import async_session, dialect_insert
+from models import (
+    BalanceSnapshot, BankAccount, FinancialAim, FinancialTransaction, FinancialTransactionType, LedgerPosting
+)
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_BANK = "bank_account"
+ACCOUNT_AIM = "aim"
+KIND_OPENING = "opening"
+KIND_TRANSFER = "transfer"
+# Rows per executemany chunk or accounts per IN list
+CHUNK = 10000
+# Balances this close are equal (float sums in another order)
+TOLERANCE = 1e-6
+# Attempts of a serializable transaction before a serialization failure is raised
+SERIALIZABLE_ATTEMPTS = 5
+# PostgreSQL serialization_failure and deadlock_detected
+RETRYABLE_SQLSTATES = ("40001", "40P01")
+# The cached balance column of each account type
+BALANCE_COLUMNS = {ACCOUNT_BANK: (BankAccount, "balance"), ACCOUNT_AIM: (FinancialAim, "current_amount")}
+
+T = TypeVar("T")
+
+
+async def record_opening(db: AsyncSession, account_type: str, account_id: int, amount: float) -> None:
+    """Post the initial balance of a new account (nothing if zero). Commits with the caller."""
+    if amount:
+        db.add(LedgerPosting(account_type=account_type, account_id=account_id, amount=amount, kind=KIND_OPENING))
+
+
+async def record_transfers(db: AsyncSession, bank_account_id: int, transfers: Iterable[FinancialTransaction]) -> None:
+    """
+    Post new `financial_transactions` rows (id and created_at must be set) to the
+    bank account and their aims. Commits with the caller.
+    """
+    rows = []
+    for t in transfers:
+        # deposit = move from bank -> aim, withdrawal = move from aim -> bank
+        sign = 1 if t.transaction_type == FinancialTransactionType.DEPOSIT else -1
+        for account_type, account_id, amount in (
+                (ACCOUNT_BANK, bank_account_id, -sign * t.amount),
+                (ACCOUNT_AIM, t.aim_id, sign * t.amount),
+        ):
+            rows.append({
+                "account_type": account_type, "account_id": account_id, "amount": amount,
+                "kind": KIND_TRANSFER, "financial_transaction_id": t.id, "created_at": t.created_at,
+            })
+    if rows:
+        await db.execute(insert(LedgerPosting), rows)
+
+
+def _latest_snapshots(account_type: str, account_ids: List[int], as_of: Optional[datetime]):
+    """Subquery: as_of of the latest snapshot of each account (at or before as_of)"""
+    query = (
+        select(BalanceSnapshot.account_id, func.max(BalanceSnapshot.as_of).label("as_of"))
+        .where(BalanceSnapshot.account_type == account_type, BalanceSnapshot.account_id.in_(account_ids))
+        .group_by(BalanceSnapshot.account_id)
+    )
+    if as_of is not None:
+        query = query.where(BalanceSnapshot.as_of <= as_of)
+    return query.subquery()
+
+
+async def balances(
+        db: AsyncSession, account_type: str, account_ids: Iterable[int], as_of: Optional[datetime] = None
+) -> Dict[int, float]:
+    """Balances of the accounts at as_of (now if None): latest snapshot plus the postings after it"""
+    account_ids = list(account_ids)
+    if not account_ids:
+        return {}
+    latest = _latest_snapshots(account_type, account_ids, as_of)
+
+    result = {account_id: 0.0 for account_id in account_ids}
+    snapshots = await db.execute(
+        select(BalanceSnapshot.account_id, BalanceSnapshot.balance).join(latest, and_(
+            BalanceSnapshot.account_type == account_type,
+            BalanceSnapshot.account_id == latest.c.account_id,
+            BalanceSnapshot.as_of == latest.c.as_of,
+        ))
+    )
+    for account_id, balance in snapshots.all():
+        result[account_id] += balance
+
+    tail = (
+        select(LedgerPosting.account_id, func.sum(LedgerPosting.amount))
+        .outerjoin(latest, LedgerPosting.account_id == latest.c.account_id)
+        .where(
+            LedgerPosting.account_type == account_type,
+            LedgerPosting.account_id.in_(account_ids),
+            or_(latest.c.as_of.is_(None), LedgerPosting.created_at >= latest.c.as_of),
+        )
+        .group_by(LedgerPosting.account_id)
+    )
+    if as_of is not None:
+        tail = tail.where(LedgerPosting.created_at <= as_of)
+    for account_id, total in (await db.execute(tail)).all():
+        result[account_id] += total or 0.0
+    return result
+
+
+async def balance(db: AsyncSession, account_type: str, account_id: int, as_of: Optional[datetime] = None) -> float:
+    return (await balances(db, account_type, [account_id], as_of))[account_id]
+
+
+async def history(db: AsyncSession, account_type: str, account_id: int, points: List[datetime]) -> List[float]:
+    """Balances of one account at each of the (ascending) points"""
+    if not points:
+        return []
+    start = await balance(db, account_type, account_id, points[0])
+    changes = await db.execute(
+        select(LedgerPosting.created_at, LedgerPosting.amount)
+        .where(
+            LedgerPosting.account_type == account_type,
+            LedgerPosting.account_id == account_id,
+            LedgerPosting.created_at >= points[0],
+            LedgerPosting.created_at <= points[-1],
+        )
+        .order_by(LedgerPosting.created_at)
+    )
+    changes = changes.all()
+    # Like balances(), the range includes postings at points[0]; start from just before them
+    start -= sum(amount for created_at, amount in changes if created_at == points[0])
+    times, running = [], []
+    total = start
+    for created_at, amount in changes:
+        total += amount
+        times.append(created_at)
+        running.append(total)
+    return [running[i - 1] if i else start for i in (bisect_right(times, point) for point in points)]
+
+
+async def begin_serializable(db: AsyncSession) -> None:
+    """
+    Begin the session's transaction at SERIALIZABLE isolation. PostgreSQL then aborts
+    one of two transactions that read and post to the same accounts concurrently;
+    SQLite, which has a single writer anyway, takes its write lock up front.
+    """
+    connection = await db.connection(execution_options={"isolation_level": "SERIALIZABLE"})
+    if connection.dialect.name == "sqlite":
+        await connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+async def run_serializable(db: AsyncSession, work: Callable[[], Awaitable[T]]) -> T:
+    """
+    Run work() in a serializable transaction and commit, running it again (up to
+    SERIALIZABLE_ATTEMPTS times) when the database aborts it as a serialization
+    failure. work() must only change the database through db; it reloads what it
+    needs since a rollback expires the session's objects.
+    """
+    # End the transaction the request's earlier reads began, the isolation level applies to the next one
+    await db.commit()
+    for attempt in range(1, SERIALIZABLE_ATTEMPTS + 1):
+        await begin_serializable(db)
+        try:
+            result = await work()
+            await db.commit()
+            return result
+        except DBAPIError as e:
+            await db.rollback()
+            if attempt == SERIALIZABLE_ATTEMPTS or getattr(e.orig, "sqlstate", None) not in RETRYABLE_SQLSTATES:
+                raise
+        except BaseException:
+            await db.rollback()
+            raise
+
+
+async def refresh_balance_columns(db: AsyncSession, account_type: str, account_ids: Iterable[int]) -> int:
+    """
+    Write the ledger balances of the accounts into their cached balance column where
+    it differs (caller commits). Returns the number of accounts updated. A refresh
+    that loses a race against a concurrent one is corrected by the next.
+    """
+    model, column = BALANCE_COLUMNS[account_type]
+    account_ids = list(account_ids)
+    updated = 0
+    for start in range(0, len(account_ids), CHUNK):
+        chunk = account_ids[start:start + CHUNK]
+        # In id order, so concurrent refreshes of overlapping accounts update rows in the same order
+        cached = dict((await db.execute(
+            select(model.id, getattr(model, column)).where(model.id.in_(chunk)).order_by(model.id)
+        )).all())
+        stale = [
+            {"id": account_id, column: total}
+            for account_id, total in (await balances(db, account_type, cached)).items()
+            if abs((cached[account_id] or 0.0) - total) > TOLERANCE
+        ]
+        if stale:
+            await db.execute(update(model), stale)
+        updated += len(stale)
+    return updated
+
+
+async def refresh_after_transfer(db: AsyncSession, bank_account_id: int, aim_ids: List[int]) -> None:
+    """
+    Refresh and commit the cached balances of the accounts of a committed transfer.
+    A failure is only logged: the transfer stands and the next reconcile repairs the cache.
+    """
+    try:
+        await refresh_balance_columns(db, ACCOUNT_BANK, [bank_account_id])
+        await refresh_balance_columns(db, ACCOUNT_AIM, sorted(aim_ids))
+        await db.commit()
+    except DBAPIError:
+        await db.rollback()
+        logger.warning("Refreshing the cached balances of bank account %s failed", bank_account_id, exc_info=True)
+
+
+async def reconcile_balance_columns(db: AsyncSession, since: datetime) -> int:
+    """Refresh the cached balance of every account posted to since `since` (caller commits)"""
+    updated = 0
+    for account_type in BALANCE_COLUMNS:
+        account_ids = (await db.execute(
+            select(LedgerPosting.account_id.distinct())
+            .where(LedgerPosting.account_type == account_type, LedgerPosting.created_at >= since)
+        )).scalars().all()
+        updated += await refresh_balance_columns(db, account_type, account_ids)
+    return updated
+
+
+def naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    """moment in UTC without tzinfo, the form of the ledger's DateTime columns (naive input is taken as UTC)"""
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def database_now(db: AsyncSession) -> datetime:
+    """The database's now(), as naive as the DateTime columns it fills"""
+    return (await db.execute(select(func.now()))).scalar().replace(tzinfo=None)
+
+
+async def take_snapshots(
+        db: AsyncSession,
+        min_postings: int = LEDGER_SNAPSHOT_MIN_POSTINGS,
+        settle: float = LEDGER_SETTLE_SECONDS,
+) -> int:
+    """
+    Snapshot every account with at least min_postings postings since its last
+    snapshot, as of `settle` seconds ago (caller commits). Only accounts posted
+    to since the previous run are looked at. Returns the number of snapshots.
+    """
+    cutoff = await database_now(db) - timedelta(seconds=settle)
+    previous_run = (await db.execute(select(func.max(BalanceSnapshot.as_of)))).scalar()
+
+    active = select(LedgerPosting.account_type, LedgerPosting.account_id).where(LedgerPosting.created_at < cutoff)
+    if previous_run is not None:
+        active = active.where(LedgerPosting.created_at >= previous_run)
+    active = active.distinct().subquery()
+
+    latest = (
+        select(BalanceSnapshot.account_type, BalanceSnapshot.account_id, func.max(BalanceSnapshot.as_of).label("as_of"))
+        .join(active, and_(
+            BalanceSnapshot.account_type == active.c.account_type,
+            BalanceSnapshot.account_id == active.c.account_id,
+        ))
+        .group_by(BalanceSnapshot.account_type, BalanceSnapshot.account_id)
+        .subquery()
+    )
+    previous = BalanceSnapshot.__table__.alias("previous")
+    tails = await db.execute(
+        select(
+            LedgerPosting.account_type, LedgerPosting.account_id,
+            func.count(LedgerPosting.id), func.sum(LedgerPosting.amount), previous.c.balance,
+        )
+        .join(active, and_(
+            LedgerPosting.account_type == active.c.account_type,
+            LedgerPosting.account_id == active.c.account_id,
+        ))
+        .outerjoin(latest, and_(
+            LedgerPosting.account_type == latest.c.account_type,
+            LedgerPosting.account_id == latest.c.account_id,
+        ))
+        .outerjoin(previous, and_(
+            previous.c.account_type == latest.c.account_type,
+            previous.c.account_id == latest.c.account_id,
+            previous.c.as_of == latest.c.as_of,
+        ))
+        .where(
+            LedgerPosting.created_at < cutoff,
+            or_(latest.c.as_of.is_(None), LedgerPosting.created_at >= latest.c.as_of),
+        )
+        .group_by(LedgerPosting.account_type, LedgerPosting.account_id, previous.c.balance)
+        .having(func.count(LedgerPosting.id) >= min_postings)
+    )
+    rows = [
+        {"account_type": account_type, "account_id": account_id, "as_of": cutoff,
+         "balance": (previous_balance or 0.0) + (total or 0.0)}
+        for account_type, account_id, _, total, previous_balance in tails.all()
+    ]
+    # Another worker may snapshot the same accounts at the same cut-off
+    stmt = dialect_insert(db)(BalanceSnapshot).on_conflict_do_nothing()
+    for start in range(0, len(rows), CHUNK):
+        await db.execute(stmt, rows[start:start + CHUNK])
+    return len(rows)
+
+
+async def snapshot_periodically() -> None:
+    """
+    Background task taking snapshots every LEDGER_SNAPSHOT_INTERVAL seconds. Each run
+    also reconciles the cached balances of the accounts posted to since the previous
+    run, or while a transaction of it may still have been in flight.
+    """
+    window = timedelta(seconds=LEDGER_SNAPSHOT_INTERVAL + LEDGER_SETTLE_SECONDS)
+    while True:
+        await asyncio.sleep(LEDGER_SNAPSHOT_INTERVAL)
+        try:
+            async with async_session() as db:
+                await take_snapshots(db)
+                await reconcile_balance_columns(db, await database_now(db) - window)
+                await db.commit()
+        except Exception:
+            logger.exception("Taking ledger snapshots failed")
+
+
+def _transfer_postings(account_type: str, first_user_id: Optional[int]):
+    """SELECT of the postings of all financial_transactions rows on one side (bank account or aim)"""
+    deposit = FinancialTransaction.transaction_type == FinancialTransactionType.DEPOSIT
+    if account_type == ACCOUNT_BANK:
+        owner, account_id = BankAccount, FinancialTransaction.bank_account_id
+        amount = case((deposit, -FinancialTransaction.amount), else_=FinancialTransaction.amount)
+    else:
+        owner, account_id = FinancialAim, FinancialTransaction.aim_id
+        amount = case((deposit, FinancialTransaction.amount), else_=-FinancialTransaction.amount)
+    query = (
+        select(
+            literal(account_type), account_id, amount, literal(KIND_TRANSFER), FinancialTransaction.id,
+            func.coalesce(FinancialTransaction.created_at, func.now()),
+        )
+        .join(owner, owner.id == account_id)
+    )
+    if first_user_id is not None:
+        query = query.where(owner.user_id >= first_user_id)
+    return query
+
+
+async def backfill(db: AsyncSession, first_user_id: Optional[int] = None) -> int:
+    """
+    Recreate the postings of all accounts (of users with id >= first_user_id) from
+    financial_transactions, plus an opening posting that makes each ledger balance
+    equal the balance column. Caller commits. Returns the number of postings in the ledger.
+    """
+    accounts = {ACCOUNT_BANK: BankAccount, ACCOUNT_AIM: FinancialAim}
+    for account_type, model in accounts.items():
+        owned = select(model.id)
+        if first_user_id is not None:
+            owned = owned.where(model.user_id >= first_user_id)
+        for table in (LedgerPosting, BalanceSnapshot):
+            await db.execute(delete(table).where(table.account_type == account_type, table.account_id.in_(owned)))
+
+    columns = ["account_type", "account_id", "amount", "kind", "financial_transaction_id", "created_at"]
+    for account_type in accounts:
+        await db.execute(
+            insert(LedgerPosting).from_select(columns, _transfer_postings(account_type, first_user_id))
+        )
+
+    now = await database_now(db)
+    openings = []
+    for account_type, model in accounts.items():
+        if model is BankAccount:
+            value, opened_at = BankAccount.balance, BankAccount.created_at
+        else:
+            # Aims have no creation time; they open with their first transfer
+            value, opened_at = func.coalesce(FinancialAim.current_amount, 0), func.min(LedgerPosting.created_at)
+        query = (
+            select(model.id, value, func.sum(LedgerPosting.amount), func.min(LedgerPosting.created_at), opened_at)
+            .outerjoin(LedgerPosting, and_(
+                LedgerPosting.account_type == account_type, LedgerPosting.account_id == model.id
+            ))
+            .group_by(model.id, value, *([opened_at] if model is BankAccount else []))
+        )
+        if first_user_id is not None:
+            query = query.where(model.user_id >= first_user_id)
+        for account_id, current, posted, first_posting, opened in (await db.execute(query)).all():
+            amount = current - (posted or 0.0)
+            if abs(amount) > TOLERANCE:
+                moments = [m.replace(tzinfo=None) for m in (opened, first_posting) if m is not None]
+                openings.append({
+                    "account_type": account_type, "account_id": account_id, "amount": amount,
+                    "kind": KIND_OPENING, "created_at": min(moments) if moments else now,
+                })
+    for start in range(0, len(openings), CHUNK):
+        await db.execute(insert(LedgerPosting), openings[start:start + CHUNK])
+
+    return (await db.execute(select(func.count(LedgerPosting.id)))).scalar()
+
+
+async def verify(db: AsyncSession) -> List[Tuple[str, int, float, float]]:
+    """(account type, id, cached balance column, ledger balance) of every account whose two balances differ"""
+    mismatches = []
+    for account_type, model, value in (
+            (ACCOUNT_BANK, BankAccount, BankAccount.balance),
+            (ACCOUNT_AIM, FinancialAim, func.coalesce(FinancialAim.current_amount, 0)),
+    ):
+        current = dict((await db.execute(select(model.id, value).order_by(model.id))).all())
+        ids = list(current)
+        for start in range(0, len(ids), CHUNK):
+            ledger_balances = await balances(db, account_type, ids[start:start + CHUNK])
+            mismatches.extend(
+                (account_type, account_id, current[account_id], total)
+                for account_id, total in ledger_balances.items()
+                if abs(current[account_id] - total) > TOLERANCE
+            )
+    return mismatches
@@ -0,0 +1,204 @@
+"""
+Cache of LLM-generated responses (/chat/advice, /chat/motivation).
+
+Entries are keyed by kind, user and a fingerprint of the data the prompt was
+built from, so a changed input never hits a stale answer even in a worker that
+missed an invalidation. Write paths additionally call `invalidate_user` to drop
+the user's entries right away. Entries expire after LLM_CACHE_TTL seconds and
+the least recently used ones are evicted beyond LLM_CACHE_MAX_ENTRIES.
+
+Backends (LLM_CACHE_BACKEND):
+  memory  per-process LRU (default)
+  sqlite  one SQLite file (LLM_CACHE_PATH) shared by all workers on the host
+  none    caching disabled
+"""
+import abc
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from app_config import LLM_CACHE_BACKEND, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_PATH, LLM_CACHE_TTL
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable digest of the inputs a response was generated from"""
+    return hashlib.sha256(json.dumps(parts, default=str, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def make_key(kind: str, user_id: int, digest: str) -> str:
+    return f"{kind}:{user_id}:{digest}"
+
+
+class CacheBackend(abc.ABC):
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: str, user_id: int, value: Dict[str, Any], ttl: float) -> None:
+        ...
+
+    @abc.abstractmethod
+    def invalidate_user(self, user_id: int) -> None:
+        ...
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        ...
+
+
+class NullBackend(CacheBackend):
+    def get(self, key):
+        return None
+
+    def set(self, key, user_id, value, ttl):
+        pass
+
+    def invalidate_user(self, user_id):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """LRU dict of key -> (expires_at, user_id, value)"""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._by_user: Dict[int, Set[str]] = {}
+
+    def _drop(self, key: str) -> None:
+        _, user_id, _ = self._entries.pop(key)
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def set(self, key, user_id, value, ttl):
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.time() + ttl, user_id, value)
+        self._by_user.setdefault(user_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        for key in list(self._by_user.get(user_id, ())):
+            self._drop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_user.clear()
+
+
+class SQLiteBackend(CacheBackend):
+    """Entries in a local SQLite file (WAL), visible to every worker process on the host"""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, user_id INTEGER NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_user ON llm_cache (user_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed ON llm_cache (accessed_at)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, user_id, value, ttl):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, user_id, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, user_id, json.dumps(value, ensure_ascii=False, default=str), now + ttl, now),
+        )
+        conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (now,))
+        conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def invalidate_user(self, user_id):
+        self._conn().execute("DELETE FROM llm_cache WHERE user_id = ?", (user_id,))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM llm_cache")
+
+
+BACKENDS = {"memory": MemoryBackend, "sqlite": SQLiteBackend, "none": NullBackend}
+
+_backend: Optional[CacheBackend] = None
+
+
+def get_backend() -> CacheBackend:
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[LLM_CACHE_BACKEND]()
+    return _backend
+
+
+def set_backend(backend: CacheBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+async def _call(method: str, *args):
+    backend = get_backend()
+    if isinstance(backend, SQLiteBackend):
+        # File I/O (and lock waits) stay off the event loop
+        return await asyncio.to_thread(getattr(backend, method), *args)
+    return getattr(backend, method)(*args)
+
+
+async def lookup(kind: str, user_id: int, digest: str) -> Optional[Dict[str, Any]]:
+    return await _call("get", make_key(kind, user_id, digest))
+
+
+async def store(kind: str, user_id: int, digest: str, value: Dict[str, Any], ttl: float = LLM_CACHE_TTL) -> None:
+    await _call("set", make_key(kind, user_id, digest), user_id, value, ttl)
+
+
+async def invalidate_user(user_id: int) -> None:
+    """Drop every cached response of the user; call from write paths of transactions and aims"""
+    await _call("invalidate_user", user_id)
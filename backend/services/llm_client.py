@@ -0,0 +1,274 @@
+"""
+Shared async client for the LiteLLM proxy.
+
+One httpx.AsyncClient per worker keeps a keep-alive connection pool to the
+proxy, so handlers await completions instead of blocking the event loop in
+`requests.post`. A semaphore caps the number of calls in flight
+(LLM_MAX_CONCURRENCY); connection errors, timeouts, 429 and 5xx answers are
+retried with exponential backoff and full jitter, honouring Retry-After.
+Streamed completions are only retried until their first token arrived.
+
+Identical chat completions (same model, parameters and whitespace-normalized
+messages) requested while one is already in flight share that upstream call
+instead of issuing another (single flight); see `get_stats`.
+
+Every upstream call is timed and its token usage counted in services/metrics.py.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Optional, Union
+
+import httpx
+
+from app_config import (
+    LLM_CONNECT_TIMEOUT, LLM_MAX_CONCURRENCY, LLM_MAX_CONNECTIONS, LLM_MAX_RETRIES, LLM_TIMEOUT,
+    X_LITELLM_API_KEY, X_LITELLM_API_URL,
+)
+from services import metrics
+
+CHAT_MODEL = "gpt-4o-mini"
+TRANSCRIPTION_MODEL = "whisper-1"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+
+class LLMError(Exception):
+    """The proxy could not be reached or answered with an error after all retries"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+_client: Optional[httpx.AsyncClient] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+# Upstream chat completions in flight, by request key
+_inflight: Dict[str, "asyncio.Task[str]"] = {}
+_stats = {"requests": 0, "coalesced": 0, "upstream": 0}
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=X_LITELLM_API_URL,
+            headers={
+                "x-litellm-api-key": X_LITELLM_API_KEY,
+                "Authorization": f"Bearer {X_LITELLM_API_KEY}",
+                "accept": "application/json",
+            },
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphore
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _backoff(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after and retry_after.replace(".", "", 1).isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+async def post(path: str, timeout: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+    """POST to the proxy and return the decoded JSON body, retrying transient failures"""
+    client = get_client()
+    if timeout is not None:
+        kwargs["timeout"] = httpx.Timeout(timeout, connect=LLM_CONNECT_TIMEOUT)
+    model = (kwargs.get("json") or {}).get("model") or (kwargs.get("files") or {}).get("model", (None, ""))[1]
+
+    async with _get_semaphore():
+        metrics.llm_in_flight.inc()
+        started = time.perf_counter()
+        status, usage = "error", None
+        try:
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                last = attempt == LLM_MAX_RETRIES
+                # Uploaded file objects are streamed, so each attempt starts from their beginning
+                for value in (kwargs.get("files") or {}).values():
+                    if hasattr(value[1], "seek"):
+                        value[1].seek(0)
+                try:
+                    response = await client.post(path, **kwargs)
+                except httpx.TransportError as e:
+                    if last:
+                        raise LLMError(f"AI service unavailable: {e!r}") from e
+                    await asyncio.sleep(_backoff(attempt))
+                    continue
+
+                status = str(response.status_code)
+                if response.status_code in RETRY_STATUSES and not last:
+                    await asyncio.sleep(_backoff(attempt, response))
+                    continue
+                if response.status_code != 200:
+                    raise LLMError(f"AI service error: {response.text}", response.status_code)
+                try:
+                    result = response.json()
+                except ValueError as e:
+                    raise LLMError("AI service returned invalid JSON") from e
+                if not isinstance(result, dict):
+                    raise LLMError("AI service returned invalid JSON")
+                usage = result.get("usage")
+                return result
+        finally:
+            metrics.llm_in_flight.dec()
+            metrics.observe_llm(path, model, status, time.perf_counter() - started, usage)
+
+
+async def chat_completion(
+        messages: List[Dict[str, str]],
+        model: str = CHAT_MODEL,
+        temperature: float = 0.7,
+        response_format: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+) -> str:
+    """Content of the first choice of a chat completion"""
+    data = {"model": model, "messages": messages, "temperature": temperature}
+    if response_format is not None:
+        data["response_format"] = response_format
+
+    async def call() -> str:
+        _stats["upstream"] += 1
+        result = await post("/v1/chat/completions", json=data, timeout=timeout)
+        try:
+            return result["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise LLMError("AI service returned no completion") from e
+
+    return await _single_flight(_request_key(data), call)
+
+
+def _request_key(data: Dict[str, Any]) -> str:
+    normalized = dict(data, messages=[
+        {**m, "content": " ".join(str(m.get("content", "")).split())} for m in data["messages"]
+    ])
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def _single_flight(key: str, call) -> "asyncio.Future[str]":
+    """
+    Await the in-flight call for key, or start it. The call runs as its own task,
+    so a caller that is cancelled (client went away) does not fail the others.
+    """
+    _stats["requests"] += 1
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(call())
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _inflight.pop(key, None) if _inflight.get(key) is t else None)
+        # Mark a failure as retrieved even if every caller was cancelled
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    else:
+        _stats["coalesced"] += 1
+    return asyncio.shield(task)
+
+
+def get_stats() -> Dict[str, Any]:
+    """Chat completion requests, how many joined an in-flight call, and the resulting hit rate"""
+    requests = _stats["requests"]
+    return {
+        **_stats,
+        "in_flight": len(_inflight),
+        "coalescing_hit_rate": _stats["coalesced"] / requests if requests else 0.0,
+    }
+
+
+async def stream_chat_completion(
+        messages: List[Dict[str, str]],
+        model: str = CHAT_MODEL,
+        temperature: float = 0.7,
+        response_format: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """Content deltas of a streamed (server-sent events) chat completion"""
+    data = {"model": model, "messages": messages, "temperature": temperature, "stream": True}
+    if response_format is not None:
+        data["response_format"] = response_format
+    kwargs = {} if timeout is None else {"timeout": httpx.Timeout(timeout, connect=LLM_CONNECT_TIMEOUT)}
+
+    client = get_client()
+    started = False
+    async with _get_semaphore():
+        metrics.llm_in_flight.inc()
+        call_started = time.perf_counter()
+        status, usage = "error", None
+        try:
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                last = attempt == LLM_MAX_RETRIES
+                try:
+                    async with client.stream("POST", "/v1/chat/completions", json=data, **kwargs) as response:
+                        status = str(response.status_code)
+                        if response.status_code in RETRY_STATUSES and not last:
+                            delay = _backoff(attempt, response)
+                        elif response.status_code != 200:
+                            await response.aread()
+                            raise LLMError(f"AI service error: {response.text}", response.status_code)
+                        else:
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                payload = line[5:].strip()
+                                if payload == "[DONE]":
+                                    return
+                                try:
+                                    chunk = json.loads(payload)
+                                except ValueError as e:
+                                    raise LLMError("AI service returned invalid stream data") from e
+                                # Proxies that report usage on streams send it with the last chunk
+                                usage = chunk.get("usage") or usage
+                                for choice in chunk.get("choices", []):
+                                    content = (choice.get("delta") or {}).get("content")
+                                    if content:
+                                        started = True
+                                        yield content
+                            return
+                except httpx.TransportError as e:
+                    if started or last:
+                        raise LLMError(f"AI service unavailable: {e!r}") from e
+                    delay = _backoff(attempt)
+                await asyncio.sleep(delay)
+        finally:
+            metrics.llm_in_flight.dec()
+            metrics.observe_llm("/v1/chat/completions", model, status, time.perf_counter() - call_started, usage)
+
+
+async def transcribe(
+        audio: Union[bytes, BinaryIO],
+        filename: str = "audio.wav",
+        content_type: str = "audio/wav",
+        model: str = TRANSCRIPTION_MODEL,
+        timeout: Optional[float] = None,
+) -> str:
+    """Text of an audio transcription; file objects are streamed rather than read into memory"""
+    files = {
+        "file": (filename, audio, content_type),
+        "model": (None, model),
+    }
+    result = await post("/v1/audio/transcriptions", files=files, timeout=timeout)
+    try:
+        return result["text"]
+    except KeyError as e:
+        raise LLMError("AI service returned no transcription") from e
@@ -0,0 +1,303 @@
+"""
+In-process metrics, exposed in the Prometheus text format at /metrics.
+
+  http_request_duration_seconds{method,route,status}   histogram, route is the path template
+  http_requests_in_progress                             gauge
+  db_query_duration_seconds{operation}                  histogram per statement (engine events)
+  db_queries_per_request{route}, db_time_per_request_seconds{route}
+  llm_request_duration_seconds{endpoint,model,status}   histogram per proxy call, retries included
+  llm_tokens_total{endpoint,model,kind}                 counter from the answers' usage
+  db_pool_*, llm_in_flight                              gauges read at scrape time
+
+Samples are plain lists and dicts updated on the event loop thread, so
+recording takes no lock. With several workers (METRICS_MULTIPROC_DIR set), every
+worker writes its samples to <dir>/<pid>-<random>.json every
+METRICS_FLUSH_INTERVAL seconds (and when it serves /metrics) and /metrics sums
+the files of all workers, its own included: whichever worker serves a scrape,
+counters never go backwards. Histograms and counters of workers that exited
+stay in the sums (a new worker reusing a pid gets a file of its own); gauges
+only count the files written within the last three intervals. Empty the
+directory when the server is redeployed.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import time
+import uuid
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+
+from app_config import METRICS_FLUSH_INTERVAL, METRICS_MULTIPROC_DIR
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.samples: Dict[Tuple[str, ...], Any] = {}
+        REGISTRY[name] = self
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self.samples[labels] = self.samples.get(labels, 0.0) + amount
+
+
+class Gauge(Metric):
+    """Value moved with inc/dec, or read from `callback` at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.samples[()] = self.samples.get((), 0.0) + amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def collect(self) -> None:
+        if self.callback is not None:
+            self.samples = {(): float(self.callback())}
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels: str) -> None:
+        # [count per bucket..., count above the last bucket, sum]
+        sample = self.samples.get(labels)
+        if sample is None:
+            sample = self.samples[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        sample[bisect_left(self.buckets, value)] += 1
+        sample[-1] += value
+
+
+REGISTRY: Dict[str, Metric] = {}
+
+http_duration = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+http_in_progress = Gauge("http_requests_in_progress", "HTTP requests being served")
+db_query_duration = Histogram("db_query_duration_seconds", "SQL statement latency", ("operation",), QUERY_BUCKETS)
+db_queries_per_request = Histogram(
+    "db_queries_per_request", "SQL statements per HTTP request", ("route",), COUNT_BUCKETS
+)
+db_time_per_request = Histogram("db_time_per_request_seconds", "SQL time per HTTP request", ("route",))
+llm_duration = Histogram(
+    "llm_request_duration_seconds", "LLM proxy call latency, retries included", ("endpoint", "model", "status")
+)
+llm_tokens = Counter("llm_tokens_total", "Tokens reported by the LLM proxy", ("endpoint", "model", "kind"))
+llm_in_flight = Gauge("llm_in_flight", "LLM proxy calls being made")
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Statements and DB time of the HTTP request being served
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "metrics_request", default=None
+)
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement of the (async) engine and report its connection pool as gauges"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["metrics_started"].pop()
+        db_query_duration.observe(seconds, statement.lstrip().split(None, 1)[0].upper() if statement else "")
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+
+    pool = sync_engine.pool
+    for name, method in (("size", "size"), ("checked_out", "checkedout"), ("overflow", "overflow")):
+        if hasattr(pool, method):
+            Gauge(f"db_pool_{name}", f"Database connection pool {name.replace('_', ' ')}", getattr(pool, method))
+
+
+def observe_llm(endpoint: str, model: str, status: str, seconds: float, usage: Optional[Dict[str, Any]]) -> None:
+    llm_duration.observe(seconds, endpoint, model, status)
+    for kind in ("prompt", "completion"):
+        tokens = (usage or {}).get(f"{kind}_tokens")
+        if tokens:
+            llm_tokens.inc(endpoint, model, kind, amount=tokens)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request until its last body chunk was sent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        http_in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            http_in_progress.dec()
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            http_duration.observe(time.perf_counter() - start, scope["method"], route, status)
+            db_queries_per_request.observe(stats.queries, route)
+            db_time_per_request.observe(stats.db_seconds, route)
+
+
+def _snapshot() -> Dict[str, Any]:
+    for metric in REGISTRY.values():
+        if isinstance(metric, Gauge):
+            metric.collect()
+    return {
+        name: {
+            "kind": metric.kind,
+            "documentation": metric.documentation,
+            "labelnames": list(metric.labelnames),
+            "buckets": list(getattr(metric, "buckets", ())),
+            "samples": [[list(labels), value] for labels, value in metric.samples.items()],
+        }
+        for name, metric in REGISTRY.items()
+    }
+
+
+_file_name: Optional[str] = None
+_file_pid: Optional[int] = None
+
+
+def _own_file() -> str:
+    """This process' file name, unique even if a dead worker had the same pid (and after a fork)"""
+    global _file_name, _file_pid
+    if _file_pid != os.getpid():
+        _file_pid = os.getpid()
+        _file_name = f"{_file_pid}-{uuid.uuid4().hex[:12]}.json"
+    return _file_name
+
+
+def flush() -> None:
+    """Write this worker's samples to the multiprocess directory (atomic rename)"""
+    if not METRICS_MULTIPROC_DIR:
+        return
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    path = os.path.join(METRICS_MULTIPROC_DIR, _own_file())
+    with open(path + ".tmp", "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(path + ".tmp", path)
+
+
+def _snapshots() -> Iterable[Tuple[Dict[str, Any], bool]]:
+    """(samples, worker is alive) of every worker; in multiprocess mode all read from the directory"""
+    if not METRICS_MULTIPROC_DIR:
+        yield _snapshot(), True
+        return
+    flush()
+    fresh_after = time.time() - 3 * METRICS_FLUSH_INTERVAL
+    for name in os.listdir(METRICS_MULTIPROC_DIR):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(METRICS_MULTIPROC_DIR, name)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            alive = os.path.getmtime(path) >= fresh_after
+        except (OSError, ValueError):
+            continue
+        yield data, alive
+
+
+def _merge(snapshots: Iterable[Tuple[Dict[str, Any], bool]]) -> Dict[str, Dict[str, Any]]:
+    merged: Dict[str, Dict[str, Any]] = {}
+    for data, alive in snapshots:
+        for name, metric in data.items():
+            if metric["kind"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    target["samples"][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    target["samples"][key] = current + value
+    return merged
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: List[str], values: Iterable[Any]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render() -> str:
+    """All metrics (of all workers) in the Prometheus text exposition format"""
+    lines = []
+    for name, metric in sorted(_merge(_snapshots()).items()):
+        lines.append(f"# HELP {name} {metric['documentation']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labelnames"]
+        for labels, value in sorted(metric["samples"].items()):
+            if metric["kind"] == "histogram":
+                cumulative = 0
+                for bound, count in zip(metric["buckets"] + ["+Inf"], value[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(names + ['le'], list(labels) + [bound])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(names, labels)} {value[-1]}")
+                lines.append(f"{name}_count{_labels(names, labels)} {cumulative}")
+            else:
+                lines.append(f"{name}{_labels(names, labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+async def flush_periodically() -> None:
+    """Background task of a worker in multiprocess mode"""
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
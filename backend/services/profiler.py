@@ -0,0 +1,212 @@
+"""
+On-demand sampling profiler for single requests.
+
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>` (only if a
+token is configured) or is picked by PROFILE_SAMPLE_RATE. While it runs, a
+thread samples the request's task every PROFILE_INTERVAL seconds: the stack of
+the event loop thread when the task is running, otherwise the chain of
+coroutines the task is suspended in, under a "(waiting)" leaf, so time spent
+awaiting the database or the LLM proxy shows up too. Profiles are written to
+PROFILE_DIR as speedscope JSON (https://www.speedscope.app) and/or pstats
+files named after the time, route and duration.
+
+When neither a token nor a rate is set the middleware is not installed at all;
+otherwise an unprofiled request costs a header lookup and a random number.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import marshal
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app_config import PROFILE_DIR, PROFILE_FORMAT, PROFILE_INTERVAL, PROFILE_SAMPLE_RATE, PROFILE_TOKEN
+
+logger = logging.getLogger(__name__)
+
+ENABLED = bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+HEADER = b"x-profile"
+
+# (file, first line, function), as pstats identifies functions
+FrameKey = Tuple[str, int, str]
+WAITING: FrameKey = ("~", 0, "(waiting)")
+
+
+def _frame_key(frame) -> FrameKey:
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def _awaiting_frames(coro) -> List:
+    """Frames of a suspended coroutine and of everything it awaits, outermost first"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is not None:
+            frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return frames
+
+
+class Sampler:
+    """Samples the stack of one asyncio task from a background thread"""
+
+    def __init__(self, task: asyncio.Task, interval: float = PROFILE_INTERVAL):
+        self.task = task
+        self.loop = task.get_loop()
+        self.thread_id = threading.get_ident()
+        self.interval = interval
+        self.samples: List[Tuple[FrameKey, ...]] = []
+        self.weights: List[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> float:
+        """Stop sampling; returns the profiled wall time"""
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self.duration
+
+    def _run(self) -> None:
+        last = self.started
+        while not self._stop.wait(self.interval):
+            stack = self._stack()
+            now = time.perf_counter()
+            if stack:
+                self.samples.append(stack)
+                self.weights.append(now - last)
+            last = now
+
+    def _stack(self) -> Tuple[FrameKey, ...]:
+        coro = self.task.get_coro()
+        root = getattr(coro, "cr_frame", None)
+        if asyncio.current_task(self.loop) is self.task:
+            frames = []
+            frame = sys._current_frames().get(self.thread_id)
+            while frame is not None:
+                frames.append(frame)
+                if frame is root:
+                    break
+                frame = frame.f_back
+            return tuple(_frame_key(f) for f in reversed(frames))
+        return tuple(_frame_key(f) for f in _awaiting_frames(coro)) + (WAITING,)
+
+
+def to_speedscope(sampler: Sampler, name: str) -> Dict:
+    frames: Dict[FrameKey, int] = {}
+    samples = [[frames.setdefault(key, len(frames)) for key in stack] for stack in sampler.samples]
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "shared": {"frames": [{"name": fn, "file": file, "line": line} for file, line, fn in frames]},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sampler.duration,
+            "samples": samples,
+            "weights": sampler.weights,
+        }],
+        "activeProfileIndex": 0,
+        "exporter": "services/profiler.py",
+    }
+
+
+def to_pstats(sampler: Sampler) -> Dict:
+    """
+    The marshalled dict pstats.Stats loads: {func: (calls, calls, self time, cumulative time, callers)}.
+    Calls are the numbers of samples a function appears in.
+    """
+    self_time: Dict[FrameKey, float] = defaultdict(float)
+    cumulative: Dict[FrameKey, float] = defaultdict(float)
+    calls: Dict[FrameKey, int] = defaultdict(int)
+    callers: Dict[FrameKey, Dict[FrameKey, list]] = defaultdict(dict)
+    for stack, weight in zip(sampler.samples, sampler.weights):
+        self_time[stack[-1]] += weight
+        for key in set(stack):
+            cumulative[key] += weight
+            calls[key] += 1
+        for caller, callee in set(zip(stack, stack[1:])):
+            entry = callers[callee].setdefault(caller, [0, 0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += 1
+            entry[2] += weight if callee == stack[-1] else 0.0
+            entry[3] += weight
+    return {
+        key: (calls[key], calls[key], self_time[key], cumulative[key],
+              {caller: tuple(entry) for caller, entry in callers[key].items()})
+        for key in cumulative
+    }
+
+
+def write_profile(sampler: Sampler, method: str, route: str, status: str) -> List[str]:
+    """Write the profile in PROFILE_FORMAT ("speedscope", "pstats" or "both"); returns the paths"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    tag = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    base = os.path.join(
+        PROFILE_DIR,
+        f"{datetime.now():%Y%m%dT%H%M%S.%f}_{method}_{tag}_{status}_{sampler.duration * 1000:.0f}ms",
+    )
+    paths = []
+    if PROFILE_FORMAT in ("speedscope", "both"):
+        with open(base + ".speedscope.json", "w") as f:
+            json.dump(to_speedscope(sampler, f"{method} {route} ({sampler.duration * 1000:.0f} ms)"), f)
+        paths.append(base + ".speedscope.json")
+    if PROFILE_FORMAT in ("pstats", "both"):
+        with open(base + ".pstats", "wb") as f:
+            marshal.dump(to_pstats(sampler), f)
+        paths.append(base + ".pstats")
+    return paths
+
+
+def _requested(scope) -> bool:
+    if PROFILE_TOKEN:
+        for name, value in scope["headers"]:
+            if name == HEADER and hmac.compare_digest(value, PROFILE_TOKEN.encode()):
+                return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class ProfilerMiddleware:
+    """ASGI middleware profiling requests that asked for it or were sampled"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _requested(scope):
+            return await self.app(scope, receive, send)
+
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        sampler = Sampler(asyncio.current_task())
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            route = getattr(scope.get("route"), "path", scope["path"])
+            paths = await run_in_threadpool(write_profile, sampler, scope["method"], route, status)
+            logger.info("Profiled %s %s in %.0f ms: %s", scope["method"], route, sampler.duration * 1000, paths)
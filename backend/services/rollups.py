@@ -0,0 +1,206 @@
+"""
+Monthly per-user rollups of transactions (`transaction_rollups`).
+
+Each row holds the count and sum of one user's transactions in one month for a
+(source, type, category). Write paths call `record_transactions` /
+`record_aim_transfers` in their own transaction; the upsert adds to the
+existing row, so concurrent writers never lose an increment. Readers
+aggregate rollup rows, whose number grows with months of history instead of
+with transactions. `rebuild` recomputes everything from the raw tables
+(scripts/backfill_rollups.py; migration 0003 fills the table on upgrade).
+
+The category is the transaction's free-text description, as
+/transactions/categories reports it, so the number of rows is one per
+distinct description a user used in a month, not a fixed set of categories.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, desc, func, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import dialect_insert
+from models import (
+    BankAccount, FinancialTransaction, FinancialTransactionType, Transaction, TransactionRollup
+)
+
+SOURCE_TRANSACTION = "transaction"
+SOURCE_AIM_TRANSFER = "aim_transfer"
+# Rows per chunk when rebuilding from the raw tables
+SCAN_CHUNK = 10000
+
+RollupKey = Tuple[int, str, date, str, str]
+
+
+def month_of(moment: datetime) -> date:
+    return date(moment.year, moment.month, 1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _type_name(transaction_type) -> str:
+    return getattr(transaction_type, "value", transaction_type)
+
+
+def _aggregate(rows: Iterable[Tuple[int, str, datetime, object, str, float]]) -> Dict[RollupKey, List[float]]:
+    """(user_id, source, created_at, type, category, amount) rows -> {key: [count, total]}"""
+    totals: Dict[RollupKey, List[float]] = defaultdict(lambda: [0, 0.0])
+    for user_id, source, created_at, transaction_type, category, amount in rows:
+        entry = totals[(user_id, source, month_of(created_at), _type_name(transaction_type), category or "")]
+        entry[0] += 1
+        entry[1] += amount
+    return totals
+
+
+async def add_totals(db: AsyncSession, totals: Dict[RollupKey, List[float]]) -> None:
+    """Add counts and sums to the rollup rows, creating missing ones"""
+    if not totals:
+        return
+    values = [
+        {"user_id": user_id, "source": source, "month": month, "transaction_type": transaction_type,
+         "category": category, "count": int(count), "total": total}
+        for (user_id, source, month, transaction_type, category), (count, total) in totals.items()
+    ]
+    insert = dialect_insert(db)
+    stmt = insert(TransactionRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            TransactionRollup.user_id, TransactionRollup.source, TransactionRollup.month,
+            TransactionRollup.transaction_type, TransactionRollup.category,
+        ],
+        set_={
+            "count": TransactionRollup.count + stmt.excluded.count,
+            "total": TransactionRollup.total + stmt.excluded.total,
+        },
+    )
+    await db.execute(stmt, values)
+
+
+async def record_transactions(db: AsyncSession, transactions: Iterable[Transaction]) -> None:
+    """Count new `transactions` rows (created_at must be set). Commits with the caller."""
+    await add_totals(db, _aggregate(
+        (t.user_id, SOURCE_TRANSACTION, t.created_at, t.transaction_type, t.description, t.amount)
+        for t in transactions
+    ))
+
+
+async def record_aim_transfers(db: AsyncSession, user_id: int, transfers: Iterable[FinancialTransaction]) -> None:
+    """Count new `financial_transactions` rows of user_id's bank account (created_at must be set)."""
+    await add_totals(db, _aggregate(
+        (user_id, SOURCE_AIM_TRANSFER, t.created_at, t.transaction_type, "", t.amount)
+        for t in transfers
+    ))
+
+
+async def rebuild(db: AsyncSession) -> int:
+    """Recompute all rollups from the raw tables in one pass each (caller commits). Returns row count."""
+    await db.execute(delete(TransactionRollup))
+
+    totals: Dict[RollupKey, List[float]] = defaultdict(lambda: [0, 0.0])
+    scans = [
+        select(Transaction.user_id, Transaction.created_at, Transaction.transaction_type,
+               Transaction.description, Transaction.amount)
+        .where(Transaction.user_id.is_not(None), Transaction.created_at.is_not(None)),
+        select(BankAccount.user_id, FinancialTransaction.created_at, FinancialTransaction.transaction_type,
+               literal(""), FinancialTransaction.amount)
+        .join(BankAccount, BankAccount.id == FinancialTransaction.bank_account_id)
+        .where(FinancialTransaction.created_at.is_not(None)),
+    ]
+    for source, query in zip((SOURCE_TRANSACTION, SOURCE_AIM_TRANSFER), scans):
+        result = await db.stream(query.execution_options(yield_per=SCAN_CHUNK))
+        async for chunk in result.partitions(SCAN_CHUNK):
+            for key, (count, total) in _aggregate(
+                    (user_id, source, created_at, transaction_type, category, amount)
+                    for user_id, created_at, transaction_type, category, amount in chunk
+            ).items():
+                totals[key][0] += count
+                totals[key][1] += total
+
+    keys = list(totals)
+    for start in range(0, len(keys), SCAN_CHUNK):
+        await add_totals(db, {key: totals[key] for key in keys[start:start + SCAN_CHUNK]})
+    return len(keys)
+
+
+async def top_categories(db: AsyncSession, user_id: int, limit: int = 10) -> List[str]:
+    """Transaction descriptions of the user, most frequent first"""
+    result = await db.execute(
+        select(TransactionRollup.category, func.sum(TransactionRollup.count).label("count"))
+        .where(TransactionRollup.user_id == user_id, TransactionRollup.source == SOURCE_TRANSACTION)
+        .group_by(TransactionRollup.category)
+        .order_by(desc("count"))
+        .limit(limit)
+    )
+    return [row[0] for row in result.all()]
+
+
+async def monthly_summary(
+        db: AsyncSession, user_id: int, since: Optional[date] = None
+) -> List[Tuple[date, str, int, float]]:
+    """(month, type, count, total) of the user's transactions, oldest month first"""
+    query = (
+        select(TransactionRollup.month, TransactionRollup.transaction_type,
+               func.sum(TransactionRollup.count), func.sum(TransactionRollup.total))
+        .where(TransactionRollup.user_id == user_id, TransactionRollup.source == SOURCE_TRANSACTION)
+        .group_by(TransactionRollup.month, TransactionRollup.transaction_type)
+        .order_by(TransactionRollup.month, TransactionRollup.transaction_type)
+    )
+    if since is not None:
+        query = query.where(TransactionRollup.month >= since)
+    return [tuple(row) for row in (await db.execute(query)).all()]
+
+
+async def aim_transfer_totals(db: AsyncSession, user_id: int, since: datetime) -> Tuple[float, float]:
+    """
+    (deposits, withdrawals) of the user's aim transfers since `since`. Whole months
+    come from the rollups; only the partial first month is read from raw rows.
+    """
+    return (await aim_transfer_totals_many(db, [user_id], since))[user_id]
+
+
+async def aim_transfer_totals_many(
+        db: AsyncSession, user_ids: Iterable[int], since: datetime
+) -> Dict[int, Tuple[float, float]]:
+    """`aim_transfer_totals` of several users in two queries"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    first_full_month = month_of(since)
+    if since != datetime.combine(first_full_month, datetime.min.time()):
+        first_full_month = next_month(first_full_month)
+
+    deposit = FinancialTransactionType.DEPOSIT
+    withdrawal = FinancialTransactionType.WITHDRAWAL
+    totals = {user_id: [0.0, 0.0] for user_id in user_ids}
+    edge = await db.execute(
+        select(
+            BankAccount.user_id,
+            func.sum(case((FinancialTransaction.transaction_type == deposit, FinancialTransaction.amount), else_=0)),
+            func.sum(case((FinancialTransaction.transaction_type == withdrawal, FinancialTransaction.amount), else_=0)),
+        ).join(BankAccount).where(
+            BankAccount.user_id.in_(user_ids),
+            FinancialTransaction.created_at >= since,
+            FinancialTransaction.created_at < datetime.combine(first_full_month, datetime.min.time()),
+        ).group_by(BankAccount.user_id)
+    )
+    for user_id, income, outcome in edge.all():
+        totals[user_id][0] += float(income or 0)
+        totals[user_id][1] += float(outcome or 0)
+
+    months = await db.execute(
+        select(TransactionRollup.user_id, TransactionRollup.transaction_type, func.sum(TransactionRollup.total))
+        .where(
+            TransactionRollup.user_id.in_(user_ids),
+            TransactionRollup.source == SOURCE_AIM_TRANSFER,
+            TransactionRollup.month >= first_full_month,
+        )
+        .group_by(TransactionRollup.user_id, TransactionRollup.transaction_type)
+    )
+    for user_id, transaction_type, total in months.all():
+        if transaction_type in (deposit.value, withdrawal.value):
+            totals[user_id][transaction_type == withdrawal.value] += float(total or 0)
+    return {user_id: (income, outcome) for user_id, (income, outcome) in totals.items()}
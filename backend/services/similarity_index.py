@@ -0,0 +1,327 @@
+"""
+In-process nearest-neighbour indexes over normalized profile vectors.
+
+Vectors are standardized with the population mean/std and L2 normalized, so
+cosine similarity is a plain dot product. `ExactIndex` scans every row;
+`RandomProjectionIndex` hashes rows with random hyperplanes into several
+tables and only re-ranks the rows that share (or are one bit away from) the
+query's bucket. Both support incremental upserts/removals.
+"""
+import asyncio
+import math
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app_config import SIMILARITY_INDEX
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first, without sorting everything"""
+    if k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(len(scores))
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def normalize_rows(matrix: np.ndarray, mean: np.ndarray, std: np.ndarray) -> np.ndarray:
+    """Standardize, then scale every row to unit length"""
+    scaled = (np.atleast_2d(matrix) - mean) / std
+    norms = np.linalg.norm(scaled, axis=1, keepdims=True)
+    return scaled / np.where(norms > 0, norms, 1.0)
+
+
+class SimilarityIndex:
+    """Growable store of unit vectors keyed by user id; subclasses pick the candidates"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._reset()
+
+    def _reset(self) -> None:
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, self.dim))
+        self._alive = np.empty(0, dtype=bool)
+        self._size = 0
+        self._rows: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _append(self, ids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        needed = self._size + len(ids)
+        if needed > len(self._ids):
+            capacity = max(needed, 2 * len(self._ids), 1024)
+            self._ids = np.resize(self._ids, capacity)
+            self._alive = np.resize(self._alive, capacity)
+            grown = np.empty((capacity, self.dim))
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+        rows = np.arange(self._size, needed)
+        self._ids[rows] = ids
+        self._vectors[rows] = vectors
+        self._alive[rows] = True
+        self._size = needed
+        for uid, row in zip(ids.tolist(), rows.tolist()):
+            self._rows[uid] = row
+        return rows
+
+    def build(self, ids: Sequence[int], vectors: np.ndarray) -> None:
+        self._reset()
+        self.upsert(ids, vectors)
+
+    def upsert(self, ids: Sequence[int], vectors: np.ndarray) -> np.ndarray:
+        """Insert or replace rows, returns their storage positions"""
+        ids = np.asarray(ids, dtype=np.int64)
+        self.remove(ids.tolist())
+        return self._append(ids, np.atleast_2d(vectors))
+
+    def remove(self, ids: Iterable[int]) -> None:
+        for uid in ids:
+            row = self._rows.pop(uid, None)
+            if row is not None:
+                self._alive[row] = False
+
+    def get_vector(self, user_id: int) -> Optional[np.ndarray]:
+        row = self._rows.get(user_id)
+        return None if row is None else self._vectors[row]
+
+    def _all_rows(self) -> np.ndarray:
+        return np.flatnonzero(self._alive[:self._size])
+
+    def _candidates(self, vector: np.ndarray) -> np.ndarray:
+        return self._all_rows()
+
+    def _rank(self, rows: np.ndarray, vector: np.ndarray, k: int,
+              exclude: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        excluded = [self._rows[uid] for uid in exclude if uid in self._rows]
+        if excluded:
+            rows = rows[~np.isin(rows, excluded)]
+        scores = self._vectors[rows] @ vector
+        best = top_k(scores, k)
+        return self._ids[rows[best]], scores[best]
+
+    def query(self, vector: np.ndarray, k: int, exclude: Iterable[int] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (user ids, cosine similarities) of the k nearest rows"""
+        return self._rank(self._candidates(vector), vector, k, exclude)
+
+
+class ExactIndex(SimilarityIndex):
+    """Brute force scan of every row"""
+
+
+class RandomProjectionIndex(SimilarityIndex):
+    """
+    Random-hyperplane LSH with multi-probe lookups. Each table keeps its codes
+    sorted so buckets are found with searchsorted; rows inserted after the last
+    merge sit in a small pending list that is always scanned. At most about
+    max_candidates rows are re-ranked exactly per query.
+    """
+
+    def __init__(self, dim: int, n_tables: int = 8, bucket_size: int = 64,
+                 max_candidates: int = 4096, seed: int = 0):
+        super().__init__(dim)
+        self.n_tables = n_tables
+        self.bucket_size = bucket_size
+        self.max_candidates = max_candidates
+        self.seed = seed
+        self.n_bits = 0
+        self._planes = np.empty((n_tables, 0, dim))
+        self._codes = np.empty((0, n_tables), dtype=np.int64)
+        self._sorted_codes = [np.empty(0, dtype=np.int64)] * n_tables
+        self._sorted_rows = [np.empty(0, dtype=np.int64)] * n_tables
+        self._pending = []
+
+    def _hash(self, vectors: np.ndarray) -> np.ndarray:
+        bits = np.einsum("tbd,nd->ntb", self._planes, np.atleast_2d(vectors)) > 0
+        return bits.astype(np.int64) @ (np.int64(1) << np.arange(self.n_bits, dtype=np.int64))
+
+    def build(self, ids: Sequence[int], vectors: np.ndarray) -> None:
+        self._reset()
+        # ~bucket_size rows per bucket
+        n_bits = math.ceil(math.log2(max(len(ids), 1) / self.bucket_size))
+        self.n_bits = int(min(max(n_bits, 1), 24))
+        rng = np.random.default_rng(self.seed)
+        self._planes = rng.standard_normal((self.n_tables, self.n_bits, self.dim))
+        self._codes = np.empty((0, self.n_tables), dtype=np.int64)
+        self._pending = []
+        self._hash_rows(SimilarityIndex.upsert(self, ids, vectors))
+        self._merge()
+
+    def upsert(self, ids: Sequence[int], vectors: np.ndarray) -> np.ndarray:
+        rows = super().upsert(ids, vectors)
+        self._hash_rows(rows)
+        self._pending.extend(rows.tolist())
+        if len(self._pending) > max(1024, self._size // 100):
+            self._merge()
+        return rows
+
+    def _hash_rows(self, rows: np.ndarray) -> None:
+        if len(self._codes) < len(self._ids):
+            grown = np.empty((len(self._ids), self.n_tables), dtype=np.int64)
+            grown[:len(self._codes)] = self._codes
+            self._codes = grown
+        if len(rows):
+            self._codes[rows] = self._hash(self._vectors[rows])
+
+    def _merge(self) -> None:
+        """Fold pending rows into the sorted tables, leaving removed rows out"""
+        alive = self._all_rows()
+        for t in range(self.n_tables):
+            codes = self._codes[alive, t]
+            order = np.argsort(codes, kind="stable")
+            self._sorted_codes[t] = codes[order]
+            self._sorted_rows[t] = alive[order]
+        self._pending = []
+
+    def _candidates(self, vector: np.ndarray) -> np.ndarray:
+        codes = self._hash(vector)[0]
+        flips = np.concatenate([[0], np.int64(1) << np.arange(self.n_bits, dtype=np.int64)])
+        found = [np.asarray(self._pending, dtype=np.int64)]
+        total = len(self._pending)
+        # exact buckets of every table first, then the one-bit neighbours, until the budget is spent
+        for flip in flips:
+            for t in range(self.n_tables):
+                probe = codes[t] ^ flip
+                lo = np.searchsorted(self._sorted_codes[t], probe, side="left")
+                hi = min(np.searchsorted(self._sorted_codes[t], probe, side="right"), lo + self.max_candidates)
+                if hi > lo:
+                    found.append(self._sorted_rows[t][lo:hi])
+                    total += hi - lo
+            if total >= self.max_candidates:
+                break
+        rows = np.unique(np.concatenate(found))
+        return rows[self._alive[rows]]
+
+    def query(self, vector: np.ndarray, k: int, exclude: Iterable[int] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        exclude = list(exclude)
+        ids, scores = self._rank(self._candidates(vector), vector, k, exclude)
+        if len(ids) < min(k, len(self) - len(exclude)):
+            # too few candidates around the query, fall back to a full scan
+            return self._rank(self._all_rows(), vector, k, exclude)
+        return ids, scores
+
+
+# Upper bound on the score matrix materialized per block by batch_top_k
+BATCH_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def batch_top_k(
+        vectors: np.ndarray,
+        query_rows: np.ndarray,
+        k: int
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Exact top-k neighbours (excluding self) for many rows of `vectors` (unit rows).
+    Scores are computed block by block with one matrix product per block so memory
+    stays under BATCH_BLOCK_BYTES. Yields (query rows, neighbour rows, scores).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n = len(vectors)
+    k = min(k, n - 1)
+    block = max(1, BATCH_BLOCK_BYTES // max(n * vectors.itemsize, 1))
+    for start in range(0, len(query_rows), block):
+        rows = query_rows[start:start + block]
+        scores = vectors[rows] @ vectors.T
+        scores[np.arange(len(rows)), rows] = -np.inf
+        if k <= 0:
+            yield rows, np.empty((len(rows), 0), dtype=np.int64), np.empty((len(rows), 0))
+            continue
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind="stable")
+        yield rows, np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+INDEX_TYPES = {
+    "exact": ExactIndex,
+    "lsh": RandomProjectionIndex,
+}
+
+
+class IndexState:
+    """A built index plus the scaling snapshot and feature store watermark it reflects"""
+
+    def __init__(self, index: SimilarityIndex, mean: np.ndarray, std: np.ndarray,
+                 watermark: Optional[datetime], built_size: int):
+        self.index = index
+        self.mean = mean
+        self.std = std
+        self.watermark = watermark
+        self.built_size = built_size
+
+
+_state: Optional[IndexState] = None
+_lock = asyncio.Lock()
+
+# Rebuild (taking a fresh stats snapshot) once the population drifted this much since the build
+REBUILD_DRIFT = 0.1
+
+
+async def _build_state(db: AsyncSession, watermark: Optional[datetime]) -> IndexState:
+    """
+    Build from the shared feature snapshot brought up to date with the store (as of
+    `watermark`, read before), normalized with the current stats snapshot
+    """
+    from services import feature_snapshot, feature_stats
+
+    snapshot = await feature_snapshot.get_snapshot(db)
+    current = await feature_snapshot.load_current(db, snapshot)
+    stats = await feature_stats.get_snapshot(db)
+    ids, vectors = current.normalized(stats.mean, stats.std)
+    index = INDEX_TYPES[SIMILARITY_INDEX](len(stats.mean))
+    index.build(ids, vectors)
+    return IndexState(index, stats.mean, stats.std, watermark, len(ids))
+
+
+async def _sync_state(db: AsyncSession, state: IndexState, watermark: Optional[datetime]) -> IndexState:
+    """
+    Upsert the vectors recomputed since the state's watermark. Until the watermark is
+    SYNC_OVERLAP old a vector committed late may still show up with an older
+    computed_at, so the overlap is re-read even when the store version did not move;
+    rows the index already holds unchanged are skipped.
+    """
+    from services import feature_store
+
+    unsettled = state.watermark is not None and datetime.utcnow() - state.watermark < feature_store.SYNC_OVERLAP
+    if watermark != state.watermark or unsettled:
+        ids, matrix = await feature_store.load_matrix(db, since=state.watermark)
+        if len(ids):
+            vectors = normalize_rows(matrix, state.mean, state.std)
+            changed = []
+            for i, uid in enumerate(ids.tolist()):
+                current = state.index.get_vector(uid)
+                if current is None or not np.array_equal(current, vectors[i]):
+                    changed.append(i)
+            if changed:
+                state.index.upsert(ids[changed], vectors[changed])
+        state.watermark = watermark
+    return state
+
+
+async def get_index_state(db: AsyncSession) -> IndexState:
+    """
+    Return this process' index, synced with the feature store. Vectors are kept
+    fresh by feature_store.refresh_periodically, not here.
+    """
+    from services import feature_store
+
+    global _state
+    async with _lock:
+        count, watermark = await feature_store.get_store_version(db)
+
+        state = _state
+        if state is None or abs(count - state.built_size) > REBUILD_DRIFT * max(state.built_size, 1):
+            state = await _build_state(db, watermark)
+        state = await _sync_state(db, state, watermark)
+        if len(state.index) != count:
+            # Vectors were deleted since the build, start over
+            state = await _build_state(db, watermark)
+
+        _state = state
+        return state
@@ -0,0 +1,219 @@
+"""
+Speech-to-text pipeline for /api/speech-to-text.
+
+The upload is never read into memory as a whole: it stays in Starlette's
+spooled temporary file and is hashed in chunks. A transcript cached for the
+same content hash is returned without calling the backend.
+
+PCM WAV uploads are optionally preprocessed block by block (SPEECH_PREPROCESS):
+downmixed to mono, resampled to SPEECH_SAMPLE_RATE and trimmed of leading and
+trailing silence into another spooled file of 16-bit PCM. Recordings longer
+than SPEECH_SEGMENT_SECONDS are cut at the quietest point near each segment
+boundary and the segments are transcribed in parallel (at most
+SPEECH_MAX_PARALLEL in flight, so at most that many segments are in memory).
+Other formats are streamed to the backend unchanged.
+"""
+import asyncio
+import hashlib
+import io
+import tempfile
+import wave
+from typing import BinaryIO, List, Optional, Tuple
+
+import numpy as np
+from fastapi import UploadFile
+
+from app_config import (
+    SPEECH_MAX_PARALLEL, SPEECH_PREPROCESS, SPEECH_SAMPLE_RATE, SPEECH_SEGMENT_SECONDS, SPEECH_SILENCE_DBFS,
+)
+from services import llm_cache, llm_client
+
+CHUNK_BYTES = 1024 * 1024
+SPOOL_MAX_BYTES = 1024 * 1024
+# Window used for silence detection and segment cuts
+WINDOW_SECONDS = 0.02
+# Segment cuts move to the quietest window within this distance of the nominal cut
+CUT_SEARCH_SECONDS = 1.0
+# Transcripts are not user specific; they share one cache namespace
+CACHE_USER = 0
+
+
+def _hash_file(f: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    f.seek(0)
+    for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
+
+def _window_rms(samples: np.ndarray, window: int) -> np.ndarray:
+    usable = len(samples) // window * window
+    if usable == 0:
+        return np.empty(0)
+    frames = samples[:usable].reshape(-1, window).astype(np.float64)
+    return np.sqrt((frames ** 2).mean(axis=1))
+
+
+class _Resampler:
+    """Streaming linear-interpolation resampler for a mono float signal"""
+
+    def __init__(self, in_rate: int, out_rate: int):
+        self.step = in_rate / out_rate
+        self.next_pos = 0.0  # input position of the next output sample
+        self.offset = 0  # input position of tail[0]
+        self.tail = np.empty(0, dtype=np.float32)
+
+    def feed(self, samples: np.ndarray) -> np.ndarray:
+        buf = np.concatenate([self.tail, samples])
+        last = self.offset + len(buf) - 1
+        if len(buf) == 0 or self.next_pos > last:
+            self.tail = buf
+            return np.empty(0, dtype=np.float32)
+        count = int((last - self.next_pos) // self.step) + 1
+        positions = self.next_pos + self.step * np.arange(count)
+        out = np.interp(positions - self.offset, np.arange(len(buf)), buf).astype(np.float32)
+        self.next_pos = positions[-1] + self.step
+        self.tail = buf[-1:]
+        self.offset = last
+        return out
+
+
+def _read_pcm(wav: wave.Wave_read, frames: int) -> np.ndarray:
+    """Next frames of the file as mono float32 in [-1, 1]"""
+    raw = wav.readframes(frames)
+    width, channels = wav.getsampwidth(), wav.getnchannels()
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+    else:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648
+    return samples.reshape(-1, channels).mean(axis=1)
+
+
+def preprocess_wav(source: BinaryIO) -> Optional[BinaryIO]:
+    """
+    Mono / SPEECH_SAMPLE_RATE / silence-trimmed 16-bit PCM (no header) of a PCM WAV
+    file, or None when the input is not a WAV this pipeline can read.
+    """
+    try:
+        wav = wave.open(source, "rb")
+    except (wave.Error, EOFError):
+        source.seek(0)
+        return None
+    if wav.getsampwidth() not in (1, 2, 4):
+        source.seek(0)
+        return None
+
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    resampler = _Resampler(wav.getframerate(), SPEECH_SAMPLE_RATE)
+    window = max(1, int(SPEECH_SAMPLE_RATE * WINDOW_SECONDS))
+    threshold = 10 ** (SPEECH_SILENCE_DBFS / 20)
+    block_frames = max(1, CHUNK_BYTES // (wav.getsampwidth() * wav.getnchannels()))
+
+    started = False
+    written = 0
+    last_voiced = 0  # bytes written up to the end of the last voiced window
+    pending = np.empty(0, dtype=np.float32)
+    while True:
+        samples = _read_pcm(wav, block_frames)
+        done = len(samples) == 0
+        pending = np.concatenate([pending, resampler.feed(samples)])
+        usable = len(pending) if done else len(pending) // window * window
+        block, pending = pending[:usable], pending[usable:]
+
+        rms = _window_rms(block, window)
+        voiced = np.flatnonzero(rms >= threshold)
+        if not started:
+            if len(voiced) == 0:
+                block = block[:0]
+            else:
+                # Drop leading silence
+                started = True
+                block, voiced = block[voiced[0] * window:], voiced - voiced[0]
+        if len(block):
+            if len(voiced):
+                last_voiced = written + int(voiced[-1] + 1) * window * 2
+            out.write((np.clip(block, -1, 1) * 32767).astype("<i2").tobytes())
+            written += len(block) * 2
+        if done:
+            break
+
+    # Drop trailing silence
+    out.truncate(last_voiced)
+    out.seek(0)
+    return out
+
+
+def _segment_bounds(pcm: BinaryIO) -> List[Tuple[int, int]]:
+    """Byte ranges of the segments, cut at the quietest window near each nominal cut"""
+    pcm.seek(0, io.SEEK_END)
+    total = pcm.tell()
+    segment = int(SPEECH_SEGMENT_SECONDS * SPEECH_SAMPLE_RATE) * 2
+    window = max(1, int(SPEECH_SAMPLE_RATE * WINDOW_SECONDS))
+    search = int(CUT_SEARCH_SECONDS * SPEECH_SAMPLE_RATE) * 2
+
+    cuts = [0]
+    while total - cuts[-1] > segment:
+        nominal = cuts[-1] + segment
+        start = max(cuts[-1] + 2, nominal - search)
+        pcm.seek(start)
+        samples = np.frombuffer(pcm.read(min(total, nominal + search) - start), dtype="<i2")
+        rms = _window_rms(samples, window)
+        cut = start + int(np.argmin(rms)) * window * 2 if len(rms) else nominal
+        cuts.append(cut)
+    cuts.append(total)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def _wav_bytes(pcm: BinaryIO, start: int, end: int) -> bytes:
+    pcm.seek(start)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(SPEECH_SAMPLE_RATE)
+        out.writeframes(pcm.read(end - start))
+    return buf.getvalue()
+
+
+async def _transcribe_segments(pcm: BinaryIO) -> str:
+    bounds = [(start, end) for start, end in await asyncio.to_thread(_segment_bounds, pcm) if end > start]
+    limit = asyncio.Semaphore(SPEECH_MAX_PARALLEL)
+    file_lock = asyncio.Lock()
+
+    async def transcribe(start: int, end: int) -> str:
+        async with limit:
+            async with file_lock:
+                audio = await asyncio.to_thread(_wav_bytes, pcm, start, end)
+            return await llm_client.transcribe(audio, filename="segment.wav")
+
+    texts = await asyncio.gather(*(transcribe(start, end) for start, end in bounds))
+    return " ".join(text.strip() for text in texts if text and text.strip())
+
+
+async def transcribe_upload(upload: UploadFile) -> str:
+    """Transcript of an uploaded recording, from the cache when the same content was seen"""
+    source = upload.file
+    digest = llm_cache.fingerprint(
+        await asyncio.to_thread(_hash_file, source),
+        SPEECH_PREPROCESS, SPEECH_SAMPLE_RATE, SPEECH_SEGMENT_SECONDS, SPEECH_SILENCE_DBFS,
+    )
+    cached = await llm_cache.lookup("transcription", CACHE_USER, digest)
+    if cached is not None:
+        return cached["text"]
+
+    pcm = await asyncio.to_thread(preprocess_wav, source) if SPEECH_PREPROCESS else None
+    if pcm is not None:
+        with pcm:
+            text = await _transcribe_segments(pcm)
+    else:
+        text = await llm_client.transcribe(
+            source,
+            filename=upload.filename or "audio.wav",
+            content_type=upload.content_type or "audio/wav",
+        )
+
+    await llm_cache.store("transcription", CACHE_USER, digest, {"text": text})
+    return text
@@ -0,0 +1,124 @@
+"""
+Per-request SQL statistics and N+1 detection, opt-in with SQL_DEBUG.
+
+Engine events count the statements of the HTTP request being served, their
+total time and how often each SELECT shape (the SQL with literals and IN-lists
+collapsed) was issued. A request issuing more than SQL_REPEAT_LIMIT SELECTs of
+one shape, typically one query per row of an earlier result, is logged in
+"warn" mode and fails in "raise" mode (tests). Writes are only counted: an ORM
+flush may legitimately send one INSERT per row (SQLite with RETURNING).
+Responses carry an `X-SQL-Stats` header with the summary.
+"""
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import event
+
+from app_config import SQL_DEBUG, SQL_REPEAT_LIMIT
+
+logger = logging.getLogger(__name__)
+
+ENABLED = SQL_DEBUG in ("warn", "raise")
+HEADER = "X-SQL-Stats"
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\$\d+|%\(\w+\)s|:\w+|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+class RepeatedQueriesError(RuntimeError):
+    """A request issued more than SQL_REPEAT_LIMIT queries of the same shape"""
+
+
+class RequestQueries:
+    __slots__ = ("queries", "seconds", "shapes", "reported")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.shapes: Counter = Counter()
+        self.reported = False
+
+    def most_repeated(self):
+        """(shape, count) of the most frequent SELECT shape, or (None, 0)"""
+        return self.shapes.most_common(1)[0] if self.shapes else (None, 0)
+
+    def summary(self) -> str:
+        return f"queries={self.queries}; db_ms={self.seconds * 1000:.2f}; max_repeat={self.most_repeated()[1]}"
+
+
+current: contextvars.ContextVar[Optional[RequestQueries]] = contextvars.ContextVar("sql_debug_request", default=None)
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with literals and parameters replaced by ? and IN-lists collapsed"""
+    shape = _LITERALS.sub("?", statement)
+    shape = _LISTS.sub("(?)", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+def instrument_engine(engine) -> None:
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if current.get() is not None:
+            conn.info.setdefault("sql_debug_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stats = current.get()
+        started = conn.info.get("sql_debug_started")
+        if stats is None or not started:
+            return
+        stats.queries += 1
+        stats.seconds += time.perf_counter() - started.pop()
+        if statement.lstrip()[:4].upper() in ("SELE", "WITH"):
+            stats.shapes[statement_shape(statement)] += 1
+
+
+def check(stats: RequestQueries, method: str, path: str) -> None:
+    """Log (or raise, in "raise" mode) when one SELECT shape was issued more than SQL_REPEAT_LIMIT times"""
+    shape, count = stats.most_repeated()
+    if stats.reported or count <= SQL_REPEAT_LIMIT:
+        return
+    stats.reported = True
+    message = f"{method} {path} issued {count} queries like: {shape[:300]}"
+    if SQL_DEBUG == "raise":
+        raise RepeatedQueriesError(message)
+    logger.warning("%s (%s)", message, stats.summary())
+
+
+class SQLDebugMiddleware:
+    """ASGI middleware collecting the SQL statistics of each request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestQueries()
+        method, path = scope["method"], scope["path"]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                check(stats, method, path)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (HEADER.lower().encode(), stats.summary().encode())
+                ]
+            await send(message)
+
+        token = current.set(stats)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current.reset(token)
+        # Statements issued while a streaming body was sent
+        check(stats, method, path)
+        logger.debug("%s %s: %s", method, path, stats.summary())
@@ -0,0 +1,174 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func, case, extract
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import User, BankAccount, FinancialTransaction, FinancialAim, FinancialTransactionType
+
+
+# Order of the features in every similarity vector (and in the feature store)
+FEATURE_NAMES = [
+    # Account metrics
+    'total_balance', 'num_accounts', 'avg_account_age_days',
+    # Transaction metrics
+    'total_transactions', 'total_deposit', 'total_withdrawal',
+    'avg_transaction_amount', 'transaction_frequency',  # transactions per day
+    # Financial aims metrics
+    'num_aims', 'total_target_amount', 'total_current_amount',
+    'completion_rate', 'avg_aim_progress', 'num_completed_aims',
+    # Behavioral patterns
+    'savings_rate',  # current_amount / target_amount
+    'net_flow'  # deposits - withdrawals
+]
+_COUNT_FEATURES = ('num_accounts', 'total_transactions', 'num_aims', 'num_completed_aims')
+
+
+class UserFinancialProfile:
+    """
+    Financial profile of a user, backed by one row of a feature matrix (no per-field
+    attributes), so profiles read from a snapshot are views into the shared array.
+    Every name in FEATURE_NAMES is available as an attribute.
+    """
+
+    __slots__ = ('user_id', 'values')
+
+    def __init__(self, user_id: int, values: Optional[np.ndarray] = None, **features):
+        self.user_id = int(user_id)
+        if values is None:
+            values = np.array([features[name] for name in FEATURE_NAMES], dtype=float)
+        self.values = values
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'user_id': self.user_id, **{name: getattr(self, name) for name in FEATURE_NAMES}}
+
+    def __repr__(self) -> str:
+        return f"UserFinancialProfile({self.to_dict()})"
+
+
+def _feature_property(index: int, cast):
+    return property(lambda self: cast(self.values[index]))
+
+
+for _index, _name in enumerate(FEATURE_NAMES):
+    setattr(UserFinancialProfile, _name, _feature_property(_index, int if _name in _COUNT_FEATURES else float))
+
+
+def profile_to_vector(profile: UserFinancialProfile) -> np.ndarray:
+    """Convert user profile to feature vector for similarity calculation"""
+    return np.asarray(profile.values, dtype=float)
+
+
+def _scatter(index: np.ndarray, rows, width: int) -> np.ndarray:
+    """Place grouped (user_id, *values) rows into a (len(index), width) matrix aligned with index"""
+    out = np.zeros((len(index), width), dtype=float)
+    if not rows:
+        return out
+    positions = np.searchsorted(index, np.array([r[0] for r in rows], dtype=np.int64))
+    out[positions] = np.array([[v or 0 for v in r[1:]] for r in rows], dtype=float)
+    return out
+
+
+async def compute_feature_matrix(
+        db: AsyncSession,
+        user_ids: Optional[Sequence[int]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the feature vectors of many users with one grouped query per table.
+    Returns (sorted user ids, matrix) where matrix columns follow FEATURE_NAMES.
+    """
+    users_query = select(User.id).order_by(User.id)
+    if user_ids is not None:
+        users_query = users_query.where(User.id.in_(list(user_ids)))
+    ids = np.array((await db.execute(users_query)).scalars().all(), dtype=np.int64)
+    if len(ids) == 0:
+        return ids, np.zeros((0, len(FEATURE_NAMES)))
+
+    def restrict(query, column):
+        return query.where(column.in_(ids.tolist())) if user_ids is not None else query
+
+    # Account metrics
+    account_query = restrict(select(
+        BankAccount.user_id,
+        func.count(BankAccount.id),
+        func.sum(BankAccount.balance),
+        func.avg(extract('epoch', BankAccount.created_at)),
+    ), BankAccount.user_id).group_by(BankAccount.user_id)
+    rows = (await db.execute(account_query)).all()
+    accounts = _scatter(ids, rows, 3)
+
+    # Transaction metrics
+    transaction_query = restrict(select(
+        BankAccount.user_id,
+        func.count(FinancialTransaction.id),
+        func.sum(case(
+            (FinancialTransaction.transaction_type == FinancialTransactionType.DEPOSIT,
+             FinancialTransaction.amount),
+            else_=0
+        )),
+        func.sum(case(
+            (FinancialTransaction.transaction_type == FinancialTransactionType.WITHDRAWAL,
+             FinancialTransaction.amount),
+            else_=0
+        )),
+        func.avg(FinancialTransaction.amount),
+        func.min(FinancialTransaction.created_at),
+    ).join(BankAccount), BankAccount.user_id).group_by(BankAccount.user_id)
+    rows = (await db.execute(transaction_query)).all()
+    now = datetime.now()
+    # replace the first transaction date with the number of active days (at least one)
+    rows = [(*r[:5], ((now - r[5]).days or 1) if r[5] else 1) for r in rows]
+    transactions = _scatter(ids, rows, 5)
+
+    # Financial aims metrics
+    aims_query = restrict(select(
+        FinancialAim.user_id,
+        func.count(FinancialAim.id),
+        func.sum(FinancialAim.target_amount),
+        func.sum(FinancialAim.current_amount),
+        func.sum(case((FinancialAim.is_completed == True, 1), else_=0)),
+        func.avg(case(
+            (FinancialAim.target_amount != 0, FinancialAim.current_amount / FinancialAim.target_amount * 100),
+            else_=0
+        )),
+    ), FinancialAim.user_id).group_by(FinancialAim.user_id)
+    rows = (await db.execute(aims_query)).all()
+    aims = _scatter(ids, rows, 5)
+
+    num_accounts, total_balance, avg_created_epoch = accounts.T
+    total_transactions, total_deposit, total_withdrawal, avg_transaction, days_active = transactions.T
+    num_aims, total_target, total_current, num_completed, avg_progress = aims.T
+
+    # Calculate derived metrics
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_account_age = np.where(num_accounts > 0, (now.timestamp() - avg_created_epoch) / 86400, 0)
+        transaction_frequency = np.where(total_transactions > 0, total_transactions / days_active, 0)
+        completion_rate = np.where(num_aims > 0, num_completed / num_aims * 100, 0)
+        savings_rate = np.where(total_target > 0, total_current / total_target * 100, 0)
+    net_flow = total_deposit - total_withdrawal
+
+    matrix = np.column_stack([
+        total_balance, num_accounts, avg_account_age,
+        total_transactions, total_deposit, total_withdrawal,
+        avg_transaction, transaction_frequency,
+        num_aims, total_target, total_current,
+        completion_rate, avg_progress, num_completed,
+        savings_rate, net_flow,
+    ])
+    return ids, matrix
+
+
+def vector_to_profile(user_id: int, vector: np.ndarray) -> UserFinancialProfile:
+    """Inverse of profile_to_vector (no copy)"""
+    return UserFinancialProfile(user_id, values=vector)
+
+
+async def get_user_profiles(
+        db: AsyncSession,
+        user_ids: Optional[Sequence[int]] = None
+) -> List[UserFinancialProfile]:
+    """Financial profiles of user_ids (all users if None) using a constant number of queries"""
+    ids, matrix = await compute_feature_matrix(db, user_ids)
+    return [vector_to_profile(uid, row) for uid, row in zip(ids, matrix)]
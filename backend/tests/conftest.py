@@ -0,0 +1,51 @@
+"""
+Tests run against a throwaway SQLite database (aiosqlite) created from the models.
+
+    cd backend
+    python -m pytest -q
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="zaman_tests_")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("FEATURE_SNAPSHOT_DIR", os.path.join(_db_dir, "feature_snapshots"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+from database import Base, engine  # noqa: E402
+from main import app  # noqa: E402
+
+_users = itertools.count(1)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def client():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+        yield c
+    # Pooled connections belong to this test's event loop
+    await engine.dispose()
+
+
+@pytest.fixture
+async def headers(client):
+    """Authorization headers of a new user (bank account balance 1000)"""
+    n = next(_users)
+    response = await client.post(
+        "/auth/signup", json={"iin": f"{n:012d}", "email": f"user{n}@example.com", "password": "pw"}
+    )
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
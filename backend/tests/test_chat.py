@@ -0,0 +1,39 @@
+import json
+
+from chat import ResponseFieldStream
+
+ANSWER = json.dumps({
+    "stage": "plan",
+    "response": 'Отложите "20%" \\ месяц:\n\t1) 50 000 ₸ / é 🚗',
+    "goal_cost": 500000,
+})
+
+
+def decode(chunks):
+    stream = ResponseFieldStream()
+    return "".join(stream.feed(chunk) for chunk in chunks), stream
+
+
+def test_escapes_are_decoded():
+    text, stream = decode([ANSWER])
+
+    assert text == json.loads(ANSWER)["response"]
+    assert stream.done
+
+
+def test_every_chunk_boundary_gives_the_same_text():
+    expected = json.loads(ANSWER)["response"]
+    for cut in range(len(ANSWER) + 1):
+        assert decode([ANSWER[:cut], ANSWER[cut:]])[0] == expected, cut
+    # One character at a time: escapes and surrogate pairs split across many chunks
+    assert decode(ANSWER)[0] == expected
+
+
+def test_nothing_is_emitted_before_the_key_or_after_the_string():
+    stream = ResponseFieldStream()
+
+    assert stream.feed('{"stage": "plan", "resp') == ""
+    assert stream.feed('onse": "Hi') == "Hi"
+    assert stream.feed('\\') == ""
+    assert stream.feed('u0021", "next": "more"}') == "!"
+    assert stream.feed(' trailing "text"') == ""
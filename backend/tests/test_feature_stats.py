@@ -0,0 +1,119 @@
+import itertools
+
+import numpy as np
+import pytest
+from sqlalchemy.future import select
+
+from database import async_session
+from models import FeatureStats, User, UserFeatureVector
+from services import feature_stats
+from services.feature_stats import RunningStats
+from services.user_similiarity import FEATURE_NAMES
+
+pytestmark = pytest.mark.anyio
+
+_users = itertools.count(900000000001)
+
+
+def assert_stats(stats, matrix):
+    expected = RunningStats.from_matrix(matrix)
+    assert stats.count == expected.count
+    np.testing.assert_allclose(stats.mean, expected.mean)
+    np.testing.assert_allclose(stats.m2, expected.m2, atol=1e-6)
+
+
+def test_merge_matches_stats_of_the_union():
+    rng = np.random.default_rng(0)
+    a, b = rng.normal(5, 2, (40, 3)), rng.normal(-1, 7, (25, 3))
+
+    assert_stats(RunningStats.from_matrix(a).merge(RunningStats.from_matrix(b)), np.vstack([a, b]))
+    assert_stats(RunningStats.empty(3).merge(RunningStats.from_matrix(b)), b)
+
+
+def test_subtract_undoes_merge():
+    rng = np.random.default_rng(1)
+    a, b = rng.normal(5, 2, (40, 3)), rng.normal(-1, 7, (25, 3))
+    both = RunningStats.from_matrix(np.vstack([a, b]))
+
+    assert_stats(both.subtract(RunningStats.from_matrix(b)), a)
+    assert both.subtract(both).count == 0
+    # Replacing rows: subtract the old versions, merge the new ones
+    replaced = both.subtract(RunningStats.from_matrix(b[:5])).merge(RunningStats.from_matrix(b[:5] * 3))
+    assert_stats(replaced, np.vstack([a, b[5:], b[:5] * 3]))
+
+
+def test_std_treats_constant_features_like_standard_scaler():
+    stats = RunningStats.from_matrix(np.array([[1.0, 2.0], [1.0, 4.0]]))
+    np.testing.assert_allclose(stats.std, [1.0, 1.0])
+    np.testing.assert_allclose(RunningStats.empty(2).std, [1.0, 1.0])
+
+
+async def add_vectors(rows):
+    async with async_session() as db:
+        for row in rows:
+            n = next(_users)
+            user = User(iin=str(n), email=f"stats{n}@example.com", hashed_password="x")
+            db.add(user)
+            await db.flush()
+            db.add(UserFeatureVector(user_id=user.id, **dict(zip(FEATURE_NAMES, map(float, row)))))
+        await db.commit()
+
+
+async def stored_matrix():
+    columns = [getattr(UserFeatureVector, name) for name in FEATURE_NAMES]
+    async with async_session() as db:
+        return np.array((await db.execute(select(*columns))).all(), dtype=float)
+
+
+async def test_reservoir_sample_is_bounded_and_exact_when_it_fits(client):
+    await add_vectors(np.random.default_rng(2).normal(10, 3, (30, len(FEATURE_NAMES))))
+    matrix = await stored_matrix()
+
+    async with async_session() as db:
+        exact, population = await feature_stats._scan(db, None)
+        everything, _ = await feature_stats._scan(db, len(matrix) + 5, seed=0)
+        sampled, _ = await feature_stats._scan(db, 10, seed=0)
+        again, _ = await feature_stats._scan(db, 10, seed=0)
+
+    assert population == len(matrix)
+    assert_stats(exact, matrix)
+    assert_stats(everything, matrix)
+    assert sampled.count == 10
+    assert np.all((sampled.mean >= matrix.min(axis=0)) & (sampled.mean <= matrix.max(axis=0)))
+    np.testing.assert_array_equal(sampled.mean, again.mean)
+
+
+async def test_periodic_full_rebuild_sheds_drift(client):
+    await add_vectors(np.random.default_rng(3).normal(0, 1, (10, len(FEATURE_NAMES))))
+    async with async_session() as db:
+        row = await feature_stats.rebuild_stats(db)
+        # Rounding drift accumulated over many incremental updates, one update before the rebuild
+        row.mean = (np.asarray(row.mean) + 1.0).tolist()
+        row.version = feature_stats.FULL_REBUILD_EVERY - 1
+        await db.commit()
+
+        empty = np.empty((0, len(FEATURE_NAMES)))
+        await feature_stats.apply_update(db, empty, empty)
+        await db.commit()
+        row = (await db.execute(select(FeatureStats))).scalar_one()
+
+    assert_stats(RunningStats(row.count, row.mean, row.m2), await stored_matrix())
+
+
+async def test_sampled_stats_are_redrawn_once_the_population_drifts(client):
+    await add_vectors(np.random.default_rng(4).normal(0, 1, (20, len(FEATURE_NAMES))))
+    async with async_session() as db:
+        row = await feature_stats.rebuild_stats(db, sample_size=5)
+        version, population = row.version, row.population
+        await db.commit()
+
+        rows = np.ones((1, len(FEATURE_NAMES)))
+        row = await feature_stats.apply_update(db, np.empty((0, len(FEATURE_NAMES))), rows)
+        assert (row.version, row.population) == (version, population + 1)
+
+        # The population grew by more than REBUILD_DRIFT since the sample was drawn
+        row.population = row.sampled_population = 1
+        row = await feature_stats.apply_update(db, np.empty((0, len(FEATURE_NAMES))), rows)
+        assert row.version == version + 1
+        assert row.sampled_population == population
+        await db.commit()
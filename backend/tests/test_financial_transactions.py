@@ -0,0 +1,89 @@
+import pytest
+from sqlalchemy import event
+
+from database import engine
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_aim(client, headers, title="Car", target_amount=500):
+    response = await client.post(
+        "/financial-aims/", json={"title": title, "target_amount": target_amount}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+async def balances(client, headers):
+    """(bank account balance, {aim id: current amount}) as the user and aim endpoints report them"""
+    me = await client.get("/users/me", headers=headers)
+    aims = await client.get("/financial-aims/", headers=headers)
+    assert me.status_code == 200 and aims.status_code == 200
+    return me.json()["bank_account"]["balance"], {aim["id"]: aim["current_amount"] for aim in aims.json()}
+
+
+async def test_batch_applies_transfers_in_order(client, headers):
+    car, trip = await create_aim(client, headers), await create_aim(client, headers, "Trip")
+    transfers = [
+        {"aim_id": trip, "amount": 50, "transaction_type": "deposit"},
+        {"aim_id": car, "amount": 20, "transaction_type": "deposit"},
+        {"aim_id": trip, "amount": 10, "transaction_type": "withdrawal"},
+    ]
+
+    response = await client.post("/financial-transaction/batch", json={"transactions": transfers}, headers=headers)
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert [(t["aim_id"], t["amount"], t["transaction_type"]) for t in body["transactions"]] == [
+        (t["aim_id"], t["amount"], t["transaction_type"]) for t in transfers
+    ]
+    ids = [t["id"] for t in body["transactions"]]
+    assert ids == sorted(ids)
+    assert body["bank_account_balance"] == 940
+    assert {aim["id"]: aim["current_amount"] for aim in body["aims"]} == {car: 20, trip: 40}
+    assert await balances(client, headers) == (940, {car: 20, trip: 40})
+
+
+async def test_failing_transfer_rolls_back_the_whole_batch(client, headers):
+    car = await create_aim(client, headers)
+    transfers = [
+        {"aim_id": car, "amount": 100, "transaction_type": "deposit"},
+        {"aim_id": car, "amount": 500, "transaction_type": "withdrawal"},
+    ]
+
+    response = await client.post("/financial-transaction/batch", json={"transactions": transfers}, headers=headers)
+
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Transaction 1: ")
+    assert (await client.get("/financial-transaction/", headers=headers)).json() == []
+    assert await balances(client, headers) == (1000, {car: 0})
+
+
+async def test_batch_checks_the_ledger_without_writing_balance_columns(client, headers):
+    first, second = await create_aim(client, headers), await create_aim(client, headers, "Trip")
+    transfers = [{"aim_id": aim_id, "amount": 1, "transaction_type": "deposit"} for aim_id in (second, first)]
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def commit(conn):
+        statements.append("COMMIT")
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    event.listen(engine.sync_engine, "commit", commit)
+    try:
+        response = await client.post("/financial-transaction/batch", json={"transactions": transfers}, headers=headers)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+        event.remove(engine.sync_engine, "commit", commit)
+
+    assert response.status_code == 200, response.text
+    begin = statements.index("BEGIN IMMEDIATE")
+    end = statements.index("COMMIT", begin)
+    transfer = statements[begin:end]
+    assert any(s.startswith("INSERT INTO ledger_postings") for s in transfer)
+    assert not any(s.startswith(("UPDATE bankaccounts", "UPDATE financial_aims")) for s in transfer)
+    # The cached columns are refreshed after the transfer committed
+    assert any(s.startswith("UPDATE bankaccounts") for s in statements[end:])
+    assert await balances(client, headers) == (998, {first: 1, second: 1})
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from services import llm_client
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Replaces the proxy: calls block until `release` is set and answer with their last message"""
+    calls = []
+    release = asyncio.Event()
+
+    async def post(path, json=None, timeout=None):
+        calls.append(json)
+        await release.wait()
+        return {"choices": [{"message": {"content": json["messages"][-1]["content"]}}]}
+
+    monkeypatch.setattr(llm_client, "post", post)
+    monkeypatch.setattr(llm_client, "_inflight", {})
+    monkeypatch.setattr(llm_client, "_stats", {"requests": 0, "coalesced": 0, "upstream": 0})
+    return calls, release
+
+
+def ask(content):
+    return asyncio.ensure_future(llm_client.chat_completion([{"role": "user", "content": content}]))
+
+
+async def settle():
+    """Let the callers and the upstream calls they started run up to `release`"""
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+async def test_identical_requests_share_one_upstream_call(upstream):
+    calls, release = upstream
+    # Whitespace differences normalize to the same key; a different text does not
+    callers = [ask("How much  can I save?"), ask(" How much can I save? "), ask("What did I spend?")]
+    await settle()
+    assert len(calls) == 2
+
+    release.set()
+    answers = await asyncio.gather(*callers)
+
+    assert answers == ["How much  can I save?", "How much  can I save?", "What did I spend?"]
+    stats = llm_client.get_stats()
+    assert (stats["requests"], stats["coalesced"], stats["upstream"], stats["in_flight"]) == (3, 1, 2, 0)
+    # Once finished, the same request goes upstream again
+    assert await ask("What did I spend?") == "What did I spend?"
+    assert len(calls) == 3
+
+
+async def test_a_cancelled_caller_does_not_cancel_the_shared_call(upstream):
+    calls, release = upstream
+    first, second = ask("Plan my budget"), ask("Plan my budget")
+    await settle()
+    assert len(calls) == 1
+
+    first.cancel()
+    await settle()
+    assert llm_client.get_stats()["in_flight"] == 1
+    release.set()
+
+    assert await second == "Plan my budget"
+    assert first.cancelled()
+
+
+async def test_every_caller_sees_the_upstream_error(upstream, monkeypatch):
+    calls, release = upstream
+
+    async def post(path, json=None, timeout=None):
+        calls.append(json)
+        await release.wait()
+        raise llm_client.LLMError("AI service unavailable")
+
+    monkeypatch.setattr(llm_client, "post", post)
+    callers = [ask("Plan my budget"), ask("Plan my budget")]
+    await settle()
+    release.set()
+
+    results = await asyncio.gather(*callers, return_exceptions=True)
+
+    assert [type(r) for r in results] == [llm_client.LLMError, llm_client.LLMError]
+    assert len(calls) == 1
+    assert llm_client.get_stats()["in_flight"] == 0
@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy.future import select
+
+from database import async_session
+from models import TransactionRollup
+from services import rollups
+
+pytestmark = pytest.mark.anyio
+
+
+async def rollup_rows(db, user_id):
+    result = await db.execute(
+        select(TransactionRollup.source, TransactionRollup.month, TransactionRollup.transaction_type,
+               TransactionRollup.category, TransactionRollup.count, TransactionRollup.total)
+        .where(TransactionRollup.user_id == user_id, TransactionRollup.count != 0)
+    )
+    return {row[:4]: (row[4], round(row[5], 6)) for row in result.all()}
+
+
+async def rebuilt_rows(user_id):
+    """The user's rollups as a full rebuild computes them; the rebuild is rolled back"""
+    async with async_session() as db:
+        await rollups.rebuild(db)
+        rows = await rollup_rows(db, user_id)
+        await db.rollback()
+    return rows
+
+
+async def test_rollups_match_a_rebuild_after_inserts_and_deletes(client, headers):
+    user_id = (await client.get("/users/me", headers=headers)).json()["id"]
+    response = await client.post("/transactions/generate", json={"user_id": user_id, "count": 30})
+    assert response.status_code == 200, response.text
+
+    aims = []
+    for title in ("Car", "Trip"):
+        response = await client.post("/financial-aims/", json={"title": title, "target_amount": 500}, headers=headers)
+        assert response.status_code == 200, response.text
+        aims.append(response.json()["id"])
+    car, trip = aims
+    transfers = [
+        {"aim_id": car, "amount": 120, "transaction_type": "deposit"},
+        {"aim_id": trip, "amount": 80, "transaction_type": "deposit"},
+        {"aim_id": car, "amount": 20, "transaction_type": "withdrawal"},
+    ]
+    response = await client.post("/financial-transaction/batch", json={"transactions": transfers}, headers=headers)
+    assert response.status_code == 200, response.text
+
+    async with async_session() as db:
+        inserted = await rollup_rows(db, user_id)
+    assert sum(count for count, _ in inserted.values()) == 33
+    assert inserted == await rebuilt_rows(user_id)
+
+    response = await client.delete(f"/financial-aims/{car}", headers=headers)
+    assert response.status_code == 204, response.text
+
+    async with async_session() as db:
+        assert await rollup_rows(db, user_id) == await rebuilt_rows(user_id)
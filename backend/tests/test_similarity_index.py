@@ -0,0 +1,103 @@
+import numpy as np
+
+from services.similarity_index import (
+    ExactIndex, RandomProjectionIndex, batch_top_k, normalize_rows, top_k
+)
+
+
+def unit_rows(n, dim=16, seed=0):
+    rows = np.random.default_rng(seed).normal(size=(n, dim))
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_top_k_returns_the_best_positions_best_first():
+    scores = np.array([0.1, 0.9, -0.5, 0.7, 0.9, 0.3])
+
+    assert top_k(scores, 3).tolist() == [1, 4, 3]
+    assert top_k(scores, 10).tolist() == [1, 4, 3, 5, 0, 2]
+    assert top_k(scores, 0).tolist() == []
+    assert top_k(np.empty(0), 3).tolist() == []
+
+
+def test_normalize_rows_gives_unit_rows():
+    matrix = np.array([[1.0, 2.0], [3.0, 6.0], [1.0, 2.0]])
+    rows = normalize_rows(matrix, matrix.mean(axis=0), matrix.std(axis=0))
+
+    np.testing.assert_allclose(np.linalg.norm(rows, axis=1), 1.0)
+    np.testing.assert_array_equal(normalize_rows(np.zeros((1, 2)), np.zeros(2), np.ones(2)), [[0.0, 0.0]])
+
+
+def test_exact_index_matches_brute_force_and_follows_upserts():
+    vectors = unit_rows(200)
+    ids = np.arange(1000, 1200)
+    index = ExactIndex(vectors.shape[1])
+    index.build(ids, vectors)
+
+    query = vectors[7]
+    found, scores = index.query(query, 5, exclude=[1007])
+    expected = top_k(vectors @ query, 6)[1:]
+    assert found.tolist() == ids[expected].tolist()
+    np.testing.assert_allclose(scores, (vectors @ query)[expected])
+
+    index.upsert([1050], [query])
+    index.remove([1100])
+    found, scores = index.query(query, 3, exclude=[1007])
+    assert found[0] == 1050 and np.isclose(scores[0], 1.0)
+    assert 1100 not in index.query(query, 200)[0]
+    assert len(index) == 199
+
+
+def test_random_projection_recall_against_the_exact_index():
+    vectors = unit_rows(5000, seed=1)
+    ids = np.arange(5000)
+    exact, lsh = ExactIndex(16), RandomProjectionIndex(16, seed=0)
+    exact.build(ids, vectors)
+    lsh.build(ids, vectors)
+
+    hits = 0
+    queries = range(0, 5000, 50)
+    for q in queries:
+        truth = set(exact.query(vectors[q], 10, exclude=[q])[0].tolist())
+        found = lsh.query(vectors[q], 10, exclude=[q])[0]
+        assert len(found) == 10
+        hits += len(truth & set(found.tolist()))
+    assert hits / (10 * len(queries)) >= 0.9
+
+
+def test_random_projection_falls_back_to_a_full_scan():
+    vectors = unit_rows(3000, seed=2)
+    # Tiny buckets and candidate budget: the probes cannot find k rows on their own
+    index = RandomProjectionIndex(16, n_tables=1, bucket_size=1, max_candidates=1, seed=0)
+    index.build(np.arange(3000), vectors)
+
+    found, scores = index.query(vectors[0], 50, exclude=[0])
+
+    expected = top_k(vectors @ vectors[0], 51)[1:]
+    assert found.tolist() == expected.tolist()
+    np.testing.assert_allclose(scores, (vectors @ vectors[0])[expected])
+
+
+def test_random_projection_sees_pending_upserts():
+    vectors = unit_rows(2000, seed=3)
+    index = RandomProjectionIndex(16, seed=0)
+    index.build(np.arange(2000), vectors)
+    new = -vectors[5]
+
+    index.upsert([5000], [new])
+
+    assert index.query(new, 1)[0].tolist() == [5000]
+
+
+def test_batch_top_k_matches_per_row_queries():
+    vectors = unit_rows(300, seed=4).astype(np.float32)
+    rows = np.array([0, 17, 299])
+
+    blocks = list(batch_top_k(vectors, rows, 4))
+
+    got_rows = np.concatenate([b[0] for b in blocks])
+    neighbours = np.concatenate([b[1] for b in blocks])
+    assert got_rows.tolist() == rows.tolist()
+    for row, found in zip(rows, neighbours):
+        scores = vectors @ vectors[row]
+        scores[row] = -np.inf
+        assert found.tolist() == top_k(scores, 4).tolist()
@@ -0,0 +1,72 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from database import async_session
+from models import Transaction, TransactionType
+from routes.transaction import _decode_cursor, _encode_cursor
+
+pytestmark = pytest.mark.anyio
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 2, 29, 23, 59, 59, 123456)
+
+    assert _decode_cursor(_encode_cursor(created_at, 42)) == (created_at, 42)
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor("not a cursor")
+    assert error.value.status_code == 400
+
+
+async def add_transactions(client, headers):
+    """Seven transactions, five of them sharing one created_at; their ids in keyset order"""
+    user_id = (await client.get("/users/me", headers=headers)).json()["id"]
+    tie = datetime(2024, 5, 1, 12, 0, 0)
+    moments = [tie + timedelta(hours=1)] + [tie] * 5 + [tie - timedelta(hours=1)]
+    async with async_session() as db:
+        rows = [
+            Transaction(user_id=user_id, amount=i + 1, description="Groceries",
+                        transaction_type=TransactionType.WITHDRAWAL, created_at=moment)
+            for i, moment in enumerate(moments)
+        ]
+        db.add_all(rows)
+        await db.commit()
+        return [row.id for row in sorted(rows, key=lambda row: (row.created_at, row.id), reverse=True)]
+
+
+async def test_pages_follow_the_cursor_through_ties(client, headers):
+    expected = await add_transactions(client, headers)
+
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/transactions/", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        pages.append([t["id"] for t in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    assert sum(pages, []) == expected
+
+
+async def test_stream_continues_from_a_cursor(client, headers):
+    expected = await add_transactions(client, headers)
+    first = await client.get("/transactions/", params={"limit": 3}, headers=headers)
+
+    response = await client.get(
+        "/transactions/", params={"stream": "true", "cursor": first.headers["X-Next-Cursor"]}, headers=headers
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == expected[3:]
+
+
+async def test_invalid_cursor_is_rejected(client, headers):
+    response = await client.get("/transactions/", params={"limit": 2, "cursor": "bogus"}, headers=headers)
+
+    assert response.status_code == 400